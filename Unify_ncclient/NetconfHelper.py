@@ -17,6 +17,7 @@
 
 
 import sys, os, warnings
+import threading
 import ncclient
 from ncclient import manager
 
@@ -40,11 +41,28 @@ class RPCError(Exception):
     def __str__(self):
         return repr(self.value)
 
+
+#rpc-reply parsers are reused, but lxml parsers must not be shared between 
+#threads, so every thread gets its own
+_parsers = threading.local()
+
+def _get_reply_parser():
+    parser = getattr(_parsers, 'parser', None)
+    if parser is None:
+        #CREATE A PARSER THAT GIVES A SHIT FOR NAMESPACE
+        parser = etree.XMLParser(ns_clean=True)
+        _parsers.parser = parser
+    return parser
+
 class NetconfHelper:
     """
     This class is devoted to provide netconf specific callback functions and
     covering the background of how the netconf agent and the client work
     """
+
+    #rpcs which may be sent again if the transport fails while they are in
+    #flight (the others, e.g. initiateVNF, could be carried out twice)
+    IDEMPOTENT_RPCS = frozenset(['getVNFInfo'])
     
     
 
@@ -70,30 +88,39 @@ class NetconfHelper:
         self.__RPC_NAMESPACE = u'http://csikor.tmit.bme.hu/netconf/unify/vnf_starter'
         
          #setting logging related stuffs
+        #the generated rpc messages and the rpc-replies are only formatted
+        #and logged if log_level is DEBUG (the default level is INFO)
         self.__logger = logging.getLogger('[%s]' % desired_logger_name)
-        self.__logger.setLevel(logging.DEBUG)
-        self.__ch = logging.StreamHandler()
-        self.__ch.setLevel(logging.DEBUG)
+        self.__logger.setLevel(kwargs.get('log_level', logging.INFO))
+        if not self.__logger.handlers:
+            #every helper shares the logger, so add the handler only once
+            self.__ch = logging.StreamHandler()
+            self.__ch.setLevel(logging.DEBUG)
         
-        formatter = logging.Formatter('%(asctime)s - '\
-                                      '%(name)s - '\
-                                      '%(levelname)s - '\
-                                      '%(message)s')
+            formatter = logging.Formatter('%(asctime)s - '\
+                                          '%(name)s - '\
+                                          '%(levelname)s - '\
+                                          '%(message)s')
         
-        self.__ch.setFormatter(formatter)
+            self.__ch.setFormatter(formatter)
         
-        self.__logger.addHandler(self.__ch)
+            self.__logger.addHandler(self.__ch)
         #------------------------------
         
         
-        print("---------------------------")
-        self.__logger.info("NetconfHelper instantiated!")
-#         print("---------------------------")
+        self.__logger.debug("NetconfHelper instantiated!")
         self.__server = kwargs.get('server',None)
         self.__port = kwargs.get('port', None)
         self.__username = kwargs.get('username', None)
         self.__password = kwargs.get('password', None)
         self.__timeout = kwargs.get('timeout', 10)
+        #reconnect (and resend the rpc once) if the transport fails
+        self.__auto_reconnect = kwargs.get('auto_reconnect', True)
+        #seconds between ssh keep-alive messages, 0 to disable
+        self.__keepalive = kwargs.get('keepalive', 0)
+        self.__connection = None
+        #threads sharing this session take turns with it (rpcs, connecting)
+        self.lock = threading.RLock()
         
         #variables for the last rpc reply
         self.__rpc_reply_formatted = dict()
@@ -113,15 +140,12 @@ class NetconfHelper:
     
         else:
             #connection variables were SET properly
-            print("---------------------------")
-            self.__logger.info("Connection parameters are set as follows:")
-            self.__logger.info("Server: %s" % self.__server)
-            self.__logger.info("Port: %s" % self.__port)
-            self.__logger.info("Username: %s" % self.__username)
-            self.__logger.info("Password: %s" % self.__password)
-            self.__logger.info("Timeout for synchronous "\
+            self.__logger.debug("Connection parameters are set as follows:")
+            self.__logger.debug("Server: %s" % self.__server)
+            self.__logger.debug("Port: %s" % self.__port)
+            self.__logger.debug("Username: %s" % self.__username)
+            self.__logger.debug("Timeout for synchronous "\
                                 "RPC request: %s" % self.__timeout)
-            print("---------------------------")
             
             
    
@@ -131,6 +155,10 @@ class NetconfHelper:
         The variable self.__connection is responsible for keeping 
         the connection up
         """
+        with self.lock:
+            self.__connect()
+
+    def __connect(self):
         self.__connection = ncclient.manager.connect(host=self.__server, 
                                                    port=self.__port, 
                                                    username=self.__username, 
@@ -139,15 +167,36 @@ class NetconfHelper:
                                                    timeout = self.__timeout)
         self.__logger.info("function (connect)Connected: %s" 
                          % self.__connection.connected)
+        if self.__keepalive:
+            #ncclient does not expose this, so reach for paramiko
+            try:
+                self.__connection._session._transport.set_keepalive(
+                                                            self.__keepalive)
+            except AttributeError:
+                self.__logger.debug("ssh keep-alive is not supported")
    
     def disconnect(self):
         """
         This function will close the connection.
         """
-        if(self.__connection.connected):
-           self.__connection.close_session()
-        self.__logger.info("function (disconnect)Connected: %s" 
-                         % self.__connection.connected)
+        with self.lock:
+            if self.__connection is None:
+                return
+            if(self.__connection.connected):
+               self.__connection.close_session()
+            self.__logger.info("function (disconnect)Connected: %s" 
+                             % self.__connection.connected)
+
+    @property
+    def connected(self):
+        """
+        True if the session to the netconf server is up
+        """
+        return self.__connection is not None and self.__connection.connected
+
+    @property
+    def server(self):
+        return (self.__server, self.__port)
         
         
     
@@ -258,36 +307,32 @@ class NetconfHelper:
         rpc = self.__remove_namespace(xsd_fetch, self.__NETCONF_NAMESPACE)
         
         #show how the created rpc message looks like
-        print "GENERATED RPC MESSAGE:\n"
-        print(etree.tostring(rpc,pretty_print=True))
+        if self.__logger.isEnabledFor(logging.DEBUG):
+            self.__logger.debug("GENERATED RPC MESSAGE:\n%s" %
+                                etree.tostring(rpc,pretty_print=True))
         
         #SENDING THE CREATED RPC XML to the server
         #rpc_reply = without .xml the reply has GetReply type
         #rpc_reply = with .xml we convert it to xml-string
         try:
-            rpc_reply = self.__connection.dispatch(rpc).xml
+            rpc_reply = self.__dispatch(rpc,
+                                        rpc_name in self.IDEMPOTENT_RPCS)
         except (ncclient.operations.rpc.RPCError) as e:
             self.__logger.info("ncclient: RPCError: %s" % e)
             raise RPCError(e)
-            return None
         except (ncclient.transport.TransportError) as e:
             self.__logger.info("ncclient: TransportError % s" % e)
-            #self.connect()
             raise RPCError(e)
-            return None
         except (ncclient.operations.rpc.OperationError) as e:
             self.__logger.info("ncclient: OperationError: %s" % e)
-            # self.__logger.info("function (connect)Connected: %s" 
-            #                    % self.__connection.connected)
-            # self.connect()
             raise RPCError(e)
-            return None
 
         
         #we set our global variable's value to this xml-string
         #therefore, last RPC will always be accessible
         self.__rpc_reply_as_xml = rpc_reply
-        print self.__rpc_reply_as_xml
+        if self.__logger.isEnabledFor(logging.DEBUG):
+            self.__logger.debug("RPC REPLY:\n%s" % self.__rpc_reply_as_xml)
         
         #we have now the rpc-reply
         #if autoparse is False, then we can greatfully break the process of 
@@ -298,20 +343,38 @@ class NetconfHelper:
         #in order to handle properly the rpc-reply as an xml element we need to
         #create a new xml_element from it, since another BRAINFUCK arise around
         #namespaces 
-        #CREATE A PARSER THAT GIVES A SHIT FOR NAMESPACE
-        parser = etree.XMLParser(ns_clean=True)
-        #PARSE THE NEW RPC-REPLY XML
-        dom = etree.parse(StringIO(rpc_reply),parser)
-                
-        #dom.getroot() = <rpc_reply .... > ... </rpc_reply>
-        mainContents = dom.getroot()
+        #PARSE THE NEW RPC-REPLY XML (the parser is cached)
+        #mainContents = <rpc_reply .... > ... </rpc_reply>
+        mainContents = etree.fromstring(rpc_reply, _get_reply_parser())
        
         #alright, lets get all the important data with the following recursion
         parsed = self.__getChildren(mainContents, self.__RPC_NAMESPACE)
         self.__rpc_reply_formatted = parsed
 
-#         print self.__rpc_reply_formatted        
         return self.__rpc_reply_formatted
+
+    def __dispatch(self, rpc, idempotent = False):
+        """
+        Send an rpc, and return the rpc-reply as an xml-string.
+        If the session has been closed, it is reconnected first. If the
+        transport fails while the rpc is in flight, the session is
+        reconnected and the rpc is sent once more only if it is idempotent:
+        the agent may have carried out the first one.
+        """
+        with self.lock:
+            if self.__auto_reconnect and not self.connected:
+                self.__logger.info("Session is down, reconnecting to %s:%s"
+                                   % (self.__server, self.__port))
+                self.__connect()
+            try:
+                return self.__connection.dispatch(rpc).xml
+            except (ncclient.transport.TransportError) as e:
+                if not (self.__auto_reconnect and idempotent):
+                    raise
+                self.__logger.info("ncclient: TransportError %s, reconnecting"
+                                   % e)
+                self.__connect()
+                return self.__connection.dispatch(rpc).xml
     
     
     def __getChildren(self, ele, namespace = None):
@@ -320,28 +383,31 @@ class NetconfHelper:
         the rpc-reply message and iterate through all the xml elements until
         the last child is found, and then create a dictionary 
         Return a dict with the parsed data.
+        The tree is walked once: the value of a leaf is its own text.
         """
     
         parsed = {} # parsed xml subtree as a dict
-        if (namespace != None):
-            ns = "{%s}" % namespace
-            
+        ns = "{%s}" % namespace if namespace != None else None
+        ok_tag = "{%s}ok" % self.__NETCONF_NAMESPACE
         
-        for i in ele.iterchildren():
-            
-            if(i.getchildren()):
+        for i in ele.iterchildren(tag=etree.Element):
+            tag = i.tag
+            if ns is not None and tag.startswith(ns):
+                tag = tag[len(ns):]
+
+            if len(i):
                 #still has children! Go one level deeper with recursion
                 val = self.__getChildren(i, namespace)
-                key = i.tag.replace(ns,"")   
+                key = tag
             else:
                 #if <ok/> is the child, then it has only <rpc-reply> as ancestor
                 #so we do not need to iterate through <ok/> element's ancestors
-                if(i.tag == "{%s}ok" % self.__NETCONF_NAMESPACE):
+                if(i.tag == ok_tag):
                     key = "rpc-reply"
                     val = "ok"
                 else:     
-                    key = i.tag.replace(ns,"")
-                    val = ele.findtext("%s%s" % (ns,i.tag.replace(ns,"")))
+                    key = tag
+                    val = i.text or ''
 
             if key in parsed:
                 if type(parsed[key]) == list:
@@ -352,11 +418,66 @@ class NetconfHelper:
             else:
                 parsed[key] = val
 
-        return parsed                
+        return parsed
 
-            
-           
-            
-        
-        
-        
+
+class NetconfSessionPool:
+    """
+    Keeps one connected NetconfHelper per netconf agent, so that sessions
+    are reused (and kept alive) instead of being set up for every user.
+    Sessions which went down are reconnected when they are asked for again.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, **defaults):
+        """
+        defaults: default arguments for the created NetconfHelpers
+        (e.g., timeout, keepalive)
+        """
+        self.__defaults = defaults
+        self.__sessions = {}
+        self.__lock = threading.Lock()
+
+    def get(self, server, port, username, password, **kwargs):
+        """
+        Return the connected NetconfHelper of an agent, create it if needed.
+        Connection errors (e.g. ncclient's AuthenticationError) are passed
+        to the caller.
+        """
+        key = (server, port, username)
+        with self.__lock:
+            helper = self.__sessions.get(key)
+            if helper is None:
+                params = dict(self.__defaults)
+                params.update(kwargs)
+                helper = NetconfHelper(server = server,
+                                       port = port,
+                                       username = username,
+                                       password = password,
+                                       **params)
+                self.__sessions[key] = helper
+        #connecting may take a while, so only the users of this agent wait
+        #for it (a failed connect is tried again by the next get)
+        with helper.lock:
+            if not helper.connected:
+                helper.connect()
+        return helper
+
+    def close(self, server, port, username):
+        """
+        Disconnect and forget the session of an agent
+        """
+        with self.__lock:
+            helper = self.__sessions.pop((server, port, username), None)
+        if helper is not None:
+            helper.disconnect()
+
+    def close_all(self):
+        with self.__lock:
+            helpers = self.__sessions.values()
+            self.__sessions = {}
+        for helper in helpers:
+            helper.disconnect()
+
+    def __len__(self):
+        return len(self.__sessions)
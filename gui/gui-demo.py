@@ -1261,9 +1261,6 @@ class MiniEdit( Frame, Utils.LoggerHelper ):
         
         self._gui_event_queue = Queue.Queue()
 
-        self.vnf_proc_cmd = 'grep cpu /proc/stat'
-        self.vnf_mcmd = 'grep MemTotal /proc/meminfo'
-
         self.control_buttons = dict()
 
         # Call superclass constructor
@@ -3598,7 +3595,8 @@ class MiniEdit( Frame, Utils.LoggerHelper ):
             return
 
         
-        self.mem_total = float( quietRun( self.vnf_mcmd ).split()[-2] )
+        # CPU and memory usage of all the EEs, sampled at once
+        usages = self.network_manager.resource_usage()
         for widget in canvas.widgetToItem:
             name = widget[ 'text' ]
             tags = canvas.gettags( canvas.widgetToItem[ widget ] )
@@ -3610,16 +3608,11 @@ class MiniEdit( Frame, Utils.LoggerHelper ):
                 ip = mininet_host.IP()
                 mac = mininet_host.MAC()
 
-                procresult = quietRun( self.vnf_proc_cmd ).split()
-                cpu_total = sum( map(int, procresult[1:10]) )
-                cpu_usage = mininet_host.cGetCpuUsage()
-                mininet_host.cpu_usage_rel = float(cpu_usage-mininet_host.last_cpu_usage)/float(mininet_host.frac*(cpu_total-mininet_host.last_cpu_total))
-
-                mininet_host.last_cpu_usage = cpu_usage
-                mininet_host.last_cpu_total = cpu_total
-
-                mem_usage = mininet_host.cGetMemUsage()
-                mininet_host.mem_usage_abs = float(mem_usage)/self.mem_total
+                usage = usages.get(name)
+                if usage is None:
+                    continue
+                mininet_host.cpu_usage_rel = usage['cpuRel']
+                mininet_host.mem_usage_abs = usage['memAbs']
 
                 #update info fields
                 upper_text = 'IP:%s'% ip + '\n' + 'CPU: %3.1f%%'%(100*mininet_host.cpu_usage_rel)
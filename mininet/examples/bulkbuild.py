@@ -0,0 +1,54 @@
+#!/usr/bin/python
+
+"""
+Compare building and starting a 500-link network one link and switch
+at a time with building it in bulk (bulkBuild) and starting its switches
+together (batchStartup), and print how long each phase took.
+"""
+
+import sys
+from time import time
+
+from mininet.log import setLogLevel
+from mininet.net import Mininet
+from mininet.node import OVSKernelSwitch
+from mininet.topo import LinearTopo
+from mininet.clean import cleanup
+
+def buildAndStart( topo, fast ):
+    "Build and start a network, and return its phase times"
+    start = time()
+    net = Mininet( topo=topo, switch=OVSKernelSwitch, build=False,
+                   bulkBuild=fast, batchStartup=fast )
+    net.build()
+    net.start()
+    total = time() - start
+    times = net.buildTimes + net.startTimes
+    net.stop()
+    cleanup()
+    return total, times
+
+def bulkBuild( switches=100, hostsPerSwitch=4 ):
+    "Compare the serial and bulk builds of a linear network"
+    topo = LinearTopo( k=switches, n=hostsPerSwitch )
+    links = len( topo.links() )
+    results = {}
+    for name, fast in ( ( 'serial', False ), ( 'bulk', True ) ):
+        print "*** Building %d links (%s)" % ( links, name )
+        results[ name ] = buildAndStart( topo, fast )
+
+    print
+    for name in 'serial', 'bulk':
+        total, times = results[ name ]
+        print "%s: %.2fs" % ( name, total )
+        for phase, t in times:
+            print "  %-20s %8.3fs" % ( phase, t )
+    print "speedup: %.1fx" % ( results[ 'serial' ][ 0 ] /
+                                results[ 'bulk' ][ 0 ] )
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    if len( sys.argv ) > 1:
+        bulkBuild( switches=int( sys.argv[ 1 ] ) )
+    else:
+        bulkBuild()
@@ -0,0 +1,181 @@
+"""
+bulk.py: building links in bulk
+
+Creating a link the usual way costs a dozen or more commands: deleting
+stale interfaces, creating the veth pair, moving each end into its node's
+namespace (and checking that it got there) and configuring each end with
+several ifconfig (and, for TCIntf, ethtool and tc) commands.
+
+A BulkBuilder instead collects links created with Link( ..., bulk=builder )
+(Mininet( bulkBuild=True ) does this for the links it builds) and sets
+them all up at once, in phases:
+
+- veth pairs: one 'ip -batch' in the root namespace creates every pair,
+  with each end created right in its node's namespace (which is much
+  cheaper than moving it there afterwards)
+- interface config: one 'ip -batch' per namespace sets MTUs and IP
+  addresses and brings the interfaces up
+- tc: one 'tc -batch' per namespace sets up traffic shaping
+- other config: anything which can't be batched (ethtool, arbitrary
+  ifconfig options, and interface classes without bulkCmds())
+
+Interfaces without a MAC address of their own get a random (locally
+administered) one when they're created, as the kernel would give them,
+so there's no need to ask for them afterwards.
+
+Namespaces are independent, so the per-namespace phases run in a bounded
+pool of threads, each talking to a single node's shell.
+"""
+
+from random import getrandbits
+
+from mininet.log import info, error
+from mininet.util import runBatch, parallelMap, macColonHex, PhaseTimer
+
+class BulkBuilder( object ):
+    "Sets up links (veth pairs and their interfaces) in bulk"
+
+    def __init__( self, maxThreads=16 ):
+        """maxThreads: most namespaces to configure at once"""
+        self.maxThreads = maxThreads
+        self.pairs = []  # ( intfName1, node1, intfName2, node2 ) to make
+        self.intfs = []  # ( intf, params ) to configure
+        self.cmds = {}  # intf -> ( ip, tc, shell commands ) to configure it
+        self.timer = None  # PhaseTimer of the last build()
+
+    def addPair( self, intfName1, node1, intfName2, node2 ):
+        """Make a veth pair connecting intfName1 (in node1) and intfName2
+           (in node2) later"""
+        self.pairs.append( ( intfName1, node1, intfName2, node2 ) )
+
+    def addIntf( self, intf, params ):
+        "Configure intf with params later"
+        self.intfs.append( ( intf, params ) )
+
+    def build( self, timer=None ):
+        """Set up everything added so far
+           timer: PhaseTimer to record the phases in (optional)
+           returns: PhaseTimer"""
+        timer = timer if timer is not None else PhaseTimer()
+        self.timer = timer
+        pairs, intfs = self.pairs, self.intfs
+        self.pairs, self.intfs = [], []
+        info( '*** Building %d links in bulk\n' % len( pairs ) )
+        # Work out what to do with each interface (which also tells us
+        # which MAC addresses are set)
+        for intf, params in intfs:
+            if bulkable( intf ):
+                self.cmds[ intf ] = intf.bulkCmds( **params )
+        groups = self.namespaces( intfs )
+        try:
+            with timer.phase( 'veth pairs' ):
+                self.makePairs( pairs, intfs )
+            with timer.phase( 'interface config' ):
+                parallelMap( self.configIntfs, groups, self.maxThreads )
+            with timer.phase( 'tc' ):
+                parallelMap( self.shapeIntfs, groups, self.maxThreads )
+            with timer.phase( 'other config' ):
+                parallelMap( self.configOthers, groups, self.maxThreads )
+        finally:
+            self.cmds = {}
+        info( '*** Built links in %.3fs (%s)\n' % ( timer.total(), timer ) )
+        return timer
+
+    @staticmethod
+    def run( cmd, cmds, node=None ):
+        "Run a batch command on cmds, complaining if any of them failed"
+        if not cmds:
+            return
+        out = runBatch( cmd, ''.join( c + '\n' for c in cmds ), node )
+        # (ip and tc say this after each error when run with -force)
+        if 'Command failed' in out:
+            error( '*** %s in %s:\n%s' % ( cmd, node or 'root namespace',
+                                            out ) )
+
+    @staticmethod
+    def namespaces( intfs ):
+        """Group intfs (and their params) by namespace
+           returns: list of ( node or None for root, [ ( intf, params ) ] )"""
+        groups, order = {}, []
+        for intf, params in intfs:
+            node = intf.node if intf.node.inNamespace else None
+            if node not in groups:
+                groups[ node ] = []
+                order.append( node )
+            groups[ node ].append( ( intf, params ) )
+        return [ ( node, groups[ node ] ) for node in order ]
+
+    def makePairs( self, pairs, intfs ):
+        """Make veth pairs, each end in its node's namespace (deleting
+           any old interfaces in the way)"""
+        existing = runBatch( 'ip -o link show', '' )
+        existing = set( line.split( ':' )[ 1 ].strip().split( '@' )[ 0 ]
+                        for line in existing.splitlines() if ':' in line )
+        macs = {}
+        for intf, _params in intfs:
+            if intf.mac is None:
+                intf.mac = randomMAC()
+            macs[ ( intf.node, intf.name ) ] = intf.mac
+
+        def end( name, node ):
+            "Arguments for creating one end of a veth pair"
+            args = 'name %s' % name
+            if node.inNamespace:
+                args += ' netns %s' % node.pid
+            mac = macs.get( ( node, name ) )
+            if mac:
+                args += ' address %s' % mac
+            return args
+
+        cmds = [ 'link del %s' % name for name1, _n1, name2, _n2 in pairs
+                 for name in ( name1, name2 ) if name in existing ]
+        cmds += [ 'link add %s type veth peer %s' % ( end( name1, node1 ),
+                                                     end( name2, node2 ) )
+                  for name1, node1, name2, node2 in pairs ]
+        self.run( 'ip -force -batch', cmds )
+
+    def configIntfs( self, group ):
+        "Configure the intfs in a namespace with 'ip -batch'"
+        node, intfs = group
+        cmds = []
+        for intf, _params in intfs:
+            if intf in self.cmds:
+                cmds += self.cmds[ intf ][ 0 ]
+        self.run( 'ip -force -batch', cmds, node )
+
+    def shapeIntfs( self, group ):
+        "Set up traffic shaping for the intfs in a namespace with 'tc -batch'"
+        node, intfs = group
+        cmds = []
+        for intf, _params in intfs:
+            if intf in self.cmds:
+                cmds += self.cmds[ intf ][ 1 ]
+        self.run( 'tc -force -batch', cmds, node )
+
+    def configOthers( self, group ):
+        "Do whatever configuration of the intfs in a namespace is left"
+        node, intfs = group
+        cmds = []
+        for intf, params in intfs:
+            if intf in self.cmds:
+                cmds += self.cmds[ intf ][ 2 ]
+            else:
+                intf.config( **params )
+        if cmds:
+            runBatch( 'sh', ''.join( c + '\n' for c in cmds ), node )
+        for intf, params in intfs:
+            if intf in self.cmds and params.get( 'ifconfig' ) is not None:
+                intf.updateIP()
+
+
+def bulkable( intf ):
+    """Can intf be configured with bulkCmds()? (Only if its class
+       defines bulkCmds() to match the config() it uses.)"""
+    for cls in type( intf ).__mro__:
+        if 'config' in cls.__dict__:
+            return 'bulkCmds' in cls.__dict__
+    return False
+
+def randomMAC():
+    "Return a random unicast, locally administered MAC address"
+    return macColonHex( ( getrandbits( 48 ) & ~( 1 << 40 ) ) | ( 1 << 41 ) )
@@ -0,0 +1,183 @@
+"""
+cgroup.py: direct cgroupfs access and resource sampling
+
+Reading or setting a cgroup parameter with cgget/cgset costs a process
+(or two) each time, which adds up quickly when the usage of dozens of
+EEs is refreshed every second. Cgroup reads and writes the cgroupfs
+files directly instead, keeping the files it reads open so that reading
+them again is just a seek and a read.
+
+ResourceSampler builds on it to sample the CPU and memory usage of many
+CPULimitedHosts (EEs) in one pass, reading the system-wide totals only
+once per pass. Each user (e.g. the CLI's 'ee top' and the orchestrator)
+keeps its own sampler, since a sample is relative to the previous one,
+while the open files are shared through the hosts' Cgroup objects.
+"""
+
+import os
+from threading import Lock
+
+from mininet.log import error
+
+def cgroupMounts():
+    """Return a dict of where each cgroup (v1) controller is mounted
+       (read once from /proc/mounts)"""
+    if not hasattr( cgroupMounts, 'mounts' ):
+        mounts = {}
+        with open( '/proc/mounts' ) as f:
+            for line in f:
+                fields = line.split()
+                if len( fields ) < 4 or fields[ 2 ] != 'cgroup':
+                    continue
+                for option in fields[ 3 ].split( ',' ):
+                    mounts.setdefault( option, fields[ 1 ] )
+        cgroupMounts.mounts = mounts
+    return cgroupMounts.mounts
+
+def memTotal():
+    "Return the total memory (in kB) of the system"
+    with open( '/proc/meminfo' ) as f:
+        for line in f:
+            if line.startswith( 'MemTotal:' ):
+                return int( line.split()[ 1 ] )
+    raise Exception( 'MemTotal not found in /proc/meminfo' )
+
+def readFd( fd, size=4096 ):
+    "Read a (proc or cgroupfs) file from the start through an open fd"
+    os.lseek( fd, 0, os.SEEK_SET )
+    return os.read( fd, size )
+
+class Cgroup( object ):
+    "Reads and writes the cgroupfs files of a cgroup"
+
+    def __init__( self, name ):
+        """name: cgroup name (e.g. 'h1' for /sys/fs/cgroup/cpu/h1)"""
+        self.name = name
+        self.fds = {}  # ( resource, param ) -> fd open for reading
+        # Samplers in different threads share our fds, and a read is a
+        # seek and then a read
+        self.lock = Lock()
+
+    def path( self, resource, param ):
+        "Return the path of the file of resource.param"
+        mounts = cgroupMounts()
+        if resource not in mounts:
+            raise Exception( 'cgroup controller %s is not mounted'
+                             % resource )
+        return os.path.join( mounts[ resource ], self.name,
+                             '%s.%s' % ( resource, param ) )
+
+    def read( self, resource, param ):
+        "Return the contents of resource.param (keeping it open)"
+        key = ( resource, param )
+        with self.lock:
+            fd = self.fds.get( key )
+            if fd is None:
+                fd = self.fds[ key ] = os.open( self.path( resource, param ),
+                                                os.O_RDONLY )
+            return readFd( fd )
+
+    def get( self, resource, param ):
+        "Return the value of resource.param as a string"
+        return self.read( resource, param ).strip()
+
+    def set( self, resource, param, value ):
+        "Set resource.param to value, returning whether the kernel took it"
+        try:
+            fd = os.open( self.path( resource, param ), os.O_WRONLY )
+            try:
+                os.write( fd, str( value ) )
+            finally:
+                os.close( fd )
+        except OSError, e:
+            error( '*** error: cannot set %s.%s of %s to %s: %s\n'
+                   % ( resource, param, self.name, value, e.strerror ) )
+            return False
+        return True
+
+    def cpuTicks( self ):
+        "Return the CPU time (user + system, in USER_HZ) we've used"
+        stat = self.read( 'cpuacct', 'stat' ).split()
+        return int( stat[ -1 ] ) + int( stat[ -3 ] )
+
+    def memUsage( self ):
+        "Return the memory (in kB) we're using"
+        return int( self.read( 'memory', 'usage_in_bytes' ) ) / 1024
+
+    def close( self ):
+        "Close the files we keep open"
+        with self.lock:
+            for fd in self.fds.itervalues():
+                try:
+                    os.close( fd )
+                except OSError:
+                    pass
+            self.fds = {}
+
+
+class ResourceSampler( object ):
+    "Samples the CPU and memory usage of CPULimitedHosts in one pass"
+
+    def __init__( self, hosts=() ):
+        """hosts: CPULimitedHosts (e.g. net.ees) to sample"""
+        self.statFd = os.open( '/proc/stat', os.O_RDONLY )
+        self.memTotal = memTotal()
+        self.last = {}  # host -> ( cpu ticks, system ticks ) last time
+        for host in hosts:
+            self.add( host )
+
+    def systemTicks( self ):
+        "Return the total CPU time (in USER_HZ) of the system"
+        # First line: cpu user nice system idle iowait irq softirq ...
+        cpu = readFd( self.statFd ).split( '\n', 1 )[ 0 ]
+        return sum( int( t ) for t in cpu.split()[ 1:10 ] )
+
+    def add( self, host ):
+        "Start sampling host (from now on)"
+        self.last[ host ] = ( host.cgroupFs.cpuTicks(), self.systemTicks() )
+
+    def remove( self, host ):
+        "Stop sampling host"
+        self.last.pop( host, None )
+
+    def hosts( self ):
+        "Return the hosts we sample"
+        return self.last.keys()
+
+    def sample( self ):
+        """Return the usage of each host since the last sample as
+           { host: usage }, where usage is a dict of
+           cpuAbs: fraction of the system's CPU time used
+           cpuRel: fraction of the host's CPU share (host.frac) used
+           mem: memory used (kB)
+           memAbs: fraction of the system's memory used
+           memRel: fraction of the host's share of the memory used
+           Hosts which have gone away are dropped."""
+        total = self.systemTicks()
+        usages = {}
+        for host, ( lastTicks, lastTotal ) in self.last.items():
+            try:
+                ticks = host.cgroupFs.cpuTicks()
+                mem = host.cgroupFs.memUsage()
+            except ( OSError, IOError ):
+                # Cgroup deleted (host stopped)
+                self.remove( host )
+                continue
+            self.last[ host ] = ( ticks, total )
+            cpu = float( ticks - lastTicks ) / max( total - lastTotal, 1 )
+            memAbs = float( mem ) / self.memTotal
+            frac = getattr( host, 'frac', None )
+            if not frac or frac < 0:
+                # Unlimited: its share is the whole system
+                frac = 1.0
+            usages[ host ] = { 'cpuAbs': cpu, 'cpuRel': cpu / frac,
+                               'mem': mem, 'memAbs': memAbs,
+                               'memRel': memAbs / frac }
+        return usages
+
+    def close( self ):
+        "Close /proc/stat"
+        if self.statFd is not None:
+            os.close( self.statFd )
+            self.statFd = None
+
@@ -257,6 +257,16 @@ def do_iperfudp( self, line ):
             error( 'invalid number of args: iperfudp bw src dst\n' +
                    'bw examples: 10M\n' )
 
+    def do_iperfmatrix( self, line ):
+        "Concurrent iperf TCP tests between all (or n random) host pairs."
+        args = line.split()
+        if not args:
+            self.mn.iperfMatrix()
+        elif len( args ) == 1 and args[ 0 ].isdigit():
+            self.mn.iperfMatrix( sample=int( args[ 0 ] ) )
+        else:
+            error( 'invalid args: iperfmatrix [n]\n' )
+
     def do_intfs( self, _line ):
         "List interfaces."
         for node in self.mn.values():
@@ -20,7 +20,6 @@
 import curses
 
 from mininet.log import info, output, error
-from mininet.util import quietRun
 from mininet.vnfcatalog import Catalog
 
 class SubCmd( Cmd ):
@@ -106,54 +105,42 @@ def do_restart( self, _line ):
 
     def do_top( self, _line ):
         "Show resource usage for EEs."
-        cmd = 'grep cpu /proc/stat'
-        mcmd = 'grep MemTotal /proc/meminfo'
-        mem_total = int( quietRun( mcmd ).split()[-2] )
-        last_cpu_usage = {}
-        last_cpu_total = {}
-        for ee in self.mn.ees:
-            last_cpu_usage[ee] = 1
-            last_cpu_total[ee] = 1
-
+        sampler = self.mn.resourceSampler()
         screen = curses.initscr()
         curses.noecho()
         screen.clear()
         #curses.curs_set(0)
-        
+
         h1 = "\t[         CPU         ]\t[             MEM              ] "
         h2 = " NAME\t[  SHARE   ABS    REL ]\t[ TOTAL kB USED kB   ABS   REL ]"
-        while True:
-            vpos=2
-            hpos=0
-            screen.addstr(0, 0, h1)
-            screen.addstr(1, 0, h2)
-            for ee in self.mn.ees:
-                procresult = quietRun( cmd ).split()
-                cpu_total = sum( map(int, procresult[1:10]) )
-                cpu_usage = ee.cGetCpuUsage()
-                diff = float(cpu_usage-last_cpu_usage[ee])
-                total_diff = float(cpu_total-last_cpu_total[ee])
-                last = last_cpu_total[ee]
-                cpu_usage_abs = 100.0 * diff / total_diff
-                cpu_usage_rel = cpu_usage_abs / ee.frac
-                mem_usage = ee.cGetMemUsage()
-                mem_usage_abs = 100.0 * mem_usage / mem_total
-                mem_usage_rel = mem_usage_abs / ee.frac
-                s = " %s" % ee.name
-                s += '\t%7.1f' % ee.frac
-                s += ' %6.1f' % cpu_usage_abs
-                s += ' %6.1f' % cpu_usage_rel
-                s += '\t%10d' % mem_total
-                s += ' %7d' % mem_usage
-                s += ' %5.1f' % mem_usage_abs
-                s += ' %5.1f' % mem_usage_rel
-                screen.addstr(vpos, hpos, s)
-                last_cpu_usage[ee] = cpu_usage
-                last_cpu_total[ee] = cpu_total
-                vpos+=1
-            screen.addstr(vpos, hpos, '')
-            screen.refresh()
-            sleep(1)
+        try:
+            while True:
+                sleep(1)
+                # All EEs are sampled at once, without running anything
+                usages = sampler.sample()
+                vpos=2
+                hpos=0
+                screen.addstr(0, 0, h1)
+                screen.addstr(1, 0, h2)
+                for ee in self.mn.ees:
+                    usage = usages.get(ee)
+                    if usage is None:
+                        continue
+                    s = " %s" % ee.name
+                    s += '\t%7.1f' % getattr(ee, 'frac', -1)
+                    s += ' %6.1f' % (100 * usage['cpuAbs'])
+                    s += ' %6.1f' % (100 * usage['cpuRel'])
+                    s += '\t%10d' % sampler.memTotal
+                    s += ' %7d' % usage['mem']
+                    s += ' %5.1f' % (100 * usage['memAbs'])
+                    s += ' %5.1f' % (100 * usage['memRel'])
+                    screen.addstr(vpos, hpos, s)
+                    vpos+=1
+                screen.addstr(vpos, hpos, '')
+                screen.refresh()
+        finally:
+            curses.endwin()
+            sampler.close()
 
 class VNF( SubCmd ):
     "Subcommands for interacting with VNFs."
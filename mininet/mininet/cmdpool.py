@@ -0,0 +1,178 @@
+"""
+cmdpool.py: running commands on many nodes at once
+
+Node.cmd() sends a command to a node's shell and waits for it to
+finish, so commands on different nodes run one after another (unless
+each gets a thread of its own). A CmdPool instead sends commands to
+many nodes' shells at once, and waits for all of their output with a
+single epoll object, returning a CmdFuture for each command.
+
+A node's shell still runs one command at a time, so commands for a
+node which is busy are queued until it's done. To save round trips,
+several commands can also be sent to a node in one go with
+submitCmds() (see Node.cmds()).
+
+Example:
+
+    pool = CmdPool()
+    futures = [ pool.submit( h, 'ifconfig lo up' ) for h in net.hosts ]
+    pool.wait( futures )
+    outputs = [ f.result() for f in futures ]
+    pool.close()
+"""
+
+import select
+from collections import deque
+from time import time
+
+from mininet.log import debug, error
+
+class CmdFuture( object ):
+    "The (eventual) output of a command sent by a CmdPool"
+
+    def __init__( self, pool, node, args, kwargs, cmds=None ):
+        """pool: CmdPool running the command
+           node: Node to run it on
+           args, kwargs: arguments for node.sendCmd()
+           cmds: list of commands for node.sendCmds() instead"""
+        self.pool = pool
+        self.node = node
+        self.args = args
+        self.kwargs = kwargs
+        self.cmds = cmds
+        self.output = ''  # so far
+        self.pid = None  # of a background command (ending in '&')
+        self.finished = False
+        self.callbacks = []
+
+    def done( self ):
+        "Has the command finished?"
+        return self.finished
+
+    def result( self, timeout=None ):
+        """Wait for the command to finish and return its output
+           (a list of outputs if sent with submitCmds())
+           timeout: seconds to wait, or None to wait indefinitely
+           raises: Exception if it didn't finish in time"""
+        if not self.finished and not self.pool.wait( [ self ], timeout ):
+            raise Exception( 'timed out waiting for %s on %s' %
+                             ( self.cmds or self.args, self.node.name ) )
+        return self.output
+
+    def addCallback( self, fn ):
+        "Call fn( self ) once the command has finished"
+        if self.finished:
+            fn( self )
+        else:
+            self.callbacks.append( fn )
+
+    def finish( self ):
+        "Internal method: the command has finished"
+        self.finished = True
+        if self.cmds is not None:
+            self.output = self.node.splitOutputs( self.output,
+                                                  len( self.cmds ) )
+        for fn in self.callbacks:
+            fn( self )
+        self.callbacks = []
+
+
+class CmdPool( object ):
+    "Runs commands on many nodes at once"
+
+    def __init__( self ):
+        self.epoll = select.epoll()
+        self.queues = {}  # node -> deque of its CmdFutures, running first
+        self.running = {}  # shell output fd -> CmdFuture
+
+    def submit( self, node, *args, **kwargs ):
+        """Run a command on node (once it's done with earlier ones)
+           args, kwargs: as for node.sendCmd()
+           returns: CmdFuture"""
+        return self.queue( CmdFuture( self, node, args, kwargs ) )
+
+    def submitCmds( self, node, cmds ):
+        """Run several commands on node in one round trip
+           cmds: list of command strings
+           returns: CmdFuture whose result is a list of their outputs"""
+        return self.queue( CmdFuture( self, node, (), {}, cmds=cmds ) )
+
+    def queue( self, future ):
+        "Internal method: queue future, and start it if its node is idle"
+        queue = self.queues.setdefault( future.node, deque() )
+        queue.append( future )
+        if len( queue ) == 1:
+            self.start( future )
+        return future
+
+    def start( self, future ):
+        "Internal method: send future's command(s) to its node"
+        node = future.node
+        debug( '*** %s : %s\n' % ( node.name, future.cmds or future.args ) )
+        if future.cmds is not None:
+            node.sendCmds( future.cmds )
+        else:
+            node.sendCmd( *future.args, **future.kwargs )
+        fd = node.stdout.fileno()
+        self.running[ fd ] = future
+        self.epoll.register( fd, select.EPOLLIN )
+
+    def poll( self, timeout=-1 ):
+        """Wait for output from the nodes (for at most timeout seconds,
+           or indefinitely if timeout is negative) and handle it
+           returns: list of CmdFutures which finished"""
+        finished = []
+        for fd, event in self.epoll.poll( timeout ):
+            future = self.running[ fd ]
+            node = future.node
+            data = ''
+            if event & select.EPOLLIN:
+                data = node.monitor( timeoutms=0 )
+                future.output += data
+                if future.pid is None:
+                    future.pid = node.lastPid
+            if node.waiting:
+                if data or not event & ( select.EPOLLHUP | select.EPOLLERR ):
+                    continue
+                # The shell has gone away
+                error( '*** %s: shell exited while running %s\n' %
+                       ( node.name, future.cmds or future.args ) )
+                node.waiting = False
+            self.epoll.unregister( fd )
+            del self.running[ fd ]
+            queue = self.queues[ node ]
+            queue.popleft()
+            if queue:
+                self.start( queue[ 0 ] )
+            else:
+                del self.queues[ node ]
+            # (Callbacks may submit more commands)
+            future.finish()
+            finished.append( future )
+        return finished
+
+    def wait( self, futures=None, timeout=None ):
+        """Handle output until futures (by default, all commands
+           submitted) have finished
+           timeout: seconds to wait, or None to wait indefinitely
+           returns: whether they all finished"""
+        deadline = None if timeout is None else time() + timeout
+        while True:
+            if futures is not None:
+                futures = [ f for f in futures if not f.finished ]
+                if not futures:
+                    return True
+            elif not self.running:
+                return True
+            if deadline is None:
+                self.poll()
+            else:
+                left = deadline - time()
+                if left <= 0:
+                    return False
+                self.poll( left )
+
+    def close( self ):
+        "Finish all commands and release our epoll object"
+        self.wait()
+        self.epoll.close()
@@ -41,11 +41,17 @@ def __init__( self, name, node=None, port=None, link=None, **params ):
         self.name = name
         self.link = link
         self.mac, self.ip, self.prefixLen = None, None, None
+        # If our link is being built in bulk, the BulkBuilder will move
+        # and configure us later (along with everything else)
+        bulk = getattr( link, 'bulk', None )
         # Add to node (and move ourselves if necessary )
-        node.addIntf( self, port=port )
+        node.addIntf( self, port=port, move=not bulk )
         # Save params for future reference
         self.params = params
-        self.config( **params )
+        if bulk:
+            bulk.addIntf( self, params )
+        else:
+            self.config( **params )
 
     def cmd( self, *args, **kwargs ):
         "Run a command in our owning node"
@@ -99,6 +105,10 @@ def MAC( self ):
         "Return MAC address"
         return self.mac
 
+    def setMTU( self, mtu ):
+        "Set our MTU"
+        return self.cmd( 'ip link set dev', self.name, 'mtu', mtu )
+
     def isUp( self, setUp=False ):
         "Return whether interface is up"
         if setUp:
@@ -139,18 +149,21 @@ def setParam( self, results, method, **param ):
         return result
 
     def config( self, mac=None, ip=None, ifconfig=None,
-                up=True, **_params ):
+                up=True, mtu=None, **_params ):
         """Configure Node according to (optional) parameters:
            mac: MAC address
            ip: IP address
            ifconfig: arbitrary interface configuration
+           mtu: MTU
            Subclasses should override this method and call
-           the parent class's config(**params)"""
+           the parent class's config(**params)
+           (and override bulkCmds() to match, if they can)"""
         # If we were overriding this method, we would call
         # the superclass config method here as follows:
         # r = Parent.config( **params )
         r = {}
         self.setParam( r, 'setMAC', mac=mac )
+        self.setParam( r, 'setMTU', mtu=mtu )
         self.setParam( r, 'setIP', ip=ip )
         self.setParam( r, 'isUp', up=up )
         self.setParam( r, 'ifconfig', ifconfig=ifconfig )
@@ -158,6 +171,29 @@ def config( self, mac=None, ip=None, ifconfig=None,
         self.updateMAC()
         return r
 
+    def bulkCmds( self, mac=None, ip=None, ifconfig=None,
+                  up=True, mtu=None, **_params ):
+        """Return what config() would do, for a BulkBuilder, as
+           ( 'ip -batch' lines, 'tc -batch' lines, shell commands ),
+           and record the MAC and IP addresses we'll have"""
+        ipCmds, shCmds = [], []
+        if mac is not None:
+            self.mac = mac
+            ipCmds.append( 'link set dev %s address %s' % ( self, mac ) )
+        if mtu is not None:
+            ipCmds.append( 'link set dev %s mtu %s' % ( self, mtu ) )
+        if ip is not None:
+            if '/' in ip:
+                self.ip, self.prefixLen = ip.split( '/' )
+            else:
+                self.ip = ip
+            ipCmds.append( 'addr add %s dev %s' % ( ip, self ) )
+        if up:
+            ipCmds.append( 'link set dev %s up' % self )
+        if ifconfig is not None:
+            shCmds.append( 'ifconfig %s %s' % ( self, ifconfig ) )
+        return ipCmds, [], shCmds
+
     def delete( self ):
         "Delete interface"
         self.cmd( 'ip link del ' + self.name )
@@ -260,34 +296,26 @@ def tc( self, cmd, tc='tc' ):
         debug(" *** executing command: %s\n" % c)
         return self.cmd( c )
 
-    def config( self, bw=None, delay=None, jitter=None, loss=None,
-                disable_gro=True, speedup=0, use_hfsc=False, use_tbf=False,
-                latency_ms=None, enable_ecn=False, enable_red=False,
-                max_queue_size=None, **params ):
-        "Configure the port and set its properties."
-
-        result = Intf.config( self, **params)
-
-        # Disable GRO
-        if disable_gro:
-            self.cmd( 'ethtool -K %s gro off' % self )
+    def shapingCmds( self, bw=None, delay=None, jitter=None, loss=None,
+                     speedup=0, use_hfsc=False, use_tbf=False,
+                     latency_ms=None, enable_ecn=False, enable_red=False,
+                     max_queue_size=None ):
+        """Return tc commands (to be filled in with tc and our name)
+           which shape our traffic, and the last parent; or None, None
+           if there's nothing to do"""
 
         # Optimization: return if nothing else to configure
         # Question: what happens if we want to reset things?
         if ( bw is None and not delay and not loss
              and max_queue_size is None ):
-            return
-
-        # Clear existing configuration
-        cmds = [ '%s qdisc del dev %s root' ]
+            return None, None
 
         # Bandwidth limits via various methods
-        bwcmds, parent = self.bwCmds( bw=bw, speedup=speedup,
-                                      use_hfsc=use_hfsc, use_tbf=use_tbf,
-                                      latency_ms=latency_ms,
-                                      enable_ecn=enable_ecn,
-                                      enable_red=enable_red )
-        cmds += bwcmds
+        cmds, parent = self.bwCmds( bw=bw, speedup=speedup,
+                                    use_hfsc=use_hfsc, use_tbf=use_tbf,
+                                    latency_ms=latency_ms,
+                                    enable_ecn=enable_ecn,
+                                    enable_red=enable_red )
 
         # Delay/jitter/loss/max_queue_size using netem
         delaycmds, parent = self.delayCmds( delay=delay, jitter=jitter,
@@ -304,6 +332,31 @@ def config( self, bw=None, delay=None, jitter=None, loss=None,
                     if enable_red else [] ) )
         info( '(' + ' '.join( stuff ) + ') ' )
 
+        return cmds, parent
+
+    def config( self, bw=None, delay=None, jitter=None, loss=None,
+                disable_gro=True, speedup=0, use_hfsc=False, use_tbf=False,
+                latency_ms=None, enable_ecn=False, enable_red=False,
+                max_queue_size=None, **params ):
+        "Configure the port and set its properties."
+
+        result = Intf.config( self, **params)
+
+        # Disable GRO
+        if disable_gro:
+            self.cmd( 'ethtool -K %s gro off' % self )
+
+        cmds, parent = self.shapingCmds(
+            bw=bw, delay=delay, jitter=jitter, loss=loss, speedup=speedup,
+            use_hfsc=use_hfsc, use_tbf=use_tbf, latency_ms=latency_ms,
+            enable_ecn=enable_ecn, enable_red=enable_red,
+            max_queue_size=max_queue_size )
+        if cmds is None:
+            return
+
+        # Clear existing configuration
+        cmds = [ '%s qdisc del dev %s root' ] + cmds
+
         # Execute all the commands in our node
         debug("at map stage w/cmds: %s\n" % cmds)
         tcoutputs = [ self.tc(cmd) for cmd in cmds ]
@@ -314,6 +367,24 @@ def config( self, bw=None, delay=None, jitter=None, loss=None,
 
         return result
 
+    def bulkCmds( self, bw=None, delay=None, jitter=None, loss=None,
+                  disable_gro=True, speedup=0, use_hfsc=False, use_tbf=False,
+                  latency_ms=None, enable_ecn=False, enable_red=False,
+                  max_queue_size=None, **params ):
+        "Return what config() would do, for a BulkBuilder"
+        ipCmds, tcCmds, shCmds = Intf.bulkCmds( self, **params )
+        if disable_gro:
+            shCmds.append( 'ethtool -K %s gro off' % self )
+        cmds, _parent = self.shapingCmds(
+            bw=bw, delay=delay, jitter=jitter, loss=loss, speedup=speedup,
+            use_hfsc=use_hfsc, use_tbf=use_tbf, latency_ms=latency_ms,
+            enable_ecn=enable_ecn, enable_red=enable_red,
+            max_queue_size=max_queue_size )
+        # (There's no existing configuration to clear on a new interface)
+        if cmds:
+            tcCmds += [ ( cmd % ( '', self ) ).strip() for cmd in cmds ]
+        return ipCmds, tcCmds, shCmds
+
 
 class Link( object ):
 
@@ -323,7 +394,7 @@ class Link( object ):
     def __init__( self, node1, node2, port1=None, port2=None,
                   intfName1=None, intfName2=None,
                   intf=Intf, cls1=None, cls2=None, params1=None,
-                  params2=None ):
+                  params2=None, bulk=None ):
         """Create veth link to another node, making two new interfaces.
            node1: first node
            node2: second node
@@ -334,7 +405,9 @@ def __init__( self, node1, node2, port1=None, port2=None,
            intfName1: node1 interface name (optional)
            intfName2: node2  interface name (optional)
            params1: parameters for interface 1
-           params2: parameters for interface 2"""
+           params2: parameters for interface 2
+           bulk: BulkBuilder to leave creating the veth pair and
+                 configuring the interfaces to (optional)"""
         # This is a bit awkward; it seems that having everything in
         # params would be more orthogonal, but being able to specify
         # in-line arguments is more convenient!
@@ -347,7 +420,14 @@ def __init__( self, node1, node2, port1=None, port2=None,
         if not intfName2:
             intfName2 = self.intfName( node2, port2 )
 
-        self.makeIntfPair( intfName1, intfName2 )
+        # A link type with its own makeIntfPair() can't be built in bulk
+        if ( bulk is not None and type( self ).makeIntfPair.im_func is
+             Link.makeIntfPair.im_func ):
+            self.bulk = bulk
+            bulk.addPair( intfName1, node1, intfName2, node2 )
+        else:
+            self.bulk = None
+            self.makeIntfPair( intfName1, intfName2 )
 
         if not cls1:
             cls1 = intf
@@ -391,9 +471,10 @@ def __str__( self ):
 class TCLink( Link ):
     "Link with symmetric TC interfaces configured via opts"
     def __init__( self, node1, node2, port1=None, port2=None,
-                  intfName1=None, intfName2=None, **params ):
+                  intfName1=None, intfName2=None, bulk=None, **params ):
         Link.__init__( self, node1, node2, port1=port1, port2=port2,
                        intfName1=intfName1, intfName2=intfName2,
+                       bulk=bulk,
                        cls1=TCIntf,
                        cls2=TCIntf,
                        params1=params,
@@ -89,16 +89,22 @@
 import os
 import re
 import select
+import random
 import signal
-from time import sleep
-from itertools import chain
+from time import sleep, time
+from subprocess import STDOUT
+from itertools import chain, groupby
 
 from cli import CLI
 from log import info, error, debug, output
 from node import Host, OVSKernelSwitch, Controller
 from node import EE, NetconfAgent, RemoteSwitch, Node
 from link import Link, Intf
-from util import quietRun, fixLimits, numCores, ensureRoot
+from bulk import BulkBuilder
+from cgroup import ResourceSampler
+from cmdpool import CmdPool
+from util import quietRun, fixLimits, numCores, ensureRoot, PhaseTimer
+from util import parallelMap, prun, pmonitor
 from util import macColonHex, ipStr, ipParse, netParse, ipAdd
 from term import cleanUpScreens, makeTerms
 from clickgui import makeClickys
@@ -115,7 +121,8 @@ def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
                   build=True, xterms=False, cleanup=False, ipBase='10.0.0.0/8',
                   inNamespace=False,
                   autoSetMacs=False, autoStaticArp=False, autoPinCpus=False,
-                  listenPort=None ):
+                  listenPort=None, batchStartup=False, bulkBuild=False,
+                  maxThreads=16 ):
         """Create Mininet object.
            topo: Topo (topology) object or None
            switch: default Switch class
@@ -135,7 +142,12 @@ def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
            autoStaticArp: set all-pairs static MAC addrs?
            autoPinCpus: pin hosts to (real) cores (requires CPULimitedHost)?
            listenPort: base listening port to open; will be incremented for
-               each additional switch in the net if inNamespace=False"""
+               each additional switch in the net if inNamespace=False
+           batchStartup: start switches of classes which support it
+               (e.g., OVS) together rather than one by one?
+           bulkBuild: build links in bulk (see BulkBuilder) and configure
+               hosts and EEs in parallel?
+           maxThreads: most nodes to configure at once if bulkBuild"""
         self.topo = topo
         self.switch = switch
         self.agent = agent
@@ -157,6 +169,11 @@ def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
         self.numCores = numCores()
         self.nextCore = 0  # next core for pinning hosts to CPUs
         self.listenPort = listenPort
+        self.batchStartup = batchStartup
+        self.startTimes = []  # ( phase, seconds ) of the last start()
+        self.maxThreads = maxThreads if bulkBuild else 1
+        self.bulk = BulkBuilder( maxThreads ) if bulkBuild else None
+        self.buildTimes = []  # ( phase, seconds ) of build()
 
         self.hosts = []
         self.ees = []
@@ -357,54 +374,102 @@ def addLink( self, node1, node2, port1=None, port2=None,
         defaults.update( params )
         if not cls:
             cls = self.link
+        # Until we're built, links we know how to build in bulk are left
+        # to the BulkBuilder
+        linkCls = getattr( cls, 'cls', cls )
+        if ( self.bulk and not self.built and isinstance( linkCls, type )
+             and issubclass( linkCls, Link ) ):
+            defaults.setdefault( 'bulk', self.bulk )
         return cls( node1, node2, **defaults )
 
     def configHosts( self ):
         "Configure a set of hosts."
-        for host in self.hosts:
-            info( host.name + ' ' )
-            intf = host.defaultIntf()
-            if intf:
-                host.configDefault()
-            else:
-                # Don't configure nonexistent intf
-                host.configDefault( ip=None, mac=None )
-            # You're low priority, dude!
-            # BL: do we want to do this here or not?
-            # May not make sense if we have CPU lmiting...
-            # quietRun( 'renice +18 -p ' + repr( host.pid ) )
-            # This may not be the right place to do this, but
-            # it needs to be done somewhere.
-            host.cmd( 'ifconfig lo up' )
+        self.configNodes( self.hosts, self.configHost, [ 'ifconfig lo up' ] )
         info( '\n' )
 
+    def configNodes( self, nodes, configNode, moreCmds ):
+        """Configure nodes one at a time, or if bulkBuild, all at once:
+           each node whose config() can be sent as commands (see
+           Node.configCmds()) gets them (and moreCmds) in a single round
+           trip, through a CmdPool, and the others are configured in
+           parallel.
+           configNode: function which configures a node
+           moreCmds: commands configNode runs after configDefault()"""
+        if self.bulk is None:
+            for node in nodes:
+                configNode( node )
+            return
+        pool = CmdPool()
+        others = []
+        for node in nodes:
+            # Only if the class whose config() we'd call has configCmds()
+            cls = [ c for c in type( node ).__mro__
+                    if 'config' in c.__dict__ ][ 0 ]
+            cmds = None
+            if 'configCmds' in cls.__dict__:
+                if not node.defaultIntf():
+                    # Don't configure nonexistent intf
+                    node.params.update( ip=None, mac=None )
+                cmds = node.configCmds( **node.params )
+            if cmds is None:
+                others.append( node )
+                continue
+            info( node.name + ' ' )
+            pool.submitCmds( node, cmds + moreCmds )
+        pool.close()
+        parallelMap( configNode, others, self.maxThreads )
+
+    def configHost( self, host ):
+        "Configure a host."
+        info( host.name + ' ' )
+        intf = host.defaultIntf()
+        if intf:
+            host.configDefault()
+        else:
+            # Don't configure nonexistent intf
+            host.configDefault( ip=None, mac=None )
+        # You're low priority, dude!
+        # BL: do we want to do this here or not?
+        # May not make sense if we have CPU lmiting...
+        # quietRun( 'renice +18 -p ' + repr( host.pid ) )
+        # This may not be the right place to do this, but
+        # it needs to be done somewhere.
+        host.cmd( 'ifconfig lo up' )
+
     def configEEs( self ):
         "Configure a set of execution envirements."
-        for ee in self.ees:
-            info( ee.name + ' ' )
-            intf = ee.defaultIntf()
-            if intf:
-                ee.configDefault()
-            else:
-                # Don't configure nonexistent intf
-                ee.configDefault( ip=None, mac=None )
-            # You're low priority, dude!
-            # BL: do we want to do this here or not?
-            # May not make sense if we have CPU lmiting...
-            # quietRun( 'renice +18 -p ' + repr( vnf.pid ) )
-            # This may not be the right place to do this, but
-            # it needs to be done somewhere.
-            ee.cmd( 'ifconfig lo up' )
-            ee.cmd( 'echo 0 > /proc/sys/net/ipv4/icmp_echo_ignore_broadcasts' )
-            #ee.start()
+        self.configNodes( self.ees, self.configEE, [
+            'ifconfig lo up',
+            'echo 0 > /proc/sys/net/ipv4/icmp_echo_ignore_broadcasts' ] )
         info( '\n' )
 
+    def configEE( self, ee ):
+        "Configure an execution envirement."
+        info( ee.name + ' ' )
+        intf = ee.defaultIntf()
+        if intf:
+            ee.configDefault()
+        else:
+            # Don't configure nonexistent intf
+            ee.configDefault( ip=None, mac=None )
+        # You're low priority, dude!
+        # BL: do we want to do this here or not?
+        # May not make sense if we have CPU lmiting...
+        # quietRun( 'renice +18 -p ' + repr( vnf.pid ) )
+        # This may not be the right place to do this, but
+        # it needs to be done somewhere.
+        ee.cmd( 'ifconfig lo up' )
+        ee.cmd( 'echo 0 > /proc/sys/net/ipv4/icmp_echo_ignore_broadcasts' )
+        #ee.start()
+
     def startVNFs( self ):
-        "Start VNFs."
+        "Start VNFs (all at once)."
         info( 'Starting' )
+        pool = CmdPool()
         for ee in self.ees:
             info( ' ' + ee.name )
-            ee.startVNF()
+            ee.startVNF( pool )
+        pool.close()
         info( '\n' )
 
     def stopVNFs( self ):
@@ -416,13 +481,21 @@ def stopVNFs( self ):
         info( '\n' )
 
     def restartVNFs( self ):
-        "Restart VNFs."
+        "Restart VNFs (all at once)."
         info( 'Restarting' )
+        pool = CmdPool()
         for ee in self.ees:
             info( ' ' + ee.name )
-            ee.restartVNF()
+            ee.stopVNF()
+            ee.startVNF( pool )
+        pool.close()
         info( '\n' )
 
+    def resourceSampler( self ):
+        """Return a ResourceSampler for our EEs
+           (each user should have its own)"""
+        return ResourceSampler( self.ees )
+
     def configAgents( self ):
         "Configure a set of agents."
         # for agt in self.agents:
@@ -498,23 +571,33 @@ def configureControlNetwork( self ):
 
     def build( self ):
         "Build mininet."
+        timer = PhaseTimer()
         if self.topo:
-            self.buildFromTopo( self.topo )
+            with timer.phase( 'topology' ):
+                self.buildFromTopo( self.topo )
+        if self.bulk:
+            self.bulk.build( timer )
         if ( self.inNamespace ):
-            self.configureControlNetwork()
+            with timer.phase( 'control network' ):
+                self.configureControlNetwork()
         info( '*** Configuring hosts\n' )
-        self.configHosts()
+        with timer.phase( 'hosts' ):
+            self.configHosts()
         if self.ees:
             info( '*** Configuring EEs\n' )
-            self.configEEs()
+            with timer.phase( 'EEs' ):
+                self.configEEs()
         if self.agents:
             info( '*** Configuring agents\n' )
             self.configAgents()
         if self.xterms:
             self.startTerms()
         if self.autoStaticArp:
-            self.staticArp()
+            with timer.phase( 'static ARP' ):
+                self.staticArp()
         self.built = True
+        self.buildTimes = timer.times
+        info( '*** Built in %.3fs (%s)\n' % ( timer.total(), timer ) )
 
     def startTerms( self ):
         "Start a terminal for each node."
@@ -566,27 +649,56 @@ def start( self ):
         "Start controller and switches and agents."
         if not self.built:
             self.build()
+        timer = PhaseTimer()
         info( '*** Starting controller\n' )
-        for controller in self.controllers:
-            controller.start()
+        with timer.phase( 'controllers' ):
+            for controller in self.controllers:
+                controller.start()
         info( '*** Starting %s switches\n' % len( self.switches ) )
-        for switch in self.switches:
-            info( switch.name + ' ')
-            switch.start( self.controllers )
+        with timer.phase( 'switches' ):
+            self.startSwitches()
         if self.agents:
             info( '\n' )
             info( '*** Starting %s agents\n' % len( self.agents ) )
-        for agt in self.agents:
-            info( agt.name + ' ')
-            agt.start()
+        with timer.phase( 'agents' ):
+            for agt in self.agents:
+                info( agt.name + ' ')
+                agt.start()
         info( '\n' )
 
         if self.ees:
             info( '*** Setting up control network for EEs\n' )
-            self.configureSwitchedControlNetwork( )
+            with timer.phase( 'EE control network' ):
+                self.configureSwitchedControlNetwork( )
 
             info( '*** Starting VNFs\n')
-            self.startVNFs()
+            with timer.phase( 'VNFs' ):
+                self.startVNFs()
+        self.startTimes = timer.times
+        info( '*** Started in %.3fs (%s)\n' % ( timer.total(), timer ) )
+
+    def startSwitches( self ):
+        """Start the switches, each class's together if it supports
+           batchStartup() (and batchStartable() is true for it) and
+           batchStartup is set"""
+        if not self.batchStartup:
+            for switch in self.switches:
+                info( switch.name + ' ')
+                switch.start( self.controllers )
+            return
+        # Keep the original order within each class
+        order = {}
+        for switch in self.switches:
+            order.setdefault( type( switch ), len( order ) )
+        switches = sorted( self.switches, key=lambda s: order[ type( s ) ] )
+        for cls, group in groupby( switches, type ):
+            group = list( group )
+            info( ' '.join( s.name for s in group ) + ' ' )
+            if hasattr( cls, 'batchStartup' ) and cls.batchStartable():
+                cls.batchStartup( group, self.controllers )
+            else:
+                for switch in group:
+                    switch.start( self.controllers )
 
     def stop( self ):
         "Stop the controller(s), switches and hosts"
@@ -678,36 +790,86 @@ def _parsePing( pingOutput ):
         sent, received = int( m.group( 1 ) ), int( m.group( 2 ) )
         return sent, received
 
-    def ping( self, hosts=None, timeout=None ):
-        """Ping between all specified hosts.
+    @staticmethod
+    def hostPairs( hosts, sample=None, seed=None ):
+        """Return ordered pairs of different hosts, by source host
+           hosts: list of hosts
+           sample: number of pairs to pick at random (default: all)
+           seed: random seed for picking the sample"""
+        pairs = [ ( src, dst ) for src in hosts for dst in hosts
+                  if src != dst ]
+        if sample is not None and sample < len( pairs ):
+            picked = random.Random( seed ).sample( range( len( pairs ) ),
+                                                   sample )
+            pairs = [ pairs[ i ] for i in sorted( picked ) ]
+        return pairs
+
+    def pingPairs( self, pairs, timeout=None, count=1, maxProcs=64 ):
+        """Ping between pairs of hosts concurrently
+           pairs: list of ( src, dst ) hosts
+           timeout: time to wait for a response, as string
+           count: number of pings per pair
+           maxProcs: most pings to run at once
+           yields: src, dst, ping output as each pair's ping finishes"""
+        opts = ( '-W %s' % timeout ) if timeout else ''
+        jobs = ( ( ( src, dst ), src,
+                   'ping -c%d %s %s' % ( count, opts, dst.IP() ) )
+                 for src, dst in pairs )
+        for ( src, dst ), result in prun( jobs, maxProcs ):
+            yield src, dst, result
+
+    def _pingAll( self, hosts, timeout, sample, maxProcs, parse ):
+        """Ping between hosts concurrently, outputting a row of results
+           per source host (in order) as soon as its pings are done
+           parse: function which parses ping output into a tuple
+                  ( sent, received, ... )
+           returns: list of ( src, dst, parsed ping output )"""
+        if not hosts:
+            hosts = self.hosts
+            output( '*** Ping: testing ping reachability\n' )
+        pairs = self.hostPairs( hosts, sample )
+        rows = []  # ( src, [ dst ] ), in order
+        for src, dst in pairs:
+            if not rows or rows[ -1 ][ 0 ] != src:
+                rows.append( ( src, [] ) )
+            rows[ -1 ][ 1 ].append( dst )
+        left = dict( ( src, len( dsts ) ) for src, dsts in rows )
+        results = {}
+        for src, dst, result in self.pingPairs( pairs, timeout,
+                                                maxProcs=maxProcs ):
+            results[ ( src, dst ) ] = parse( result ), result
+            left[ src ] -= 1
+            while rows and not left[ rows[ 0 ][ 0 ] ]:
+                node, dsts = rows.pop( 0 )
+                output( '%s -> ' % node.name )
+                for dest in dsts:
+                    received = results[ ( node, dest ) ][ 0 ][ 1 ]
+                    output( ( '%s ' % dest.name ) if received else 'X ' )
+                output( '\n' )
+        return [ ( src, dst ) + results[ ( src, dst ) ]
+                 for src, dst in pairs ]
+
+    def ping( self, hosts=None, timeout=None, sample=None, maxProcs=64 ):
+        """Ping between all specified hosts (concurrently).
            hosts: list of hosts
            timeout: time to wait for a response, as string
+           sample: number of host pairs to ping (default: all of them)
+           maxProcs: most pings to run at once
            returns: ploss packet loss percentage"""
         # should we check if running?
         packets = 0
         lost = 0
         ploss = None
-        if not hosts:
-            hosts = self.hosts
-            output( '*** Ping: testing ping reachability\n' )
-        for node in hosts:
-            output( '%s -> ' % node.name )
-            for dest in hosts:
-                if node != dest:
-                    opts = ''
-                    if timeout:
-                        opts = '-W %s' % timeout
-                    result = node.cmd( 'ping -c1 %s %s' % (opts, dest.IP()) )
-                    sent, received = self._parsePing( result )
-                    packets += sent
-                    if received > sent:
-                        error( '*** Error: received too many packets' )
-                        error( '%s' % result )
-                        node.cmdPrint( 'route' )
-                        exit( 1 )
-                    lost += sent - received
-                    output( ( '%s ' % dest.name ) if received else 'X ' )
-            output( '\n' )
+        results = self._pingAll( hosts, timeout, sample, maxProcs,
+                                 self._parsePing )
+        for node, _dest, ( sent, received ), result in results:
+            packets += sent
+            if received > sent:
+                error( '*** Error: received too many packets' )
+                error( '%s' % result )
+                node.cmdPrint( 'route' )
+                exit( 1 )
+            lost += sent - received
         if packets > 0:
             ploss = 100 * lost / packets
             received = packets - lost
@@ -747,30 +909,20 @@ def _parsePingFull( pingOutput ):
         rttdev = float( m.group( 4 ) )
         return sent, received, rttmin, rttavg, rttmax, rttdev
 
-    def pingFull( self, hosts=None, timeout=None ):
-        """Ping between all specified hosts and return all data.
+    def pingFull( self, hosts=None, timeout=None, sample=None,
+                  maxProcs=64 ):
+        """Ping between all specified hosts (concurrently) and return
+           all data.
            hosts: list of hosts
            timeout: time to wait for a response, as string
+           sample: number of host pairs to ping (default: all of them)
+           maxProcs: most pings to run at once
            returns: all ping data; see function body."""
         # should we check if running?
         # Each value is a tuple: (src, dsd, [all ping outputs])
-        all_outputs = []
-        if not hosts:
-            hosts = self.hosts
-            output( '*** Ping: testing ping reachability\n' )
-        for node in hosts:
-            output( '%s -> ' % node.name )
-            for dest in hosts:
-                if node != dest:
-                    opts = ''
-                    if timeout:
-                        opts = '-W %s' % timeout
-                    result = node.cmd( 'ping -c1 %s %s' % (opts, dest.IP()) )
-                    outputs = self._parsePingFull( result )
-                    sent, received, rttmin, rttavg, rttmax, rttdev = outputs
-                    all_outputs.append( (node, dest, outputs) )
-                    output( ( '%s ' % dest.name ) if received else 'X ' )
-            output( '\n' )
+        all_outputs = [ ( node, dest, outputs ) for node, dest, outputs, _r
+                        in self._pingAll( hosts, timeout, sample, maxProcs,
+                                          self._parsePingFull ) ]
         output( "*** Results: \n" )
         for outputs in all_outputs:
             src, dest, ping_outputs = outputs
@@ -862,6 +1014,64 @@ def iperf( self, hosts=None, l4Type='TCP', udpBw='10M' ):
         output( '*** Results: %s\n' % result )
         return result
 
+    def iperfMatrix( self, hosts=None, sample=None, pairs=None,
+                     l4Type='TCP', udpBw='10M', seconds=5, maxProcs=16,
+                     port=5001 ):
+        """Run iperf between many pairs of hosts concurrently.
+           hosts: list of hosts (default: all hosts)
+           sample: number of host pairs to test (default: all of them)
+           pairs: list of ( client, server ) hosts to test instead
+           l4Type: string, one of [ TCP, UDP ]
+           seconds: duration of each test
+           maxProcs: most tests to run at once
+           port: port for the iperf servers
+           returns: dict of ( client, server ): client speed string"""
+        if l4Type not in ( 'TCP', 'UDP' ):
+            raise Exception( 'Unexpected l4 type: %s' % l4Type )
+        if pairs is None:
+            pairs = self.hostPairs( hosts or self.hosts, sample )
+        output( '*** Iperf: testing %s bandwidth between %d pairs of hosts\n'
+                % ( l4Type, len( pairs ) ) )
+        iperfArgs = 'iperf -p %d ' % port
+        bwArgs = ''
+        if l4Type == 'UDP':
+            iperfArgs += '-u '
+            bwArgs = '-b ' + udpBw + ' '
+        # Start a server on each host which is tested against, and wait
+        # until they're all listening
+        servers = {}
+        for _client, server in pairs:
+            if server not in servers:
+                servers[ server ] = server.popen( iperfArgs + '-s',
+                                                  stderr=STDOUT )
+        waiting = set( servers )
+        deadline = time() + 10
+        for server, line in pmonitor( dict( servers ) ):
+            if server is not None and 'listening' in line:
+                waiting.discard( server )
+            if not waiting or time() > deadline:
+                break
+        if waiting:
+            error( '*** Error: iperf servers did not start on %s\n' %
+                   ' '.join( sorted( s.name for s in waiting ) ) )
+        jobs = ( ( ( client, server ), client,
+                   iperfArgs + '-t %d -c %s %s' % ( seconds, server.IP(),
+                                                     bwArgs ) )
+                 for client, server in pairs if server not in waiting )
+        results = {}
+        try:
+            for ( client, server ), cliout in prun( jobs, maxProcs,
+                                                    timeout=seconds + 10 ):
+                debug( 'Client output: %s\n' % cliout )
+                results[ ( client, server ) ] = self._parseIperf( cliout )
+                output( ' %s->%s: %s\n' % ( client, server,
+                                           results[ ( client, server ) ] ) )
+        finally:
+            for popen in servers.values():
+                popen.kill()
+                popen.wait()
+        return results
+
     def runCpuLimitTest( self, cpu, duration=5 ):
         """run CPU limit test with 'while true' processes.
         cpu: desired CPU fraction of each host
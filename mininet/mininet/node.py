@@ -57,6 +57,7 @@
                            numCores, retry, mountCgroups )
 from mininet.moduledeps import moduleDeps, pathCheck, OVS_KMOD, OF_KMOD, TUN
 from mininet.link import Link, Intf, TCIntf
+from mininet.cgroup import Cgroup
 from mininet.vnfcatalog import Catalog
 import inspect
 import jinja2
@@ -252,7 +253,7 @@ def monitor( self, timeoutms=None ):
            Set self.waiting to False if command has completed.
            timeoutms: timeout in ms or None to wait indefinitely."""
         self.waitReadable( timeoutms )
-        data = self.read( 1024 )
+        data = self.read( 65536 )
         # Look for PID
         marker = chr( 1 ) + r'\d+\n'
         if chr( 1 ) in data:
@@ -297,6 +298,34 @@ def cmdPrint( self, *args):
            cmd: string"""
         return self.cmd( *args, **{ 'verbose': True } )
 
+    # Separates the outputs of commands sent with sendCmds()
+    cmdSeparator = chr( 30 )
+
+    def sendCmds( self, cmds ):
+        """Send several commands in one go, like sendCmd(); their
+           outputs will be separated by cmdSeparator
+           cmds: list of command strings"""
+        sep = 'printf "\\%03o"' % ord( self.cmdSeparator )
+        self.sendCmd( '\n'.join( '%s\n%s' % ( c, sep ) for c in cmds ),
+                      printPid=False )
+
+    def splitOutputs( self, output, count ):
+        """Split the output of commands sent with sendCmds()
+           output: their output
+           count: number of commands
+           returns: list of their outputs"""
+        return output.split( self.cmdSeparator )[ :count ]
+
+    def cmds( self, cmds, verbose=False ):
+        """Run several commands in one round trip to our shell,
+           rather than one round trip each as with cmd().
+           cmds: list of command strings
+           returns: list of their outputs"""
+        log = info if verbose else debug
+        log( '*** %s : %s\n' % ( self.name, cmds ) )
+        self.sendCmds( cmds )
+        return self.splitOutputs( self.waitOutput( verbose ), len( cmds ) )
+
     def popen( self, *args, **kwargs ):
         """Return a Popen() object in our namespace
            args: Popen() args, single list, or string
@@ -348,10 +377,11 @@ def newPort( self ):
             return max( self.ports.values() ) + 1
         return self.portBase
 
-    def addIntf( self, intf, port=None ):
+    def addIntf( self, intf, port=None, move=True ):
         """Add an interface.
            intf: interface
-           port: port number (optional, typically OpenFlow port number)"""
+           port: port number (optional, typically OpenFlow port number)
+           move: move intf into our namespace (if we have one)?"""
         if port is None:
             port = self.newPort()
         self.intfs[ port ] = intf
@@ -359,7 +389,7 @@ def addIntf( self, intf, port=None ):
         self.nameToIntf[ intf.name ] = intf
         debug( '\n' )
         debug( 'added intf %s:%d to node %s\n' % ( intf, port, self.name ) )
-        if self.inNamespace:
+        if self.inNamespace and move:
             debug( 'moving', intf, 'into namespace for', self.name, '\n' )
             moveIntf( intf.name, self )
 
@@ -516,6 +546,37 @@ def config( self, mac=None, ip=None,
         self.cmd( 'ifconfig lo ' + lo )
         return r
 
+    def configCmds( self, mac=None, ip=None,
+                    defaultRoute=None, lo='up', **_params ):
+        """Return the commands config() would run with these parameters,
+           to be run later (e.g. all at once with cmds()), and record the
+           addresses they set; or None if config() must be called instead.
+           Subclasses which override config() should override this
+           method to match, if they can"""
+        for value in mac, ip, defaultRoute:
+            if value is not None and not isinstance( value, str ):
+                return None
+        cmds = []
+        if mac is not None:
+            intf = self.intf()
+            intf.mac = mac
+            cmds += [ 'ifconfig %s down' % intf,
+                      'ifconfig %s hw ether %s' % ( intf, mac ),
+                      'ifconfig %s up' % intf ]
+        if ip is not None:
+            intf = self.intf()
+            if '/' not in ip:
+                ip = '%s/%s' % ( ip, 8 )
+            intf.ip, intf.prefixLen = ip.split( '/' )
+            cmds.append( 'ifconfig %s %s up' % ( intf, ip ) )
+        if defaultRoute is not None:
+            if ' ' not in defaultRoute:
+                defaultRoute = 'dev %s' % defaultRoute
+            cmds += [ 'ip route del default',
+                      'ip route add default %s' % defaultRoute ]
+        cmds.append( 'ifconfig lo ' + lo )
+        return cmds
+
     def configDefault( self, **moreParams ):
         "Configure with default parameters"
         self.params.update( moreParams )
@@ -586,6 +647,8 @@ def __init__( self, name, sched='cfs', **kwargs ):
         # We don't add ourselves to a cpuset because you must
         # specify the cpu and memory placement first
         errFail( 'cgclassify -g cpu,cpuacct,memory,blkio:/%s %s' % ( self.name, self.pid ) )
+        # Read and write our cgroup's files directly
+        self.cgroupFs = Cgroup( self.name )
         # BL: Setting the correct period/quota is tricky, particularly
         # for RT. RT allows very small quotas, but the overhead
         # seems to be high. CFS has a mininimum quota of 1 ms, but
@@ -596,40 +659,36 @@ def __init__( self, name, sched='cfs', **kwargs ):
 
     def cgroupSet( self, param, value, resource='cpu' ):
         "Set a cgroup parameter and return its value"
-        cmd = 'cgset -r %s.%s=%s /%s' % (
-            resource, param, value, self.name )
-        quietRun( cmd )
-        nvalue = int( self.cgroupGet( param, resource ) )
-        if nvalue != value:
+        self.cgroupFs.set( resource, param, value )
+        nvalue = self.cgroupGet( param, resource )
+        if str( nvalue ) != str( value ):
             error( '*** error: cgroupSet: %s set to %s instead of %s\n'
                    % ( param, nvalue, value ) )
         return nvalue
 
     def cgroupGet( self, param, resource='cpu' ):
         "Return value of cgroup parameter"
-        cmd = 'cgget -r %s.%s /%s' % (
-            resource, param, self.name )
-        return int( quietRun( cmd ).split()[ -1 ] )
+        value = self.cgroupFs.get( resource, param )
+        try:
+            return int( value )
+        except ValueError:
+            # e.g. cpuset.cpus
+            return value
 
     def cGetCpuUsage( self, param='stat', resource='cpuacct' ):
         "Get CPU usage in USER_HZ for the host"
-        cmd = 'cgget -r %s.%s /%s' % (
-            resource, param, self.name )
-        cgetresult = quietRun( cmd ).split()
+        cgetresult = self.cgroupFs.read( resource, param ).split()
         host_usage = int( cgetresult[ -1 ] ) + int( cgetresult[ -3 ] )
         return host_usage
 
     def cGetMemUsage( self, param='usage_in_bytes', resource='memory' ):
         "Get memory usage for the host"
-        cmd = 'cgget -r %s.%s /%s' % (
-            resource, param, self.name )
-        cgetresult = quietRun( cmd ).split()
-        host_usage = int( cgetresult[ -1 ] )/1024
-        return host_usage
+        return int( self.cgroupFs.get( resource, param ) )/1024
 
     def cgroupDel( self ):
         "Clean up our cgroup"
         # info( '*** deleting cgroup', self.cgroup, '\n' )
+        self.cgroupFs.close()
         _out, _err, exitcode = errRun( 'cgdelete -r ' + self.cgroup )
         return exitcode != 0
 
@@ -740,6 +799,16 @@ def config( self, cpu=None, cores=None, **params ):
         self.setParam( r, 'setCPUs', cores=cores )
         return r
 
+    def configCmds( self, cpu=None, cores=None, **params ):
+        """Return Node.configCmds(); our CPU parameters don't need our
+           shell, so they're set right away"""
+        cmds = Node.configCmds( self, **params )
+        if cmds is not None:
+            r = {}
+            self.setParam( r, 'setCPUFrac', cpu=cpu )
+            self.setParam( r, 'setCPUs', cores=cores )
+        return cmds
+
     inited = False
 
     @classmethod
@@ -767,14 +836,24 @@ def setVNF ( self, startCmd=None, vnf_name=None, **kw ):
 
         self.startCmd = Catalog().make_cmd(vnf_name, **kw)
 
-    def startVNF ( self ):
-        "Start VNF."
+    def startVNF ( self, pool=None ):
+        """Start VNF.
+           pool: CmdPool to start it with (returns its CmdFuture), or
+                 None to wait until it has started"""
+        if pool is not None and getattr( self, 'startCmd', None ):
+            future = pool.submit( self, self.startCmd )
+            future.addCallback( self._vnfStarted )
+            return future
         try:
             self.cmd( self.startCmd )
         except AttributeError:
             info( "can't start %s" % self.name )
         self.vnfPid = self.lastPid
 
+    def _vnfStarted( self, future ):
+        "Internal method: note the PID of a VNF started with a CmdPool"
+        self.vnfPid = future.pid
+
     def stopVNF ( self, sig=signal.SIGINT ):
         "Interrupt running VNF."
         if getattr(self, 'vnfPid', None) and self.vnfPid:
@@ -1027,6 +1106,12 @@ def __init__( self, name, failMode='secure', datapath='kernel', **params ):
         Switch.__init__( self, name, **params )
         self.failMode = failMode
         self.datapath = datapath
+        # Set by batchStartup() once our bridge has been created
+        self.batchStarted = False
+
+    # Longest ovs-vsctl command line batchStartup() builds (well under
+    # ARG_MAX, which is at least 128 KB on Linux)
+    argmax = 128000
 
     @classmethod
     def setup( cls ):
@@ -1087,11 +1172,102 @@ def connected( self ):
                     for uuid in self.controllerUUIDs() ]
         return reduce( or_, results, False )
 
+    def vsctlCommands( self, controllers ):
+        """Return the ovs-vsctl commands (as lists of arguments, each
+           starting with '--') which set up our bridge, its ports and
+           its controllers in a single transaction"""
+        int( self.dpid, 16 ) # DPID must be a hex string
+        name = self.name
+        cmds = [ [ '--', '--if-exists', 'del-br', name ],
+                 [ '--', 'add-br', name ] ]
+        if self.datapath == 'user':
+            cmds.append( [ '--', 'set', 'Bridge', name,
+                           'datapath_type=netdev' ] )
+        cmds.append( [ '--', 'set', 'Bridge', name,
+                       'other_config:datapath-id=' + self.dpid ] )
+        cmds.append( [ '--', 'set-fail-mode', name, self.failMode ] )
+        for intf in self.intfList():
+            if not intf.IP():
+                cmds.append( [ '--', 'add-port', name, str( intf ) ] )
+        # Create the controller records here (rather than with
+        # set-controller) so they get a short max_backoff right away
+        targets = [ 'tcp:%s:%d' % ( c.IP(), c.port ) for c in controllers ]
+        if self.listenPort:
+            targets.append( 'ptcp:%s' % self.listenPort )
+        ids = []
+        for i, target in enumerate( targets ):
+            cid = '@%sc%d' % ( name, i )
+            ids.append( cid )
+            cmds.append( [ '--', '--id=' + cid, 'create', 'Controller',
+                           'target="%s"' % target,
+                           # Reconnect quickly (1s vs. 15s max_backoff)
+                           'max_backoff=1000' ] )
+        cmds.append( [ '--', 'set', 'Bridge', name,
+                       'controller=[%s]' % ','.join( ids ) ] )
+        return cmds
+
+    @classmethod
+    def batchStartable( cls ):
+        """Can batchStartup() start switches of this class?
+           Not if the class overrides start(), which may do its own
+           set-up (e.g., pick its own controllers); such a class can
+           override this to return True if its start() still works
+           after batchStartup()"""
+        return cls.start.__func__ is OVSSwitch.start.__func__
+
+    @classmethod
+    def batchStartup( cls, switches, controllers, run=errRun ):
+        """Start up OVS switches together: the bridges, ports and
+           controllers of all of them are set up with as few ovs-vsctl
+           transactions as ARG_MAX allows (usually one), after which
+           each switch's start() just finishes its own set-up.
+           switches: switches to start
+           controllers: controllers to connect them to
+           run: function to run commands (errRun)"""
+        for switch in switches:
+            if switch.inNamespace:
+                raise Exception(
+                    'OVS kernel switch does not work in a namespace' )
+        cmd, length = [ 'ovs-vsctl' ], 0
+        for switch in switches:
+            # A switch's commands refer to each other (by --id), so they
+            # have to stay in the same transaction
+            args = sum( switch.vsctlCommands( controllers ), [] )
+            size = sum( len( arg ) + 1 for arg in args )
+            if len( cmd ) > 1 and length + size > cls.argmax:
+                cls._runVsctl( cmd, run )
+                cmd, length = [ 'ovs-vsctl' ], 0
+            cmd += args
+            length += size
+        if len( cmd ) > 1:
+            cls._runVsctl( cmd, run )
+        for switch in switches:
+            switch.batchStarted = True
+            switch.start( controllers )
+
+    @staticmethod
+    def _runVsctl( cmd, run ):
+        "Run an ovs-vsctl transaction, complaining if it fails"
+        out, err, exitcode = run( *cmd )
+        if exitcode:
+            error( '*** ovs-vsctl exited with code %d:\n%s%s' %
+                   ( exitcode, out, err ) )
+
     def start( self, controllers ):
         "Start up a new OVS OpenFlow switch using ovs-vsctl"
         if self.inNamespace:
             raise Exception(
                 'OVS kernel switch does not work in a namespace' )
+        if self.batchStarted:
+            # batchStartup() has already done the ovs-vsctl part
+            self.batchStarted = False
+            intfs = [ intf for intf in self.intfList() if not intf.IP() ]
+            if intfs:
+                self.cmd( '; '.join( 'ifconfig %s up' % intf
+                                     for intf in intfs ) )
+            for intf in intfs:
+                self.TCReapply( intf )
+            return
         # We should probably call config instead, but this
         # requires some rethinking...
         self.cmd( 'ifconfig lo up' )
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test the ovs-vsctl transactions of OVSSwitch.batchStartup()
+   (with stubbed commands, so no switches are actually started)."""
+
+import unittest
+
+from mininet.node import OVSSwitch
+
+
+class StubOVSSwitch( OVSSwitch ):
+    "OVSSwitch without a shell, which records the commands it would run"
+
+    isSetup = True
+
+    def startShell( self, *args, **kwargs ):
+        "Don't start a shell"
+        self.cmds = []
+
+    def cmd( self, *args, **kwargs ):
+        "Record a command (for lo, pretend we got its address)"
+        self.cmds.append( ' '.join( str( arg ) for arg in args ) )
+        return 'inet addr:127.0.0.1' if 'lo' in args else ''
+
+
+class StubIntf( object ):
+    "Data port (without an IP address)"
+
+    def __init__( self, name ):
+        self.name = name
+
+    def IP( self ):
+        "No IP address"
+        return None
+
+    def __str__( self ):
+        return self.name
+
+
+class StubController( object ):
+    "Controller at 127.0.0.1:port"
+
+    def __init__( self, port=6633 ):
+        self.port = port
+
+    def IP( self ):
+        "Our IP address"
+        return '127.0.0.1'
+
+
+def makeSwitch( name, ports=2, cls=StubOVSSwitch, **params ):
+    "Return a stub switch with data ports name-eth1 ..."
+    switch = cls( name, inNamespace=False, **params )
+    for port in range( 1, ports + 1 ):
+        switch.addIntf( StubIntf( '%s-eth%d' % ( name, port ) ),
+                        port=port, move=False )
+    return switch
+
+
+class testVsctlCommands( unittest.TestCase ):
+    "Test the ovs-vsctl commands which set up a switch"
+
+    def testCommands( self ):
+        "Bridge, ports and controllers in one transaction"
+        switch = makeSwitch( 's1', listenPort=6634, failMode='standalone' )
+        cmds = switch.vsctlCommands( [ StubController( 6633 ),
+                                       StubController( 6653 ) ] )
+        self.assertEqual( cmds, [
+            [ '--', '--if-exists', 'del-br', 's1' ],
+            [ '--', 'add-br', 's1' ],
+            [ '--', 'set', 'Bridge', 's1',
+              'other_config:datapath-id=0000000000000001' ],
+            [ '--', 'set-fail-mode', 's1', 'standalone' ],
+            [ '--', 'add-port', 's1', 's1-eth1' ],
+            [ '--', 'add-port', 's1', 's1-eth2' ],
+            [ '--', '--id=@s1c0', 'create', 'Controller',
+              'target="tcp:127.0.0.1:6633"', 'max_backoff=1000' ],
+            [ '--', '--id=@s1c1', 'create', 'Controller',
+              'target="tcp:127.0.0.1:6653"', 'max_backoff=1000' ],
+            [ '--', '--id=@s1c2', 'create', 'Controller',
+              'target="ptcp:6634"', 'max_backoff=1000' ],
+            [ '--', 'set', 'Bridge', 's1', 'controller=[@s1c0,@s1c1,@s1c2]' ]
+        ] )
+
+    def testUserDatapath( self ):
+        "User space switches get a netdev datapath"
+        switch = makeSwitch( 's2', ports=0, datapath='user' )
+        cmds = switch.vsctlCommands( [] )
+        self.assertTrue( [ '--', 'set', 'Bridge', 's2',
+                           'datapath_type=netdev' ] in cmds )
+        self.assertEqual( cmds[ -1 ],
+                          [ '--', 'set', 'Bridge', 's2', 'controller=[]' ] )
+
+
+class testBatchStartup( unittest.TestCase ):
+    "Test starting switches together"
+
+    def setUp( self ):
+        self.runs = []
+
+    def errRun( self, *cmd ):
+        "Stub for errRun()"
+        self.runs.append( list( cmd ) )
+        return '', '', 0
+
+    def testOneTransaction( self ):
+        "All switches are set up by one ovs-vsctl"
+        switches = [ makeSwitch( 's%d' % i ) for i in range( 1, 4 ) ]
+        controllers = [ StubController() ]
+        StubOVSSwitch.batchStartup( switches, controllers, run=self.errRun )
+        expected = [ 'ovs-vsctl' ]
+        for switch in switches:
+            expected += sum( switch.vsctlCommands( controllers ), [] )
+        self.assertEqual( self.runs, [ expected ] )
+        for switch in switches:
+            # start() only brought the ports up
+            self.assertFalse( switch.batchStarted )
+            self.assertFalse( [ c for c in switch.cmds if 'ovs-vsctl' in c ] )
+            self.assertTrue( 'ifconfig %s-eth1 up; ifconfig %s-eth2 up' %
+                             ( switch.name, switch.name ) in switch.cmds )
+
+    def testArgmax( self ):
+        "Long command lines are split between switches"
+        class ShortOVSSwitch( StubOVSSwitch ):
+            "Fits about two switches on a command line"
+            argmax = 800
+        switches = [ makeSwitch( 's%d' % i, cls=ShortOVSSwitch )
+                     for i in range( 1, 6 ) ]
+        ShortOVSSwitch.batchStartup( switches, [], run=self.errRun )
+        self.assertTrue( len( self.runs ) > 1 )
+        # Every switch's commands are all in one transaction
+        args = sum( [ cmd[ 1: ] for cmd in self.runs ], [] )
+        expected = sum( [ sum( s.vsctlCommands( [] ), [] )
+                          for s in switches ], [] )
+        self.assertEqual( args, expected )
+        for cmd in self.runs:
+            self.assertEqual( cmd[ 1:4 ], [ '--', '--if-exists', 'del-br' ] )
+
+    def testBatchStartable( self ):
+        "Classes which override start() are started one by one"
+        class ControllerSwitch( StubOVSSwitch ):
+            "Picks its own controllers"
+            def start( self, controllers ):
+                return StubOVSSwitch.start( self, controllers[ :1 ] )
+        class BatchSwitch( ControllerSwitch ):
+            "Says batchStartup() works for it"
+            @classmethod
+            def batchStartable( cls ):
+                return True
+        self.assertTrue( OVSSwitch.batchStartable() )
+        self.assertTrue( StubOVSSwitch.batchStartable() )
+        self.assertFalse( ControllerSwitch.batchStartable() )
+        self.assertTrue( BatchSwitch.batchStartable() )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test running several commands in one round trip (Node.cmds()) and
+   configuring nodes that way (Node.configCmds()), with stubbed shells."""
+
+import unittest
+from subprocess import Popen, PIPE
+
+from mininet.node import Host
+from mininet.link import Intf
+
+
+class StubHost( Host ):
+    "Host without a shell, which records the commands it would run"
+
+    isSetup = True
+
+    def startShell( self, *args, **kwargs ):
+        "Don't start a shell"
+        self.cmdLog = []
+        self.written = ''
+
+    def cmd( self, *args, **kwargs ):
+        "Record a command"
+        self.cmdLog.append( ' '.join( str( arg ) for arg in args ) )
+        return ''
+
+    def write( self, data ):
+        "Record what would be sent to our shell"
+        self.written += data
+
+
+def makeHost( name='h1' ):
+    "Return a stub host with interface name-eth0"
+    host = StubHost( name, inNamespace=False )
+    Intf( '%s-eth0' % name, node=host, port=0 )
+    host.cmdLog = []
+    return host
+
+
+class testSplitOutputs( unittest.TestCase ):
+    "Test separating the outputs of commands sent with sendCmds()"
+
+    def testSplit( self ):
+        "One output per command, including empty ones"
+        host = makeHost()
+        sep = host.cmdSeparator
+        output = 'a\n' + sep + sep + 'b\nc' + sep
+        self.assertEqual( host.splitOutputs( output, 3 ),
+                          [ 'a\n', '', 'b\nc' ] )
+
+    def testTrailingOutput( self ):
+        "Output after the last separator is not a command's"
+        host = makeHost()
+        sep = host.cmdSeparator
+        self.assertEqual( host.splitOutputs( 'a' + sep + 'junk', 1 ),
+                          [ 'a' ] )
+
+    def testShell( self ):
+        "sendCmds() output from a real shell splits into each command's"
+        host = makeHost()
+        cmds = [ 'echo a', 'printf "b\\nc"', 'true', 'echo d; echo e' ]
+        host.sendCmds( cmds )
+        shell = Popen( [ 'bash', '--norc' ], stdin=PIPE, stdout=PIPE )
+        output, _err = shell.communicate( host.written )
+        # waitOutput() would strip the sentinel
+        self.assertTrue( output.endswith( chr( 127 ) ) )
+        self.assertEqual( host.splitOutputs( output[ :-1 ], len( cmds ) ),
+                          [ 'a\n', 'b\nc', '', 'd\ne\n' ] )
+
+
+class testConfigCmds( unittest.TestCase ):
+    "Test that configCmds() returns what config() would run"
+
+    def check( self, **params ):
+        "config() and configCmds() agree for params"
+        configured, batched = makeHost(), makeHost()
+        configured.config( **params )
+        cmds = batched.configCmds( **params )
+        self.assertEqual( cmds, configured.cmdLog )
+        # configCmds() runs nothing itself, but records the same addresses
+        self.assertEqual( batched.cmdLog, [] )
+        self.assertEqual( batched.MAC(), configured.MAC() )
+        self.assertEqual( batched.IP(), configured.IP() )
+        self.assertEqual( batched.intf().prefixLen,
+                          configured.intf().prefixLen )
+
+    def testDefault( self ):
+        "No parameters: just lo"
+        self.check()
+
+    def testMAC( self ):
+        "MAC address"
+        self.check( mac='00:00:00:00:00:01' )
+
+    def testIP( self ):
+        "IP address, with and without prefix length"
+        self.check( ip='10.0.0.1' )
+        self.check( ip='10.0.0.1/24' )
+
+    def testDefaultRoute( self ):
+        "Default route by interface name or with parameters"
+        self.check( defaultRoute='h1-eth0' )
+        self.check( defaultRoute='dev h1-eth0 via 10.0.0.254' )
+
+    def testAll( self ):
+        "Everything at once, with lo down"
+        self.check( mac='00:00:00:00:00:01', ip='10.0.0.1/16',
+                    defaultRoute='h1-eth0', lo='down' )
+
+    def testUnsupported( self ):
+        "Parameters configCmds() can't handle need config()"
+        host = makeHost()
+        self.assertEqual( host.configCmds( ip=[ '10.0.0.1', 16 ] ), None )
+        self.assertEqual( host.cmdLog, [] )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,14 +2,17 @@
 
 from mininet.log import output, info, error, warn, debug
 
-from time import sleep
+from time import sleep, time
 from resource import getrlimit, setrlimit, RLIMIT_NPROC, RLIMIT_NOFILE
 from select import poll, POLLIN, POLLHUP
 from subprocess import call, check_call, Popen, PIPE, STDOUT
 import re
 from fcntl import fcntl, F_GETFL, F_SETFL
 from os import O_NONBLOCK
+from threading import Thread, Lock
+from tempfile import mkstemp
 import os
+import sys
 
 # Command execution support
 
@@ -145,6 +148,62 @@ def isShellBuiltin( cmd ):
 # live in the root namespace and thus do not have to be
 # explicitly moved.
 
+def runBatch( cmd, script, node=None ):
+    """Run a command which reads a script from a file (e.g.,
+       ip -batch), in node's shell or the root namespace
+       cmd: command and args (string), to which the file name is added
+       script: contents of the file
+       node: Node (or None for the root namespace)
+       returns: output (stdout and stderr)"""
+    fd, path = mkstemp( prefix='mn-batch-' )
+    try:
+        os.write( fd, script )
+        os.close( fd )
+        cmd = '%s %s' % ( cmd, path )
+        if node is not None:
+            return node.cmd( cmd + ' 2>&1', printPid=False )
+        return quietRun( cmd )
+    finally:
+        os.unlink( path )
+
+def parallelMap( fn, items, maxThreads=16 ):
+    """Call fn( item ) for each item, in up to maxThreads threads
+       (fn must be safe to call for different items at once, e.g.
+       because it only talks to one node)
+       returns: list of results, in the order of items
+       raises: the first exception raised, once all calls are done"""
+    items = list( items )
+    results = [ None ] * len( items )
+    if maxThreads <= 1 or len( items ) <= 1:
+        return [ fn( item ) for item in items ]
+    todo = iter( enumerate( items ) )
+    lock = Lock()
+    errors = []
+
+    def worker():
+        "Call fn for items until there are none left"
+        while True:
+            with lock:
+                try:
+                    i, item = next( todo )
+                except StopIteration:
+                    return
+            try:
+                results[ i ] = fn( item )
+            except Exception:
+                errors.append( sys.exc_info() )
+
+    threads = [ Thread( target=worker )
+                for _ in range( min( maxThreads, len( items ) ) ) ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[ 0 ][ 0 ], errors[ 0 ][ 1 ], errors[ 0 ][ 2 ]
+    return results
+
 def makeIntfPair( intf1, intf2 ):
     """Make a veth pair connecting intf1 and intf2.
        intf1: string, interface
@@ -354,6 +413,89 @@ def pmonitor(popens, timeoutms=500, readline=True,
         else:
             yield None, ''
 
+def prun( jobs, maxProcs=64, timeout=None, timeoutms=500 ):
+    """Run commands on nodes concurrently, at most maxProcs at a time,
+       and monitor their output with poll() (like pmonitor(), but for
+       more commands than should run at once)
+       jobs: iterable of ( key, node, cmd ); cmd is passed to node.popen()
+       timeout: seconds after which to kill a command (optional)
+       timeoutms: timeout for poll()
+       yields: key, output (stdout and stderr) of each command,
+               as soon as it finishes"""
+    jobs = iter( jobs )
+    poller = poll()
+    running = {}  # fd -> ( key, popen, start time, output )
+    killed = set()  # fds of commands which timed out
+    while True:
+        # Keep maxProcs commands running for as long as there are jobs
+        while len( running ) < maxProcs:
+            job = next( jobs, None )
+            if job is None:
+                break
+            key, node, cmd = job
+            popen = node.popen( cmd, stderr=STDOUT )
+            fd = popen.stdout.fileno()
+            running[ fd ] = ( key, popen, time(), [] )
+            poller.register( fd, POLLIN | POLLHUP )
+        if not running:
+            return
+        for fd, _event in poller.poll( timeoutms ):
+            data = os.read( fd, 4096 )
+            if data:
+                running[ fd ][ 3 ].append( data )
+                continue
+            # EOF: the command is done
+            key, popen, _start, out = running.pop( fd )
+            poller.unregister( fd )
+            killed.discard( fd )
+            popen.stdout.close()
+            popen.wait()
+            yield key, ''.join( out )
+        if timeout is not None:
+            now = time()
+            for fd, ( _key, popen, start, _out ) in running.items():
+                if now - start > timeout and fd not in killed:
+                    popen.kill()
+                    killed.add( fd )
+
+# Timing support
+
+class PhaseTimer( object ):
+    """Wall-clock times of the phases of something (e.g., network
+       start-up), in the order they ran.
+       Use as: with timer.phase( 'switches' ): ..."""
+
+    def __init__( self ):
+        self.times = []  # list of ( phase, seconds )
+
+    def phase( self, name ):
+        "Return a context manager which times phase name"
+        return _Phase( self, name )
+
+    def total( self ):
+        "Total time of all phases"
+        return sum( t for _name, t in self.times )
+
+    def __str__( self ):
+        return ', '.join( '%s %.3fs' % ( name, t )
+                          for name, t in self.times )
+
+class _Phase( object ):
+    "One phase of a PhaseTimer"
+
+    def __init__( self, timer, name ):
+        self.timer = timer
+        self.name = name
+        self.start = None
+
+    def __enter__( self ):
+        self.start = time()
+        return self
+
+    def __exit__( self, *exc ):
+        self.timer.times.append( ( self.name, time() - self.start ) )
+        return False
+
 # Other stuff we use
 def sysctlTestAndSet( name, limit ):
     "Helper function to set sysctl limits"
@@ -454,6 +596,7 @@ def customized( *args, **kwargs):
         kwargs.update( params )
         return cls( *args, **kwargs )
     customized.__name__ = 'custom(%s,%s)' % ( cls, params )
+    customized.cls = cls
     return customized
 
 def splitArgs( argstr ):
@@ -496,6 +639,7 @@ def customized( name, *args, **params ):
         return constructor( name, *newargs, **params )
 
     customized.__name__ = 'customConstructor(%s)' % argStr
+    customized.cls = getattr( constructor, 'cls', constructor )
     return customized
 
 def buildTopo( topos, topoStr ):
@@ -17,6 +17,7 @@ Created on Jul 18, 2014
 """
 import time
 import threading
+import Queue
 import copy
 from subprocess import call
 import networkx as nx
@@ -143,6 +144,21 @@ class NetworkManagerMininet(NetworkManager,
         self.process = None
         self.vnf_manager = None
         self.last_status_poll = 0
+        # NETCONF agent polling: period (sec), number of agents polled
+        # concurrently, and the time (sec) a whole poll may take
+        self.poll_period = 10
+        self.poll_workers = 8
+        self.poll_timeout = 5
+        # Duration of the last poll of each agent (sec)
+        self.poll_latency = {}
+        # Agents with an unanswered (timed out) poll
+        self._polls_in_flight = set()
+        # Fingerprint of each node at its last scan, see found_node()
+        self._node_fingerprints = {}
+        # Set if dpid or port_map changed since the last update events
+        self._topo_changed = True
+        # Samples the resource usage of the EEs, see resource_usage()
+        self._sampler = None
         pox.core.core.listen_to_dependencies(self)
         # Start periodic scan
         self.periodic_scan()
@@ -557,6 +573,8 @@ class NetworkManagerMininet(NetworkManager,
         self._info("***Starting mininet***")
         opts['controller'] = Controller
         opts['autoSetMacs'] = True
+        opts.setdefault('batchStartup', True)
+        opts.setdefault('bulkBuild', True)
         self.net = MininetWithControlNet(**opts)
 
     def _create_ee(self, ees):
@@ -716,6 +734,9 @@ class NetworkManagerMininet(NetworkManager,
         
     def stop_network(self):
         self.change_network_state(NetworkManager.STOPPING)
+        if self._sampler is not None:
+            self._sampler.close()
+            self._sampler = None
         if self.net is not None:
             self.net.stop()
         self.net = None
@@ -724,6 +745,8 @@ class NetworkManagerMininet(NetworkManager,
         self.network.nodes = {}
         self.dpid = {}
         self.port_map = {}
+        self._node_fingerprints = {}
+        self._topo_changed = True
         # self._debug('Cleaning up Mininet...')
         # mininet.clean.cleanup()
         # time.sleep(4)
@@ -732,6 +755,22 @@ class NetworkManagerMininet(NetworkManager,
     def network_alive(self):
         return self.state in [NetworkManager.UP]
 
+    def resource_usage(self):
+        """
+        CPU and memory usage of each EE since the last call, by name
+
+        All the EEs are sampled in one pass from their cgroups; see
+        mininet.cgroup.ResourceSampler.sample() for the fields.
+        """
+        net = self.net
+        if net is None or self.state != NetworkManager.UP:
+            return {}
+        sampler = self._sampler
+        if sampler is None:
+            sampler = self._sampler = net.resourceSampler()
+        return dict((ee.name, usage)
+                    for ee, usage in sampler.sample().iteritems())
+
     def start_sflow(self, target, header, sampling, polling):
         sflowEnabled = False
         sflowSwitches = ''
@@ -801,98 +840,178 @@ class NetworkManagerMininet(NetworkManager,
         self.process.start()
 
     def scan_network(self, forced = False):
+        """
+        Update the running topology from the Mininet network
+
+        Only the nodes whose fingerprint changed are examined, and the
+        dpid/port_map update events are only fired if something changed.
+        """
         self.process_event_queue()
         if not self.net or self.state == NetworkManager.STOPPING:
             return
         self.poll_netconf_agents(forced)
 
-        checked = []
         # net -> Mininet network representation
+        checked = set()
         for name, node in self.net.items():
-            checked.append(name)
+            checked.add(name)
             if not self.found_node(node):
                 return
 
         deleted = []
-        for name, opts in self.network.nodes.iteritems():
-            if opts.get('parent'):
-                # netconf-controlled vnf node, mininet doesn't know about it
-                continue
-            if name not in checked:
-                deleted.append(name)
         if self.state != NetworkManager.STARTING:
+            for name, opts in self.network.nodes.iteritems():
+                if opts.get('parent'):
+                    # netconf-controlled vnf node, mininet doesn't know about it
+                    continue
+                if name not in checked:
+                    deleted.append(name)
             for node_name in deleted:
                 self._debug('remove node (%s) from network table' % node_name)
                 del self.network.nodes[node_name]
+                self._node_fingerprints.pop(node_name, None)
                 # TODO: send event
 
-        deleted = []
-        for link_id, link in self.network.links.iteritems():
-            node_names = [link['node1'], link['node2']]
-            for node_name in node_names:
-                if node_name not in self.network.nodes:
-                    self._debug('delete link: %s' % node_names)
-                    deleted.append(link_id)
-        for link_id in deleted:
-            del self.network.links[link_id]
-
-        self._fire_dpid_update(self.dpid)
-        self._fire_port_map_update(self.port_map)
+        if deleted or self._topo_changed:
+            deleted = []
+            for link_id, link in self.network.links.iteritems():
+                node_names = [link['node1'], link['node2']]
+                for node_name in node_names:
+                    if node_name not in self.network.nodes:
+                        self._debug('delete link: %s' % node_names)
+                        deleted.append(link_id)
+                        break
+            for link_id in deleted:
+                del self.network.links[link_id]
+
+        if self._topo_changed:
+            self._topo_changed = False
+            self._fire_dpid_update(self.dpid)
+            self._fire_port_map_update(self.port_map)
 
     def poll_netconf_agents(self, forced = False):
-        "Poll netconf agents for VNF status updates"
-        poll_period = 10
-        if (time.time() - self.last_status_poll < poll_period) and not forced:
+        """
+        Poll netconf agents for VNF status updates
+
+        Agents are queried concurrently (by at most poll_workers threads),
+        and the results are merged into the network as they arrive. The
+        whole scan takes at most poll_timeout seconds: an agent which has
+        not answered by then is skipped until its reply comes in, and one
+        which was still queued (all the threads were busy) is skipped
+        until the next scan.
+        """
+        if (time.time() - self.last_status_poll < self.poll_period) and \
+           not forced:
             return
-        for sw in self.net.switches:
-            if not sw.getAgent():
-                continue
-            i = self.vnf_manager.get_vnf_info_on_node(sw.name)
-            # self._debug('VNF_INFO: %s' % i)
-            visited = []
-            for vnf_name, new_opts in i.iteritems():
-                if vnf_name is None:
-                    continue
-                new_opts['parent'] = sw.name
-                visited.append(vnf_name)
-                orig = self.network.nodes.get(vnf_name, {})
-                old_status = orig.get('status')
-                if orig == new_opts:
-                    # nothing's changed
-                    continue
-                orig.update(new_opts)
-                self.network.nodes[vnf_name] = orig
-                links = new_opts.get('link', [])
-                if type(links) != list:
-                    links = [links]
-                self.found_vnf_links(vnf_name, links)
-                if old_status != new_opts['status']:
-                    self._fire_vnf_update(vnf_name, new_opts['status'])
-            deleted = []
-            for node_name, opts in self.network.nodes.iteritems():
-                # self._debug('node_name: %s  opts: %s' % (node_name, opts))
-                if opts.get('parent') != sw.name:
-                    continue
-                if node_name not in visited:
-                    deleted.append(node_name)
-            for vnf_name in deleted:
-                del self.network.nodes[vnf_name]
-                # self._debug('vnf_name: %s' % vnf_name)
-                sw =  self.net.nameToNode[vnf_name]
-                self.net.switches.remove(sw)
-                del self.net.nameToNode[vnf_name]
-                neighbours = self.port_map[vnf_name].keys()
-                for n in neighbours:
-                    del self.port_map[n][vnf_name]
-                    # Assuming there can be only one link between n and vnf.
-                    link = {'node1': n, 'node2': vnf_name,
-                            'intf1': None, 'intf2': None, 'delete': True}
-                    pox.core.core.raiseLater(self, LinkChange, **link)
-                del self.port_map[vnf_name]
-                self._fire_vnf_update(vnf_name, 'STOPPED')
+        agents = [sw.name for sw in self.net.switches
+                  if sw.getAgent() and sw.name not in self._polls_in_flight]
+        if not agents:
+            self.last_status_poll = time.time()
+            return
+
+        jobs = Queue.Queue()
+        for name in agents:
+            jobs.put(name)
+        results = Queue.Queue()
+        deadline = time.time() + self.poll_timeout
+        def work():
+            while True:
+                try:
+                    name = jobs.get_nowait()
+                except Queue.Empty:
+                    return
+                begin = time.time()
+                try:
+                    info = self.vnf_manager.get_vnf_info_on_node(name)
+                except Exception:
+                    self._exception('Failed to poll agent on %s' % name)
+                    info = None
+                results.put((name, info, time.time() - begin))
+                # a timed out agent can be polled again from now on
+                self._polls_in_flight.discard(name)
+
+        self._polls_in_flight.update(agents)
+        for _ in range(max(1, min(self.poll_workers, len(agents)))):
+            worker = threading.Thread(target = work)
+            worker.daemon = True
+            worker.start()
+
+        pending = set(agents)
+        while pending:
+            try:
+                name, info, latency = results.get(
+                    timeout = max(0, deadline - time.time()))
+            except Queue.Empty:
+                # out of time: forget the agents not polled yet, and
+                # leave the ones being polled to their threads
+                while True:
+                    try:
+                        name = jobs.get_nowait()
+                    except Queue.Empty:
+                        break
+                    self._polls_in_flight.discard(name)
+                    pending.discard(name)
+                    self._warn('no time left to poll netconf agent on %s'
+                               % name)
+                for name in pending:
+                    self._warn('netconf agent on %s timed out' % name)
+                break
+            pending.discard(name)
+            self.poll_latency[name] = latency
+            self._debug('netconf agent on %s answered in %.3f sec'
+                        % (name, latency))
+            if info is not None:
+                self._merge_vnf_info(name, info)
 
         self.last_status_poll = time.time()
 
+    def _merge_vnf_info(self, sw_name, vnf_info):
+        "Update the VNFs running on sw_name according to the agent's info"
+        # self._debug('VNF_INFO: %s' % vnf_info)
+        visited = []
+        for vnf_name, new_opts in vnf_info.iteritems():
+            if vnf_name is None:
+                continue
+            new_opts['parent'] = sw_name
+            visited.append(vnf_name)
+            orig = self.network.nodes.get(vnf_name, {})
+            old_status = orig.get('status')
+            if orig == new_opts:
+                # nothing's changed
+                continue
+            orig.update(new_opts)
+            self.network.nodes[vnf_name] = orig
+            links = new_opts.get('link', [])
+            if type(links) != list:
+                links = [links]
+            self.found_vnf_links(vnf_name, links)
+            if old_status != new_opts['status']:
+                self._fire_vnf_update(vnf_name, new_opts['status'])
+        deleted = []
+        for node_name, opts in self.network.nodes.iteritems():
+            # self._debug('node_name: %s  opts: %s' % (node_name, opts))
+            if opts.get('parent') != sw_name:
+                continue
+            if node_name not in visited:
+                deleted.append(node_name)
+        for vnf_name in deleted:
+            del self.network.nodes[vnf_name]
+            self._node_fingerprints.pop(vnf_name, None)
+            # self._debug('vnf_name: %s' % vnf_name)
+            sw =  self.net.nameToNode[vnf_name]
+            self.net.switches.remove(sw)
+            del self.net.nameToNode[vnf_name]
+            neighbours = self.port_map[vnf_name].keys()
+            for n in neighbours:
+                del self.port_map[n][vnf_name]
+                # Assuming there can be only one link between n and vnf.
+                link = {'node1': n, 'node2': vnf_name,
+                        'intf1': None, 'intf2': None, 'delete': True}
+                pox.core.core.raiseLater(self, LinkChange, **link)
+            del self.port_map[vnf_name]
+            self._topo_changed = True
+            self._fire_vnf_update(vnf_name, 'STOPPED')
+
     def found_vnf_links(self, vnf_id, links):
         def get_intf_by_name(node, intf_name):
             for i in node.intfList():
@@ -953,21 +1072,42 @@ class NetworkManagerMininet(NetworkManager,
                  'intf1': intf1,
                  'intf2': intf2
                 }
-        try:
-            self.port_map[node1.name][node2.name] = node1.ports[intf1]
-        except KeyError:
-            self.port_map[node1.name] = {node2.name: node1.ports[intf1]}
-
-        try:
-            self.port_map[node2.name][node1.name] = node2.ports[intf2]
-        except KeyError:
-            self.port_map[node2.name] = {node1.name: node2.ports[intf2]}
+        for node, peer, intf in ((node1, node2, intf1), (node2, node1, intf2)):
+            ports = self.port_map.setdefault(node.name, {})
+            if ports.get(peer.name) != node.ports[intf]:
+                ports[peer.name] = node.ports[intf]
+                self._topo_changed = True
 
         if not cmp(orig_link, link) == 0:
             self.network.links[link_id] = link
             pox.core.core.raiseLater(self, LinkChange, **link)
 
+    def _node_fingerprint(self, node):
+        """
+        Cheap summary of the scanned properties of a node: its interfaces
+        (with addresses, ports and links) and its dpid
+        """
+        intfs = []
+        for intf in node.intfList():
+            link = intf.link
+            if link:
+                link = (link.intf1.node.name, link.intf1.name,
+                        link.intf2.node.name, link.intf2.name)
+            intfs.append((intf.name, node.IP(intf), node.MAC(intf),
+                          node.ports[intf], link))
+        return (tuple(intfs), getattr(node, 'dpid', None))
+
     def found_node(self, node):
+        try:
+            fingerprint = self._node_fingerprint(node)
+        except AttributeError:
+            # network is not running
+            return False
+        if (self._node_fingerprints.get(node.name) == fingerprint and
+                node.name in self.network.nodes):
+            # nothing's changed
+            return True
+
         orig = self.network.nodes.get(node.name, {})
         new_opts = copy.deepcopy(orig)
         new_opts['name'] = node.name
@@ -976,23 +1116,22 @@ class NetworkManagerMininet(NetworkManager,
             new_opts['intf'][intf.name] = {'ip': node.IP(intf),
                                            'mac': node.MAC(intf),
                                            'port': node.ports[intf]}
-        try:
-            # taken form Node.connectionsTo
-            for intf in node.intfList():
-                link = intf.link
-                if not intf.link:
-                    continue
-                node1, node2 = link.intf1.node, link.intf2.node
-                if node1 == node or node2 == node:
-                    self.found_link(node1, node2, link.intf1, link.intf2)
-        except AttributeError:
-            # network is not running
-            return False
+        # taken form Node.connectionsTo
+        for intf in node.intfList():
+            link = intf.link
+            if not intf.link:
+                continue
+            node1, node2 = link.intf1.node, link.intf2.node
+            if node1 == node or node2 == node:
+                self.found_link(node1, node2, link.intf1, link.intf2)
 
         if getattr(node, 'dpid', None):
             new_opts['dpid'] = int(node.dpid, base=16)
-            self.dpid[node.name] = int(node.dpid, base=16)
+            if self.dpid.get(node.name) != new_opts['dpid']:
+                self.dpid[node.name] = new_opts['dpid']
+                self._topo_changed = True
 
+        self._node_fingerprints[node.name] = fingerprint
         if not cmp(orig, new_opts) == 0:
             self.network.nodes[node.name] = new_opts
             pox.core.core.raiseLater(self, NodeChange,
@@ -1071,5 +1210,9 @@ class NetworkManagerMininet(NetworkManager,
         event.type = 'switch_connection_down'
         self.of_event_queue.append(event)
 
-def launch():
-    pox.core.core.register(NetworkManagerMininet())
+def launch(poll_period = 10, poll_workers = 8, poll_timeout = 5):
+    network_manager = NetworkManagerMininet()
+    network_manager.poll_period = float(poll_period)
+    network_manager.poll_workers = int(poll_workers)
+    network_manager.poll_timeout = float(poll_timeout)
+    pox.core.core.register(network_manager)
@@ -21,6 +21,9 @@ import networkx as nx
 import logging
 import Utils
 import time
+import threading
+import Queue
+from collections import OrderedDict
 
 from traffic_steering import RouteHop, RouteChanged
 from networkx.readwrite import json_graph
@@ -30,7 +33,7 @@ from mininet import clickgui
 from mininet.vnfcatalog import Catalog
 
 import VNFBuilders
-from NetconfHelper import NetconfHelper, RPCError
+from NetconfHelper import NetconfSessionPool, RPCError
 from ncclient.transport import AuthenticationError
 
 
@@ -253,6 +256,10 @@ class Mapping(object):
         #TODO: update link parameters
 
 
+# NETCONF sessions shared by the VnfWrappers, kept open between rpcs
+netconf_sessions = NetconfSessionPool(timeout = 30, keepalive = 30)
+
+
 class VnfWrapper(Utils.LoggerHelper):
     """
     Wrapper class for the VNF elements
@@ -268,13 +275,51 @@ class VnfWrapper(Utils.LoggerHelper):
         self.netconf_helper = None
         self.id_to_name = {}
         self.vnfs_status = {}
+        # Guards netconf_helper (rpcs on the pooled session, which other
+        # wrappers may share, are serialized by the session itself)
+        self._helper_lock = threading.RLock()
+        # Notified whenever vnfs_status is updated
+        self._status_cond = threading.Condition()
 
-    def start(self, vnf, vnf_options = None):
-        self._debug('Start vnf %s on node %s'%(vnf, self.name))
+    def _get_agent(self):
         try:
-            agent = self.node.getAgent()
+            return self.node.getAgent()
         except AttributeError:
-            agent = None
+            return None
+
+    def _rpc(self, rpc_name, **kwargs):
+        netconf_helper = self.netconf_helper
+        if netconf_helper is None:
+            raise RPCError('no NETCONF session to %s' % self.name)
+        return netconf_helper.rpc(rpc_name, **kwargs)
+
+    def start(self, vnf, vnf_options = None, ready_timeout = None):
+        """
+        Start a VNF and return its id (see initiate)
+
+        A remote VNF is waited for at most ready_timeout seconds
+        (None: forever) to come up.
+        """
+        vnf_id = self.initiate(vnf, vnf_options)
+        if self._get_agent() is None:
+            return vnf_id
+        if not self.wait_until_running(vnf_id, ready_timeout):
+            self._error("vnf %s on node %s failed to come up"
+                        % (vnf_id, self.name))
+            return vnf_id
+        self.connect_and_start(vnf_id)
+        return vnf_id
+
+    def initiate(self, vnf, vnf_options = None):
+        """
+        First phase of starting a VNF
+
+        VNFs on mininet hosts are started completely, and their pid is
+        returned.  Otherwise, the VNF is initiated by the netconf agent and
+        the internal vnf_id of the agent is returned.
+        """
+        self._debug('Start vnf %s on node %s'%(vnf, self.name))
+        agent = self._get_agent()
         if agent is None:
             # vnf runs on a mininet host
             self.node.startCmd = vnf.startCmd
@@ -284,56 +329,75 @@ class VnfWrapper(Utils.LoggerHelper):
             return self.node.vnfPid
 
         # If we have NetconfAgent, use vnf_options
-        netconf_helper = self._get_netconf_helper(agent)
-        initVNF = netconf_helper.rpc("initiateVNF",
-                                     vnf_type = vnf_options['function'],
-                                     options = {"ip": "127.0.0.1"})
-                                     #options = vnf_options['custom_params'])
+        self._get_netconf_helper(agent)
+        initVNF = self._rpc("initiateVNF",
+                            vnf_type = vnf_options['function'],
+                            options = {"ip": "127.0.0.1"})
+                            #options = vnf_options['custom_params'])
         vnf_id = initVNF['access_info']['vnf_id']
         vnf_options['vnf_control_port'] = initVNF['access_info']['control_port']
         self.id_to_name[vnf_id] = vnf_options['name']
-        self.vnfs_status[vnf_id] = 'INITIALIZING'
-        # Waiting only for remote agents
-        try:
-            remote_conf_ip = agent.params['remote_conf_ip']
-        except KeyError:
-            remote_conf_ip = None
-        if remote_conf_ip is not None:
-            # remote netconf
-            while True: 
-                if self.vnfs_status[vnf_id] == 'UP_AND_RUNNING':
-                    connectVNF = netconf_helper.rpc("connectVNF",
-                                                    vnf_id = vnf_id,
-                                                    vnf_port = "0",
-                                                    switch_id = self.name)
-                    break
-                else:
-                    time.sleep(1)
-        else:
-            # local netconf
-            connectVNF = netconf_helper.rpc("connectVNF",
-                                            vnf_id = vnf_id,
-                                            vnf_port = "0",
-                                            switch_id = self.name)
-        netconf_helper.rpc("startVNF",
-                           vnf_id = vnf_id)
+        with self._status_cond:
+            self.vnfs_status[vnf_id] = 'INITIALIZING'
+        return vnf_id
+
+    def wait_until_running(self, vnf_id, timeout = None, poll_interval = 1):
+        """
+        Wait for an initiated VNF to become UP_AND_RUNNING
+
+        Only VNFs of remote agents have to be waited for.  Status updates
+        (e.g., from NetworkManager's periodic poll) wake the waiter up;
+        if none arrives within poll_interval, the agent is polled here.
+        Return False if the VNF failed or timeout has expired.
+        """
+        agent = self._get_agent()
+        if agent is None or agent.params.get('remote_conf_ip') is None:
+            return True
+
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self._status_cond:
+                status = self.vnfs_status.get(vnf_id)
+                if status not in ('UP_AND_RUNNING', 'FAILED'):
+                    wait = poll_interval
+                    if deadline is not None:
+                        wait = max(0, min(wait, deadline - time.time()))
+                    self._status_cond.wait(wait)
+                    status = self.vnfs_status.get(vnf_id)
+            if status == 'UP_AND_RUNNING':
+                return True
+            if status == 'FAILED':
+                return False
+            if deadline is not None and time.time() >= deadline:
+                return False
+            self._poll_vnf_info()
+
+    def connect_and_start(self, vnf_id):
+        """Last phase of starting a VNF by a netconf agent"""
+        if self._get_agent() is None:
+            return
+        self._rpc("connectVNF",
+                  vnf_id = vnf_id,
+                  vnf_port = "0",
+                  switch_id = self.name)
+        self._rpc("startVNF",
+                  vnf_id = vnf_id)
         # return internal vnf_id administered by netconf agent
         self._info('Started vnf %s by netconf agent on node %s'
                     % (vnf_id, self.name))
-        return vnf_id
-        # self._error("can't start VNF on node (%s)" % self.name)
 
     def _get_netconf_helper(self, agent):
+        with self._helper_lock:
+            return self._get_netconf_helper_locked(agent)
+
+    def _get_netconf_helper_locked(self, agent):
         if self.netconf_helper is None:
-            netconf_helper = NetconfHelper(
-                server = agent.IP(),
-                port = agent.agentPort,
-                username = agent.username,
-                password = agent.passwd,
-                timeout=30)
-            # connect to server
+            # connect to server (or reuse the agent's open session)
             try:
-                netconf_helper.connect()
+                netconf_helper = netconf_sessions.get(agent.IP(),
+                                                      agent.agentPort,
+                                                      agent.username,
+                                                      agent.passwd)
             except AuthenticationError as e:
                 self._error('AuthenticationError (%s):%s' % (self.name, e))
                 return None
@@ -343,19 +407,26 @@ class VnfWrapper(Utils.LoggerHelper):
             self.netconf_helper = netconf_helper
         return self.netconf_helper
 
-    def get_vnf_info(self, vnf_opts=None):
-        """Return status for 'vnf_opts' or for all vnfs if it is None"""
+    def _poll_vnf_info(self):
+        """Query VNF states from the netconf agent, notify waiters"""
         vnf_info = []
         if self.netconf_helper is not None:
             try:
-                vnf_info = self.netconf_helper.rpc("getVNFInfo")
+                vnf_info = self._rpc("getVNFInfo")
             except RPCError:
                 vnf_info = {}
             vnf_info = vnf_info.get('initiated_vnfs', [])
             if type(vnf_info) != list:
                 vnf_info = [vnf_info]
-            for i in vnf_info:
-                self.vnfs_status[i.get('vnf_id')] = i.get('status')
+            with self._status_cond:
+                for i in vnf_info:
+                    self.vnfs_status[i.get('vnf_id')] = i.get('status')
+                self._status_cond.notify_all()
+        return vnf_info
+
+    def get_vnf_info(self, vnf_opts=None):
+        """Return status for 'vnf_opts' or for all vnfs if it is None"""
+        vnf_info = self._poll_vnf_info()
         if vnf_opts:
             vnf_id = vnf_opts['name']
             vnf_id_netconf = vnf_opts['vnf_id_netconf']
@@ -377,7 +448,7 @@ class VnfWrapper(Utils.LoggerHelper):
         vnf_id_netconf = vnf_opts['vnf_id_netconf']
         if self.netconf_helper is not None:
             try:
-                self.netconf_helper.rpc("stopVNF", vnf_id = vnf_id_netconf)
+                self._rpc("stopVNF", vnf_id = vnf_id_netconf)
                 # we should update mapping and status database at stop
                 del self.id_to_name[vnf_id_netconf]
                 del self.vnfs_status[vnf_id_netconf]
@@ -393,10 +464,16 @@ class VnfWrapper(Utils.LoggerHelper):
             self.node.stopVNF()
 
     def stop_wrapper(self):
-        if self.netconf_helper is not None:
-            self.netconf_helper.disconnect()
-            self.netconf_helper = None
-            self.vnfs_status = {}
+        with self._helper_lock:
+            if self.netconf_helper is not None:
+                agent = self._get_agent()
+                if agent is not None:
+                    netconf_sessions.close(agent.IP(), agent.agentPort,
+                                           agent.username)
+                else:
+                    self.netconf_helper.disconnect()
+                self.netconf_helper = None
+                self.vnfs_status = {}
 
 class NodeManagerMininetWrapper(Utils.LoggerHelper):
     def __init__(self):
@@ -450,11 +527,17 @@ class VNFManager(Utils.LoggerHelper):
         - Start clicky
         - Create VNF catalogue entry
     """
-    def __init__(self):
+    def __init__(self, concurrent_start = True, max_workers = 8,
+                 ready_timeout = None):
         self.vnf_catalog = {}
         self.vnf_to_node = {}
         self.node_manager = None
         self.vnf_options = None
+        # Start VNFs of different nodes in parallel
+        self.concurrent_start = concurrent_start
+        self.max_workers = max_workers
+        # Max. seconds to wait for a remote VNF to come up (None: forever)
+        self.ready_timeout = ready_timeout
 
     def set_node_manager(self, node_manager):
         self.node_manager = node_manager
@@ -462,17 +545,105 @@ class VNFManager(Utils.LoggerHelper):
     def set_vnf_catalog(self, catalog):
         self.vnf_catalog = catalog
 
-    def start_vnfs(self, vnf_to_node_list, vnf_options):
+    def start_vnfs(self, vnf_to_node_list, vnf_options, concurrent = None):
+        """
+        Start VNFs given as (vnf_id, node_id) pairs
+
+        In concurrent mode, nodes are handled by a bounded pool of worker
+        threads.  On each node, every VNF is initiated first, then they are
+        waited for and connected/started one by one.
+        Return timings as {vnf_id: {'node': node_id, 'initiate': sec,
+        'ready': sec, 'start': sec, 'total': sec}}.
+        """
         self.vnf_options = deepcopy(vnf_options)
+        if concurrent is None:
+            concurrent = self.concurrent_start
 
-        for vnf_id, node_id in vnf_to_node_list:
-            self.start_vnf_on_node(vnf_id, node_id, self.vnf_options[vnf_id])
-            self.vnf_to_node[vnf_id] = node_id
+        if concurrent:
+            timings = self._start_vnfs_concurrently(vnf_to_node_list)
+        else:
+            timings = {}
+            for vnf_id, node_id in vnf_to_node_list:
+                begin = time.time()
+                self.start_vnf_on_node(vnf_id, node_id,
+                                       self.vnf_options[vnf_id])
+                self.vnf_to_node[vnf_id] = node_id
+                timings[vnf_id] = {'node': node_id,
+                                   'total': time.time() - begin}
         try:
             self.node_manager.start_posthook()
         except AttributeError:
             #TODO: logmessage
             pass
+        return timings
+
+    def _start_vnfs_concurrently(self, vnf_to_node_list):
+        vnfs_by_node = OrderedDict()
+        for vnf_id, node_id in vnf_to_node_list:
+            vnfs_by_node.setdefault(node_id, []).append(vnf_id)
+            self.vnf_to_node[vnf_id] = node_id
+
+        # Wrappers and VNF objects are created in the caller's thread
+        jobs = Queue.Queue()
+        for node_id, vnf_ids in vnfs_by_node.iteritems():
+            vnf_wrapper = self.node_manager.get_vnf_wrapper(node_id)
+            vnfs = [(vnf_id, self.create_vnf(self.vnf_options[vnf_id],
+                                             vnf_wrapper))
+                    for vnf_id in vnf_ids]
+            jobs.put((node_id, vnf_wrapper, vnfs))
+
+        timings = {}
+        errors = []
+        def work():
+            while True:
+                try:
+                    job = jobs.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    timings.update(self._start_vnfs_on_node(*job))
+                except Exception as e:
+                    self._exception('Failed to start vnfs on node %s' %
+                                    job[0])
+                    errors.append(e)
+
+        workers = [threading.Thread(target = work)
+                   for _ in range(min(self.max_workers, len(vnfs_by_node)))]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        if errors:
+            raise errors[0]
+        return timings
+
+    def _start_vnfs_on_node(self, node_id, vnf_wrapper, vnfs):
+        timings = {}
+        for vnf_id, vnf in vnfs:
+            self._debug('Start %s vnf on node %s' % (vnf_id, node_id))
+            begin = time.time()
+            vnf_options = self.vnf_options[vnf_id]
+            vnf_options['vnf_id_netconf'] = vnf_wrapper.initiate(vnf,
+                                                                 vnf_options)
+            timings[vnf_id] = {'node': node_id, 'begin': begin,
+                               'initiate': time.time() - begin}
+
+        for vnf_id, vnf in vnfs:
+            t = timings[vnf_id]
+            vnf_id_netconf = self.vnf_options[vnf_id]['vnf_id_netconf']
+            ready = time.time()
+            if vnf_wrapper.wait_until_running(vnf_id_netconf,
+                                              self.ready_timeout):
+                t['ready'] = time.time() - ready
+                started = time.time()
+                vnf_wrapper.connect_and_start(vnf_id_netconf)
+                t['start'] = time.time() - started
+            else:
+                self._error("vnf %s on node %s failed to come up"
+                            % (vnf_id, node_id))
+                t['ready'] = None
+            t['total'] = time.time() - t.pop('begin')
+        return timings
 
     def start_vnf_on_node(self, vnf_id, node_id, vnf_options):
         #TODO: change available resources in res_graph
@@ -485,7 +656,8 @@ class VNFManager(Utils.LoggerHelper):
         # node.start(vnf, vnf_options)
         vnf_wrapper = self.node_manager.get_vnf_wrapper(node_id)
         vnf = self.create_vnf(vnf_options, vnf_wrapper)
-        vnf_id_netconf = vnf_wrapper.start(vnf, vnf_options)
+        vnf_id_netconf = vnf_wrapper.start(vnf, vnf_options,
+                                           self.ready_timeout)
         # None or vnf_id on netconf agent: add to options
         vnf_options['vnf_id_netconf'] = vnf_id_netconf
         self.vnf_to_node[vnf_id] = node_id
@@ -602,6 +774,10 @@ class DefaultRouteAlgorithm(object):
                            NetworkGraphManager.NODE_TYPE_HOST,
                            NetworkGraphManager.NODE_TYPE_VNF,
                            NetworkGraphManager.NODE_TYPE_SWITCH)
+        # Version of the topology self.g was built from (None: unknown)
+        self.version = None
+        # Memoized shortest paths (or NetworkXNoPath errors) of self.g
+        self._paths = {}
 
     def graph(self, node_links_data):
         self.g = json_graph.node_link_graph(node_links_data)
@@ -610,9 +786,36 @@ class DefaultRouteAlgorithm(object):
             if self.g.node[_id]["node_type"] not in self.valid_type:
                 remove.append(_id)
         self.g.remove_nodes_from(remove)
+        self.version = None
+        self._paths = {}
+
+    def cached_graph(self, g, version):
+        """
+        Use the valid nodes of g for routing, unless the graph of the same
+        topology version is already in use (then the memoized paths are
+        kept as well)
+        """
+        if version is not None and version == self.version:
+            return
+        keep = [_id for _id, data in g.nodes(data = True)
+                if data.get("node_type") in self.valid_type]
+        self.g = g.subgraph(keep)
+        self.version = version
+        self._paths = {}
 
     def shortest_path(self, source, target):
-        return nx.shortest_path(self.g, source, target, weight = "weight")
+        try:
+            path = self._paths[(source, target)]
+        except KeyError:
+            try:
+                path = nx.shortest_path(self.g, source, target,
+                                        weight = "weight")
+            except nx.NetworkXNoPath as e:
+                path = e
+            self._paths[(source, target)] = path
+        if isinstance(path, Exception):
+            raise path
+        return path
 
     def chain_hops(self, s, t):
         line = self.shortest_path(s, t)
@@ -641,6 +844,8 @@ class RouteManager(Utils.GenericEventNotifyer, Utils.LoggerHelper):
         self.vnf_manager = vnf_manager
         self.chain_route_search = chain_route_search_algorithm()
         self.res_route_search = res_route_search_algorithm()
+        # Incremented on topology changes, see _graph_version()
+        self.topology_version = 0
         # Subscribe for traffic_steering events (RouteChanged)
         boot.core.callLater(boot.core.TrafficSteering.addListeners, self)
 
@@ -659,6 +864,28 @@ class RouteManager(Utils.GenericEventNotifyer, Utils.LoggerHelper):
         cls = self.res_route_search.__class__
         del self.res_route_search
         self.res_route_search = cls()
+        self.invalidate_routing()
+
+    def invalidate_routing(self):
+        """Drop the cached routing graphs and paths (topology changed)"""
+        self.topology_version += 1
+
+    def _graph_version(self, g):
+        """
+        Version key of a graph's topology, taken from its contents (graphs
+        are changed in place, e.g. a VNF re-parented or replaced, without
+        changing their size): each node with its type and each link with
+        its weight, and no topology change since
+        """
+        nodes = frozenset((_id, data.get('node_type'))
+                          for _id, data in g.nodes(data = True))
+        if g.is_directed():
+            link = tuple
+        else:
+            link = frozenset
+        edges = frozenset((link((u, v)), data.get('weight'))
+                          for u, v, data in g.edges(data = True))
+        return (nodes, edges, self.topology_version)
 
     def get_route_ids(self):
         return self.routes.keys()
@@ -697,7 +924,8 @@ class RouteManager(Utils.GenericEventNotifyer, Utils.LoggerHelper):
             chain_hops = [(s, t)]
         else:
             route_search = self.chain_route_search
-            route_search.graph(json_graph.node_link_data(chain_graph))
+            route_search.cached_graph(chain_graph,
+                                      self._graph_version(chain_graph))
             chain_hops = route_search.chain_hops(s, t)
 
         self.routes[route_id]['chain'] = chain_hops
@@ -711,7 +939,9 @@ class RouteManager(Utils.GenericEventNotifyer, Utils.LoggerHelper):
 
     def _install_one_pending_route(self, route_id, res_graph):
         # self._debug('RES_GRAPH: %s' % res_graph.nodes())
-        self.res_route_search.graph(json_graph.node_link_data(res_graph))
+        # the graph is only rebuilt if the topology changed
+        self.res_route_search.cached_graph(res_graph,
+                                           self._graph_version(res_graph))
 
         path_stream = []
         self.routes[route_id]['res'] = []
@@ -757,10 +987,14 @@ class RouteManager(Utils.GenericEventNotifyer, Utils.LoggerHelper):
                             route_id)
 
     def _handle_dpid_update(self, event):
+        # only fired if the dpids changed
         self.dpids = event.dpids
+        self.invalidate_routing()
 
     def _handle_port_map_update(self, event):
+        # only fired if the links changed
         self.port_map = event.port_map
+        self.invalidate_routing()
 
     def _handle_vnf_update(self, event):
         if event.status == 'stopped':
@@ -785,7 +1019,7 @@ class RouteManager(Utils.GenericEventNotifyer, Utils.LoggerHelper):
         return self.route_id
 
 
-class Orchestrator(object):
+class Orchestrator(Utils.LoggerHelper):
     """
     Orchestrate the NF-FG mapping and the control of network elements
     """
@@ -821,7 +1055,10 @@ class Orchestrator(object):
         vnf_manager = self.network_manager.vnf_manager
         vnf_manager.set_vnf_catalog(Catalog().get_db())
         # Start mapped VNFs on physical network element
-        vnf_manager.start_vnfs(vnf_to_host_list, vnf_options)
+        timings = vnf_manager.start_vnfs(vnf_to_host_list, vnf_options)
+        for vnf_id, t in timings.iteritems():
+            self._debug('Started %s on %s in %.3fs (%s)' %
+                        (vnf_id, t['node'], t['total'], t))
         # Install routes
         # update states of VNFs run by netconf agents before route install
         # (to make phy_g consistent (containing remote VNFs as well))
@@ -17,9 +17,13 @@
 Installs routes proactively.
 """
 
+from collections import OrderedDict
+
 import pox
 from pox.lib.revent import *
 from pox.lib.addresses import EthAddr
+from pox.lib.recoco import Timer
+from pox.lib.util import str_to_bool
 import pox.openflow.libopenflow_01 as of
 
 
@@ -117,7 +121,17 @@ class RouteHop (object):
 # #################################################################
 
 class TrafficSteering  (EventMixin):
-  """Install routes proactively."""
+  """Install routes proactively.
+
+  In batch mode, flow_mods are not sent right away.  They are queued per
+  switch, and every queue is flushed as a single write followed by a
+  single barrier.  The barrier reply completes every hop in the batch.
+  The queues are flushed batch_delay seconds after the first flow_mod is
+  queued (or on the next scheduler cycle if batch_delay is 0).  A hop is
+  queued at most once per batch; if it is sent again before the flush
+  (e.g., because its switch reconnected), its latest flow_mod replaces the
+  queued one.
+  """
   _eventMixin_events = {RouteChanged}
 
   class Route (object):
@@ -140,10 +154,16 @@ class TrafficSteering  (EventMixin):
       s = [ hop.status == RouteHop.REMOVED for hop in self.hops ]
       return all(s)
 
-  def __init__(self):
+  def __init__(self, batch = False, batch_delay = 0):
       self._routes = {}
-      self._pending_barriers = {}
+      self._hops_by_dpid = {}     # dpid -> set(RouteHop)
+      self._starting_routes = set() # ids of routes in STARTING state
+      self._pending_barriers = {} # barrier xid -> [RouteHop]
       self._xid_generator = of.xid_generator()
+      self._batch = batch
+      self._batch_delay = batch_delay
+      self._batched_hops = {}     # dpid -> OrderedDict(RouteHop -> flow_mod)
+      self._flush_scheduled = False
       pox.core.core.addListeners(self)
       pox.core.core.openflow.addListeners(self)
       pox.core.core.listen_to_dependencies(self)
@@ -160,9 +180,12 @@ class TrafficSteering  (EventMixin):
       pox.core.core.raiseLater(self, RouteChanged, id, RouteChanged.FAILED)
       return
 
+    if id in self._routes:
+      self._forget_route(id)
     for hop in route:
       # Set route_id for every RouteHop
       hop.route_id = id
+      self._hops_by_dpid.setdefault(hop.dpid, set()).add(hop)
     # Save the RoutHops as a new Route
     self._routes[id] = self.Route(id, route)
     # Install the added route
@@ -175,6 +198,17 @@ class TrafficSteering  (EventMixin):
       # Remove every RouteHop(aka flow entry) in the Route given by id
       self._remove_hop(hop)
 
+  def _forget_route (self, id):
+    """Removes a route and its hops from the indices."""
+    route = self._routes.pop(id)
+    self._starting_routes.discard(id)
+    for hop in route.hops:
+      hops = self._hops_by_dpid.get(hop.dpid)
+      if hops is None: continue
+      hops.discard(hop)
+      if not hops:
+        del self._hops_by_dpid[hop.dpid]
+
   def _install_route (self, id):
     # Modify the route's matching thing
     if not self._add_dst_mac_matching(id):
@@ -246,18 +280,7 @@ class TrafficSteering  (EventMixin):
       # switch hasn't connected yet.
       # _handle_ConnectionUp will take care of the installation later
       return
-    con.send(msg)
-
-    # send the barrier
-    barrier_xid = self._xid_generator()
-    # Save the pending RoutHop to change the state later
-    self._pending_barriers[barrier_xid] = hop
-    # Set the RouteHop status
-    hop.status = RouteHop.SENT
-    con.send(of.ofp_barrier_request(xid=barrier_xid))
-
-    log.debug('_install_hop:route_id(%s),dpid(%s),barrier(%s)',
-              hop.route_id, hop.dpid, barrier_xid)
+    self._send_hop(hop, con, msg, RouteHop.SENT)
 
   def _remove_hop (self, hop):
     if hop.status != RouteHop.INSTALLED:
@@ -273,19 +296,66 @@ class TrafficSteering  (EventMixin):
       # already been shut down.
       hop.status = RouteHop.REMOVED
       return
+    self._send_hop(hop, con, msg, RouteHop.SENT_REMOVE)
+
+  def _send_hop (self, hop, con, msg, status):
+    # Set the RouteHop status
+    hop.status = status
+
+    if self._batch:
+      queued = self._batched_hops.setdefault(hop.dpid, OrderedDict())
+      # Re-queue (at the end) rather than send the hop twice
+      queued.pop(hop, None)
+      queued[hop] = msg
+      if not self._flush_scheduled:
+        self._flush_scheduled = True
+        if self._batch_delay:
+          Timer(self._batch_delay, self.flush)
+        else:
+          pox.core.core.callLater(self.flush)
+      return
+
     con.send(msg)
 
     # send the barrier
     barrier_xid = self._xid_generator()
     # Save the pending RoutHop to change the state later
-    self._pending_barriers[barrier_xid] = hop
-    # Set the RouteHop status
-    hop.status = RouteHop.SENT_REMOVE
+    self._pending_barriers[barrier_xid] = [hop]
     con.send(of.ofp_barrier_request(xid=barrier_xid))
 
-    log.debug('_remove_hop:route_id(%s),dpid(%s),barrier(%s)',
+    log.debug('_send_hop:route_id(%s),dpid(%s),barrier(%s)',
               hop.route_id, hop.dpid, barrier_xid)
 
+  def flush (self):
+    """
+    Sends the queued flow_mods of every switch in batch mode.
+    """
+    self._flush_scheduled = False
+    batches = self._batched_hops
+    self._batched_hops = {}
+
+    for dpid, queued in batches.iteritems():
+      hops = queued.keys()
+      con = pox.core.core.openflow.getConnection(dpid)
+      if not con:
+        # The switch went away since the hops were queued.
+        # _handle_ConnectionUp will install them again.
+        for hop in hops:
+          if hop.status == RouteHop.SENT_REMOVE:
+            hop.status = RouteHop.REMOVED
+          else:
+            hop.status = RouteHop.INIT
+        continue
+
+      barrier_xid = self._xid_generator()
+      data = b''.join(msg.pack() for msg in queued.itervalues())
+      data += of.ofp_barrier_request(xid=barrier_xid).pack()
+      self._pending_barriers[barrier_xid] = hops
+      con.send(data)
+
+      log.debug('flush:dpid(%s),hops(%s),barrier(%s)',
+                dpid, len(hops), barrier_xid)
+
   def _change_route_status (self, route, new_status):
     if route.status == new_status:
       return
@@ -295,13 +365,16 @@ class TrafficSteering  (EventMixin):
               RouteChanged.get_status_str(new_status))
 
     route.status = new_status
+    if new_status == RouteChanged.STARTING:
+      self._starting_routes.add(route.id)
+    else:
+      self._starting_routes.discard(route.id)
     # Fire the RouteChanged event
     pox.core.core.raiseLater(self, RouteChanged, route.id, new_status)
 
   def _handle_SimpleTopology_RecentlyChanged (self, event):
-    for id, r in self._routes.iteritems():
-      if r.status == RouteChanged.STARTING:
-        self._install_route(id)
+    for id in list(self._starting_routes):
+      self._install_route(id)
 
   def _handle_BarrierIn (self, barrier):
     log.debug("_handle_BarrierIn: %s", barrier.xid)
@@ -312,41 +385,42 @@ class TrafficSteering  (EventMixin):
       return EventContinue
 
     # Set the pending and saved RouteHop status according to the received Barrier msg
-    hop = self._pending_barriers.pop(xid)
-    if hop.status == RouteHop.SENT:
-      hop.status = RouteHop.INSTALLED
-    elif hop.status == RouteHop.SENT_REMOVE:
-      hop.status = RouteHop.REMOVED
-    else:
-      log.error('_handle_BarrierIn: inconsistent state (%s, %s)', xid, dpid)
-      return EventHalt
-    route = self._routes[hop.route_id]
-
-    if route._is_route_removed():
-      self._change_route_status(route, RouteChanged.REMOVED)
-      del self._routes[hop.route_id]
-    elif route._is_route_ready():
-      self._change_route_status(route, RouteChanged.STARTED)
-    elif route._is_tail_ready():
-      self._install_hop(route.hops[0])
+    for hop in self._pending_barriers.pop(xid):
+      if hop.status == RouteHop.SENT:
+        hop.status = RouteHop.INSTALLED
+      elif hop.status == RouteHop.SENT_REMOVE:
+        hop.status = RouteHop.REMOVED
+      else:
+        log.error('_handle_BarrierIn: inconsistent state (%s, %s)', xid, dpid)
+        continue
+      route = self._routes.get(hop.route_id)
+      if route is None:
+        continue
+
+      if route._is_route_removed():
+        self._change_route_status(route, RouteChanged.REMOVED)
+        self._forget_route(hop.route_id)
+      elif route._is_route_ready():
+        self._change_route_status(route, RouteChanged.STARTED)
+      elif route._is_tail_ready():
+        self._install_hop(route.hops[0])
 
     return EventHalt
 
   def _handle_ConnectionDown (self, event):
-    for r in self._routes.itervalues():
-      for h in r.hops:
-        if h.dpid == event.dpid:
-          h.status = RouteHop.INIT
-          self._change_route_status(r, ROUTE_FAILED)
+    for h in self._hops_by_dpid.get(event.dpid, ()):
+      h.status = RouteHop.INIT
+      self._change_route_status(self._routes[h.route_id], ROUTE_FAILED)
 
   def _handle_ConnectionUp (self, event):
-    for r in self._routes.itervalues():
-      for hop in r.hops:
-        if hop.dpid == event.dpid:
-          self._install_hop(hop)
+    for hop in list(self._hops_by_dpid.get(event.dpid, ())):
+      self._install_hop(hop)
 
 
-def launch ():
+def launch (batch = False, batch_delay = 0):
   global log
   log = pox.core.core.getLogger()
-  pox.core.core.register(TrafficSteering())
+  batch = str_to_bool(batch)
+  batch_delay = float(batch_delay)
+  pox.core.core.register(TrafficSteering(batch = batch,
+                                         batch_delay = batch_delay))
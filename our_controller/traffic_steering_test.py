@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+#
+# Unit tests for traffic_steering's batch mode
+#
+# Run from this directory as
+#  $ python -m unittest traffic_steering_test
+
+import unittest
+import sys
+import os.path
+import struct
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "pox"))
+
+import pox.core
+if pox.core.core is None:
+  pox.core.initialize(threaded_selecthub=False, handle_signals=False)
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+
+import traffic_steering as ts
+from traffic_steering import RouteHop
+
+_header = struct.Struct("!BBHL")
+
+
+class FakeLog (object):
+  def __init__ (self):
+    self.errors = []
+  def debug (self, *args):
+    pass
+  def error (self, *args):
+    self.errors.append(args)
+
+
+class FakeConnection (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+    self.data = b''
+
+  def send (self, data):
+    if not isinstance(data, bytes):
+      data = data.pack()
+    self.data += data
+
+  def messages (self):
+    """
+    (type, xid) of the messages sent so far, which are forgotten
+    """
+    msgs = []
+    offset = 0
+    while offset < len(self.data):
+      _,type,length,xid = _header.unpack_from(self.data, offset)
+      msgs.append((type, xid))
+      offset += length
+    self.data = b''
+    return msgs
+
+
+class FakeOpenFlow (object):
+  def __init__ (self):
+    self.connections = {}
+  def addListeners (self, sink):
+    pass
+  def getConnection (self, dpid):
+    return self.connections.get(dpid)
+
+
+class FakeTopology (object):
+  """
+  Every port leads to another switch (so no MACs are matched or set)
+  """
+  def get_other_end (self, dpid, port_no):
+    return ("s%s-%s" % (dpid, port_no), 1, None)
+  def non_switch_node (self, node_name):
+    return False
+
+
+class FakeEvent (object):
+  def __init__ (self, dpid, xid = None):
+    self.dpid = dpid
+    self.xid = xid
+
+
+class BatchTest (unittest.TestCase):
+  def setUp (self):
+    self._components = dict(core.components)
+    self.openflow = FakeOpenFlow()
+    core.components['openflow'] = self.openflow
+    core.components['SimpleTopology'] = FakeTopology()
+    self.log = FakeLog()
+    self._log = ts.log
+    ts.log = self.log
+    self.ts = ts.TrafficSteering(batch = True)
+    self.cons = {}
+    for dpid in (1, 2):
+      self.cons[dpid] = self.openflow.connections[dpid] = FakeConnection(dpid)
+
+  def tearDown (self):
+    ts.log = self._log
+    core.components.clear()
+    core.components.update(self._components)
+
+  def _add (self, id, *dpids):
+    hops = [RouteHop(dpid, 1, 2) for dpid in dpids]
+    self.ts.add_route(id, hops)
+    return hops
+
+  def _sent (self, dpid):
+    """
+    Checks that dpid was sent flow_mods and one barrier, and returns the
+    number of flow_mods and the barrier's xid
+    """
+    msgs = self.cons[dpid].messages()
+    types = [type for type,xid in msgs]
+    self.assertEqual(types[-1], of.OFPT_BARRIER_REQUEST)
+    self.assertEqual(set(types[:-1]), set([of.OFPT_FLOW_MOD]))
+    return len(msgs) - 1, msgs[-1][1]
+
+  def test_barrier_per_dpid (self):
+    hops = self._add(0, 1) + self._add(1, 1) + self._add(2, 2)
+    for dpid in (1, 2):
+      self.assertEqual(self.cons[dpid].messages(), [])
+    self.ts.flush()
+    n1,xid1 = self._sent(1)
+    n2,xid2 = self._sent(2)
+    self.assertEqual((n1, n2), (2, 1))
+    self.assertNotEqual(xid1, xid2)
+
+    self.ts._handle_BarrierIn(FakeEvent(1, xid1))
+    self.assertEqual([h.status for h in hops],
+                     [RouteHop.INSTALLED, RouteHop.INSTALLED, RouteHop.SENT])
+    self.ts._handle_BarrierIn(FakeEvent(2, xid2))
+    self.assertEqual(hops[2].status, RouteHop.INSTALLED)
+    self.assertEqual(self.log.errors, [])
+
+  def test_reconnect_before_flush (self):
+    hops = self._add(0, 1) + self._add(1, 1)
+    self.ts._handle_ConnectionDown(FakeEvent(1))
+    self.ts._handle_ConnectionUp(FakeEvent(1))
+    self.ts.flush()
+    n,xid = self._sent(1)
+    self.assertEqual(n, 2)
+
+    self.ts._handle_BarrierIn(FakeEvent(1, xid))
+    self.assertEqual([h.status for h in hops],
+                     [RouteHop.INSTALLED, RouteHop.INSTALLED])
+    self.assertEqual(self.log.errors, [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,149 @@
+"""
+Microbenchmark for TrafficSteering's connection event handlers.
+
+run as
+ $ python ts_bench.py [routes] [switches] [hops_per_route]
+
+Installs routes against fake switches (barriers are answered right
+away), then times switch reconnects and topology change notifications,
+comparing the per-dpid hop index with scanning every hop of every route.
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'pox'))
+
+import pox.core
+if pox.core.core is None:
+  pox.core.initialize(threaded_selecthub=False, handle_signals=False)
+core = pox.core.core
+
+import traffic_steering
+from traffic_steering import *
+
+
+class FakeConnection (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+    self.sent = 0
+
+  def send (self, data):
+    self.sent += 1
+
+
+class FakeOpenFlow (object):
+  def __init__ (self):
+    self.connections = {}
+
+  def getConnection (self, dpid):
+    return self.connections.get(dpid)
+
+  def addListeners (self, *args, **kw):
+    pass
+
+
+class FakeTopology (object):
+  """Every port leads to a host, so routes never wait for topology."""
+  def get_other_end (self, dpid, port_no):
+    return 'h%s' % (port_no,), 1, '00:00:00:00:00:%02x' % (port_no % 256,)
+
+  def non_switch_node (self, id):
+    return True
+
+
+class FakeEvent (object):
+  def __init__ (self, **kw):
+    self.__dict__.update(kw)
+
+
+class LinearTrafficSteering (TrafficSteering):
+  """The event handlers as they were before the hop index."""
+  def _handle_SimpleTopology_RecentlyChanged (self, event):
+    for id, r in self._routes.items():
+      if r.status == RouteChanged.STARTING:
+        self._install_route(id)
+
+  def _handle_ConnectionDown (self, event):
+    for r in self._routes.itervalues():
+      for h in r.hops:
+        if h.dpid == event.dpid:
+          h.status = RouteHop.INIT
+          self._change_route_status(r, ROUTE_FAILED)
+
+  def _handle_ConnectionUp (self, event):
+    for r in self._routes.itervalues():
+      for hop in r.hops:
+        if hop.dpid == event.dpid:
+          self._install_hop(hop)
+
+
+calls = []
+
+def run_calls (ts):
+  """Runs callLater()s and answers barriers until nothing is left."""
+  while calls or ts._pending_barriers:
+    while calls:
+      f, args, kw = calls.pop(0)
+      f(*args, **kw)
+    for xid, hops in ts._pending_barriers.items():
+      ts._handle_BarrierIn(FakeEvent(xid = xid, dpid = hops[0].dpid))
+
+
+def bench (cls, routes, switches, hops, seed = 0):
+  rand = random.Random(seed)
+  ts = cls()
+  for i in range(routes):
+    dpids = rand.sample(range(1, switches + 1), hops)
+    ts.add_route(i, [RouteHop(d, 1, 2) for d in dpids])
+  run_calls(ts)
+
+  results = {}
+  dpid = rand.randint(1, switches)
+  con = core.openflow.connections.pop(dpid)
+  start = time.time()
+  ts._handle_ConnectionDown(FakeEvent(dpid = dpid))
+  results['down'] = time.time() - start
+
+  core.openflow.connections[dpid] = con
+  start = time.time()
+  ts._handle_ConnectionUp(FakeEvent(dpid = dpid, connection = con))
+  results['up'] = time.time() - start
+  run_calls(ts)
+
+  start = time.time()
+  for _ in range(10):
+    ts._handle_SimpleTopology_RecentlyChanged(FakeEvent())
+  results['changed'] = (time.time() - start) / 10
+  return results
+
+
+def main ():
+  routes = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+  switches = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+  hops = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+  traffic_steering.log = core.getLogger('traffic_steering')
+  core.components['openflow'] = FakeOpenFlow()
+  core.components['SimpleTopology'] = FakeTopology()
+  core.listen_to_dependencies = lambda *args, **kw: None
+  core.callLater = lambda f, *args, **kw: calls.append((f, args, kw))
+  core.raiseLater = lambda *args, **kw: None
+  core.openflow.connections = dict((d, FakeConnection(d))
+                                   for d in range(1, switches + 1))
+
+  print "%s routes, %s switches, %s hops per route" % (routes, switches, hops)
+  print "%-10s %12s %12s %12s" % ("", "down(ms)", "up(ms)", "changed(ms)")
+  for name, cls in (("linear", LinearTrafficSteering),
+                    ("indexed", TrafficSteering)):
+    r = bench(cls, routes, switches, hops)
+    print "%-10s %12.3f %12.3f %12.3f" % (name, r['down'] * 1000,
+                                          r['up'] * 1000,
+                                          r['changed'] * 1000)
+
+
+if __name__ == '__main__':
+  main()
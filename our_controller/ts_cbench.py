@@ -0,0 +1,167 @@
+# This file is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This file is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Drives traffic_steering for the controller benchmark
+
+The switches are the ones pox/tools/bench_controller.py emulates: a line
+of them, with port 2 of switch n linked to port 1 of switch n+1 and hosts
+on the ports above 2.  Once they've all connected, routes along the line
+are added, and each is timed until traffic_steering says it's STARTED
+(i.e., every hop's barrier has come back).  First, window routes are kept
+in progress at a time (throughput), then one at a time (latency).  The
+results are written as JSON to out.
+
+start as
+ $ ./pox.py traffic_steering ts_cbench --switches=16 --out=ts.json
+"""
+
+import json
+import os
+import random
+import time
+
+from pox.core import core
+
+from traffic_steering import RouteHop, RouteChanged
+
+log = core.getLogger()
+
+
+def _host_mac (dpid, port_no):
+  return '02:00:%02x:%02x:%02x:%02x' % ((dpid >> 16) & 0xff,
+                                        (dpid >> 8) & 0xff, dpid & 0xff,
+                                        port_no)
+
+
+class LineTopology (object):
+  """
+  Stands in for SimpleTopology with the benchmark's line of switches
+  """
+  def __init__ (self, switches):
+    self.switches = switches
+
+  def get_other_end (self, dpid, port_no):
+    if port_no == 1 and dpid > 1:
+      return 's%i' % (dpid - 1,), 2, None
+    if port_no == 2 and dpid < self.switches:
+      return 's%i' % (dpid + 1,), 1, None
+    return 'h%i-%i' % (dpid, port_no), 0, _host_mac(dpid, port_no)
+
+  def non_switch_node (self, node_name):
+    return node_name.startswith('h')
+
+
+class TSBench (object):
+  def __init__ (self, switches, routes, hops, window, ports, out):
+    self.switches = switches
+    self.routes = routes
+    self.hops = min(hops, switches)
+    self.window = window
+    self.ports = ports
+    self.out = out
+    self.rand = random.Random(0)
+    self.results = {}
+    self._phases = [('throughput', window), ('latency', 1)]
+    self._next_id = 0
+    self._triggered = False # Phases scheduled to start?
+    self._started = {} # route id -> time added
+    self._latencies = []
+    if not core.hasComponent('SimpleTopology'):
+      core.register('SimpleTopology', LineTopology(switches))
+    core.listen_to_dependencies(self)
+
+  def _handle_openflow_ConnectionUp (self, event):
+    if len(core.openflow.connections) < self.switches: return
+    if self._triggered: return
+    self._triggered = True
+    log.info("All %i switches connected", self.switches)
+    # Give the other components a moment to finish with the switches
+    core.callDelayed(1, self._start_phase)
+
+  def _make_route (self):
+    first = self.rand.randint(1, self.switches - self.hops + 1)
+    dpids = range(first, first + self.hops)
+    hops = []
+    for dpid in dpids:
+      in_port = 1 if dpid != first else 3 + self.rand.randrange(self.ports)
+      out_port = 2 if dpid != dpids[-1] else 3 + self.rand.randrange(
+          self.ports)
+      hops.append(RouteHop(dpid, in_port, out_port))
+    return hops
+
+  def _start_phase (self):
+    name,window = self._phases[0]
+    log.info("Starting %s phase", name)
+    self._latencies = []
+    self._remaining = self.routes
+    self._phase_start = time.time()
+    self._cpu_start = sum(os.times()[:2])
+    self._add_routes(window)
+
+  def _add_routes (self, window):
+    while self._remaining and len(self._started) < window:
+      self._remaining -= 1
+      id = self._next_id
+      self._next_id += 1
+      self._started[id] = time.time()
+      core.TrafficSteering.add_route(id, self._make_route())
+
+  def _handle_TrafficSteering_RouteChanged (self, event):
+    if event.status != RouteChanged.STARTED: return
+    started = self._started.pop(event.id, None)
+    if started is None: return
+    self._latencies.append(time.time() - started)
+    name,window = self._phases[0]
+    self._add_routes(window)
+    if self._remaining or self._started: return
+
+    elapsed = time.time() - self._phase_start
+    cpu = sum(os.times()[:2]) - self._cpu_start
+    latencies = sorted(self._latencies)
+    def percentile (p):
+      return latencies[min(len(latencies) - 1,
+                           int(len(latencies) * p / 100.0))]
+    self.results[name] = {
+      'routes' : self.routes,
+      'hops' : self.hops,
+      'window' : window,
+      'elapsed' : elapsed,
+      'routes_per_second' : self.routes / elapsed,
+      'flow_mods_per_second' : self.routes * self.hops / elapsed,
+      'p50_ms' : percentile(50) * 1000,
+      'p99_ms' : percentile(99) * 1000,
+      'cpu_percent' : 100.0 * cpu / elapsed,
+    }
+    log.info("%s: %.0f routes/s, p50 %.2f ms, p99 %.2f ms", name,
+             self.results[name]['routes_per_second'],
+             self.results[name]['p50_ms'], self.results[name]['p99_ms'])
+
+    self._phases.pop(0)
+    if self._phases:
+      core.callLater(self._start_phase)
+    else:
+      self._write()
+
+  def _write (self):
+    if not self.out: return
+    # Write it elsewhere first so that nobody sees half a file
+    with open(self.out + ".tmp", "w") as f:
+      json.dump(self.results, f, indent = 2, sort_keys = True)
+    os.rename(self.out + ".tmp", self.out)
+
+
+def launch (switches = 16, routes = 1000, hops = 4, window = 100, ports = 4,
+            out = None):
+  core.registerNew(TSBench, int(switches), int(routes), int(hops),
+                   int(window), int(ports), out)
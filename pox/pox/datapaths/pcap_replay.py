@@ -0,0 +1,291 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Replays a pcap file into a controller as PacketIns
+
+A fake switch connects to the controller (like the other datapaths) and
+sends each packet in the trace as a table-miss PacketIn at the target rate
+(packets per second; 0 means as fast as the controller keeps up).  Replies
+which refer to a PacketIn's buffer (packet_outs and flow_mods) are matched
+up with it, and the controller's throughput and latency percentiles are
+logged every report seconds and when the replay is done.
+
+Flow_mods aren't installed, so every packet goes to the controller (as
+with cbench).  Each packet comes in on a port picked by its source MAC, so
+a learning controller sees hosts stay put.  At most window PacketIns are
+outstanding at once; ones without a reply after timeout seconds count as
+lost.
+
+Run it in a POX of its own, pointed at the controller being tested:
+./pox.py --no-openflow datapaths.pcap_replay --pcap=trace.pcap --rate=5000
+"""
+
+from pox.core import core
+from pox.datapaths import do_launch
+from pox.datapaths.switch import SoftwareSwitchBase
+from pox.lib.pxpcap.parser import PCapFileReader
+from pox.lib.recoco import Task, Timer
+import pox.openflow.libopenflow_01 as of
+from pox.lib.util import str_to_bool
+from collections import deque
+import struct
+import time
+import logging
+
+log = core.getLogger()
+
+# OpenFlow header and the fixed part of a PacketIn
+_packet_in = struct.Struct("!BBHLLHHBx")
+
+# Most PacketIns to send before letting other tasks run
+_BATCH = 256
+
+
+def _percentile (ordered, p):
+  if not ordered: return 0.0
+  i = int(len(ordered) * p / 100.0 + 0.5) - 1
+  return ordered[min(max(i, 0), len(ordered) - 1)]
+
+
+class ReplayStats (object):
+  """
+  Counts and latencies for (part of) a replay
+  """
+  def __init__ (self, start = None):
+    self.start = time.time() if start is None else start
+    self.sent = 0
+    self.replies = 0
+    self.unmatched = 0 # Replies for no outstanding PacketIn
+    self.lost = 0
+    self.latencies = []
+
+  def as_dict (self, now = None):
+    if now is None: now = time.time()
+    elapsed = max(now - self.start, 1e-9)
+    ordered = sorted(self.latencies)
+    return {
+      'elapsed' : elapsed,
+      'sent' : self.sent,
+      'replies' : self.replies,
+      'unmatched' : self.unmatched,
+      'lost' : self.lost,
+      'sent_per_second' : self.sent / elapsed,
+      'replies_per_second' : self.replies / elapsed,
+      'p50' : _percentile(ordered, 50),
+      'p90' : _percentile(ordered, 90),
+      'p99' : _percentile(ordered, 99),
+      'max' : ordered[-1] if ordered else 0.0,
+    }
+
+  def __str__ (self):
+    d = self.as_dict()
+    return ("%(sent)i sent (%(sent_per_second).0f/s), %(replies)i replies "
+            "(%(replies_per_second).0f/s), %(lost)i lost; latency ms "
+            "p50 %(p50_ms).2f p90 %(p90_ms).2f p99 %(p99_ms).2f "
+            "max %(max_ms).2f"
+            % dict(d, **dict((k + "_ms", d[k] * 1000)
+                             for k in ('p50','p90','p99','max'))))
+
+
+class ReplaySwitch (SoftwareSwitchBase):
+  """
+  A switch which sends the packets of a pcap file as PacketIns
+  """
+  # Default level for loggers of this class
+  default_log_level = logging.INFO
+
+  def __init__ (self, pcap, rate = 0, loops = 1, window = 1000,
+                timeout = 2, quit_when_done = False, **kw):
+    # (Set before the superclass looks through our attributes for handlers)
+    self._packets = None # Iterator over the data of packets to send
+    self._port_for_src = {}
+    self._next_buffer_id = 0
+    self._outstanding = {}    # buffer_id -> time sent
+    self._sent_order = deque() # (time sent, buffer_id)
+
+    log_level = kw.pop('log_level', self.default_log_level)
+    super(ReplaySwitch,self).__init__(**kw)
+    self.log.setLevel(log_level)
+
+    self.reader = PCapFileReader(pcap)
+    self.rate = rate
+    self.loops = loops
+    self.window = window
+    self.timeout = timeout
+    self.quit_when_done = quit_when_done
+
+    self.started = None
+    self.finished = None
+    self.total = None
+    self.interval = None
+
+  def _iter_packets (self):
+    for _ in range(self.loops):
+      for t,data in self.reader:
+        yield data
+
+  def start_replay (self):
+    if self._packets is not None: return
+    self.log.info("Starting replay")
+    self._packets = self._iter_packets()
+    self.started = time.time()
+    self.total = ReplayStats(self.started)
+    self.interval = ReplayStats(self.started)
+    ReplayTask(self).start()
+
+  def _in_port (self, data):
+    src = data[6:12]
+    port = self._port_for_src.get(src)
+    if port is None:
+      port = 1 + len(self._port_for_src) % len(self.ports)
+      self._port_for_src[src] = port
+    return port
+
+  def send_batch (self, now):
+    """
+    Sends the PacketIns which are due (up to _BATCH of them)
+
+    Also expires PacketIns which haven't been replied to.  Returns the
+    number sent.
+    """
+    self._expire(now)
+    if not self._packets: return 0
+
+    n = _BATCH
+    if self.rate:
+      n = min(n, int((now - self.started) * self.rate) - self.total.sent)
+    n = min(n, self.window - len(self._outstanding))
+
+    connection = self._connection
+    miss_send_len = self.miss_send_len
+    count = 0
+    while count < n:
+      try:
+        data = next(self._packets)
+      except StopIteration:
+        self._packets = False
+        break
+      if len(data) < 14: continue
+
+      buffer_id = self._next_buffer_id
+      self._next_buffer_id = (buffer_id + 1) & 0x7fffFFff
+      size = min(len(data), miss_send_len)
+      header = _packet_in.pack(of.OFP_VERSION, of.OFPT_PACKET_IN,
+                               _packet_in.size + size, 0, buffer_id,
+                               len(data), self._in_port(data),
+                               of.OFPR_NO_MATCH)
+      connection.send(header + data[:size])
+      self._outstanding[buffer_id] = now
+      self._sent_order.append((now, buffer_id))
+      count += 1
+
+    self.total.sent += count
+    self.interval.sent += count
+    return count
+
+  @property
+  def done (self):
+    return self._packets is False and not self._outstanding
+
+  def _expire (self, now):
+    order = self._sent_order
+    cutoff = now - self.timeout
+    while order and order[0][0] < cutoff:
+      _,buffer_id = order.popleft()
+      if self._outstanding.pop(buffer_id, None) is not None:
+        self.total.lost += 1
+        self.interval.lost += 1
+    if not self._outstanding: order.clear()
+
+  def _reply (self, buffer_id):
+    sent = self._outstanding.pop(buffer_id, None)
+    if sent is None:
+      if self.total: self.total.unmatched += 1
+      if self.interval: self.interval.unmatched += 1
+      return
+    latency = time.time() - sent
+    for s in (self.total, self.interval):
+      s.replies += 1
+      s.latencies.append(latency)
+
+  def report (self):
+    """
+    Logs the statistics since the last report and starts new ones
+
+    Returns False once the replay is over (which stops a report Timer).
+    """
+    if self.interval is None: return self.finished is None
+    self.log.info("Last %.1f s: %s", time.time() - self.interval.start,
+                  self.interval)
+    self.interval = ReplayStats()
+
+  def _rx_features_request (self, ofp, connection):
+    super(ReplaySwitch,self)._rx_features_request(ofp, connection)
+    if self.started is None:
+      # Give the controller a moment to finish setting up the connection
+      self.started = False
+      core.callDelayed(1, self.start_replay)
+
+  def _rx_packet_out (self, packet_out, connection):
+    self._reply(packet_out.buffer_id)
+
+  def _rx_flow_mod (self, ofp, connection):
+    if ofp.buffer_id is not None:
+      self._reply(ofp.buffer_id)
+
+  def _output_packet_physical (self, packet, port_no):
+    pass
+
+
+class ReplayTask (Task):
+  """
+  Feeds a ReplaySwitch's PacketIns to the controller
+  """
+  def __init__ (self, switch):
+    Task.__init__(self)
+    self.switch = switch
+
+  def run (self):
+    sw = self.switch
+    while not sw.done:
+      n = sw.send_batch(time.time())
+      # If nothing was due, wait a bit for the rate or window to allow more
+      yield 0 if n else 0.001
+
+    sw.finished = time.time()
+    sw.report()
+    sw.interval = None
+    sw.log.info("Replay done in %.3f s: %s", sw.finished - sw.started,
+                sw.total)
+    if sw.quit_when_done:
+      core.quit()
+
+
+def launch (pcap, rate = 0, loops = 1, window = 1000, timeout = 2,
+            ports = 16, report = 1, quit = True, address = '127.0.0.1',
+            port = 6633, max_retry_delay = 16, dpid = None, extra = None,
+            __INSTANCE__ = None):
+  """
+  Replays pcap into the controller at address:port
+
+  rate is in packets per second (0 for as fast as possible), and the trace
+  is sent loops times.  Statistics are logged every report seconds (0 for
+  just at the end).  If quit is set, POX exits when the replay is done.
+  """
+  sw = do_launch(ReplaySwitch, address, port, max_retry_delay, dpid,
+                 extra_args = extra, pcap = pcap, rate = float(rate),
+                 loops = int(loops), window = int(window),
+                 timeout = float(timeout), ports = int(ports),
+                 quit_when_done = str_to_bool(quit))
+  if float(report):
+    Timer(float(report), sw.report, recurring = True)
@@ -244,8 +244,7 @@ class PCapSwitch (ExpireMixin, SoftwareSwitchBase):
       while True:
         self.q.task_done()
         port_no,data = data
-        data = ethernet(data)
-        batch.append((data,port_no))
+        batch.append((ethernet(data),port_no,data))
         try:
           data = self.q.get(block=False)
         except:
@@ -253,8 +252,8 @@ class PCapSwitch (ExpireMixin, SoftwareSwitchBase):
       core.callLater(self.rx_batch, batch)
 
   def rx_batch (self, batch):
-    for data,port_no in batch:
-      self.rx_packet(data, port_no)
+    for packet,port_no,data in batch:
+      self.rx_packet(packet, port_no, data)
 
   def _pcap_rx (self, px, data, sec, usec, length):
     if px.port_no is None: return
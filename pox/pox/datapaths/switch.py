@@ -510,7 +510,8 @@ class SoftwareSwitchBase (object):
       self.port_stats[in_port].rx_bytes += len(packet.pack()) # Expensive
 
     self._lookup_count += 1
-    entry = self.table.entry_for_packet(packet, in_port)
+    entry = self.table.entry_for_packet(packet if packet_data is None
+                                        else packet_data, in_port)
     if entry is not None:
       self._matched_count += 1
       entry.touch_packet(len(packet))
@@ -1052,10 +1053,16 @@ class ExpireMixin (object):
     if not expire_period:
       # Disable
       return
-    self._expire_timer = Timer(expire_period,
-                               self.table.remove_expired_entries,
+    self._expire_timer = Timer(expire_period, self._expire_entries,
                                recurring=True)
 
+  def _expire_entries (self):
+    table = self.table
+    table.remove_expired_entries()
+    if table.last_expired_count:
+      self.log.debug("Expired %i flows in %.3f ms", table.last_expired_count,
+                     table.last_expiry_time * 1000)
+
 
 class OFConnection (object):
   """
@@ -31,7 +31,7 @@ from pox.core import core
 import pox.openflow.libopenflow_01 as of
 from pox.lib.revent import *
 from pox.lib.recoco import Timer
-from collections import defaultdict
+from collections import defaultdict, deque
 from pox.openflow.discovery import Discovery
 from pox.lib.util import dpid_to_str
 import time
@@ -47,9 +47,6 @@ switches = {}
 # ethaddr -> (switch, port)
 mac_map = {}
 
-# [sw1][sw2] -> (distance, intermediate)
-path_map = defaultdict(lambda:defaultdict(lambda:(None,None)))
-
 # Waiting path.  (dpid,xid)->WaitingPath
 waiting_paths = {}
 
@@ -64,61 +61,122 @@ FLOW_HARD_TIMEOUT = 30
 PATH_SETUP_TIME = 4
 
 
-def _calc_paths ():
+class PathCache (object):
   """
-  Essentially Floyd-Warshall algorithm
+  Lazily computed all-pairs shortest paths
+
+  Rather than running Floyd-Warshall over the whole network whenever any
+  link changes, we keep one BFS tree (distance and parent maps) per source
+  switch.  Trees are built the first time a path from that source is asked
+  for, and a link change only throws away the trees it can affect.
   """
+  def __init__ (self):
+    # src -> (dist, parent).  dist: [sw] -> hops, parent: [sw] -> sw
+    self._trees = {}
+
+    # Some statistics
+    self.trees_computed = 0
+    self.trees_invalidated = 0
+
+  def __len__ (self):
+    return len(self._trees)
+
+  def clear (self):
+    self.trees_invalidated += len(self._trees)
+    self._trees.clear()
+
+  def _get_tree (self, src):
+    t = self._trees.get(src)
+    if t is not None: return t
+
+    dist = {src:0}
+    parent = {src:None}
+    frontier = deque([src])
+    while frontier:
+      sw = frontier.popleft()
+      d = dist[sw] + 1
+      for nsw,port in adjacency[sw].iteritems():
+        if port is None or nsw in dist: continue
+        dist[nsw] = d
+        parent[nsw] = sw
+        frontier.append(nsw)
+
+    t = (dist, parent)
+    self._trees[src] = t
+    self.trees_computed += 1
+    return t
+
+  def get_distance (self, src, dst):
+    """
+    Returns hop count from src to dst or None if unreachable
+    """
+    return self._get_tree(src)[0].get(dst)
+
+  def get_raw_path (self, src, dst):
+    """
+    Get a raw path (just a list of intermediate nodes to traverse)
+
+    Returns None if dst can't be reached from src.
+    """
+    if src is dst:
+      # We're here!
+      return []
+    dist,parent = self._get_tree(src)
+    if dst not in dist:
+      return None
+    path = []
+    sw = parent[dst]
+    while sw is not src:
+      path.append(sw)
+      sw = parent[sw]
+    path.reverse()
+    return path
+
+  def link_up (self, sw1, sw2):
+    """
+    Invalidates trees which may be improved by a new sw1 <-> sw2 link
 
-  def dump ():
-    for i in sws:
-      for j in sws:
-        a = path_map[i][j][0]
-        #a = adjacency[i][j]
-        if a is None: a = "*"
-        print a,
-      print
-
-  sws = switches.values()
-  path_map.clear()
-  for k in sws:
-    for j,port in adjacency[k].iteritems():
-      if port is None: continue
-      path_map[k][j] = (1,None)
-    path_map[k][k] = (0,None) # distance, intermediate
-
-  #dump()
-
-  for k in sws:
-    for i in sws:
-      for j in sws:
-        if path_map[i][k][0] is not None:
-          if path_map[k][j][0] is not None:
-            # i -> k -> j exists
-            ikj_dist = path_map[i][k][0]+path_map[k][j][0]
-            if path_map[i][j][0] is None or ikj_dist < path_map[i][j][0]:
-              # i -> k -> j is better than existing
-              path_map[i][j] = (ikj_dist, k)
-
-  #print "--------------------"
-  #dump()
+    A tree can only get better if the new link connects a reachable
+    switch to an unreachable one, or if it short-cuts two switches whose
+    distances from the source differ by more than one hop.
+    """
+    dead = []
+    for src,(dist,parent) in self._trees.iteritems():
+      d1 = dist.get(sw1)
+      d2 = dist.get(sw2)
+      if d1 is None and d2 is None: continue
+      if d1 is None or d2 is None or abs(d1 - d2) > 1:
+        dead.append(src)
+    self._invalidate(dead)
+
+  def link_down (self, sw1, sw2):
+    """
+    Invalidates trees which used the sw1 <-> sw2 link
+
+    Removing a link can't shorten any path, so trees which don't use
+    it are still shortest path trees.
+    """
+    dead = []
+    for src,(dist,parent) in self._trees.iteritems():
+      if parent.get(sw2) is sw1 or parent.get(sw1) is sw2:
+        dead.append(src)
+    self._invalidate(dead)
+
+  def _invalidate (self, srcs):
+    for src in srcs:
+      del self._trees[src]
+    self.trees_invalidated += len(srcs)
+
+
+# Shortest path cache over adjacency
+path_cache = PathCache()
 
 
 def _get_raw_path (src, dst):
   """
   Get a raw path (just a list of nodes to traverse)
   """
-  if len(path_map) == 0: _calc_paths()
-  if src is dst:
-    # We're here!
-    return []
-  if path_map[src][dst][0] is None:
-    return None
-  intermediate = path_map[src][dst][1]
-  if intermediate is None:
-    # Directly connected
-    return []
-  return _get_raw_path(src, intermediate) + [intermediate] + \
-         _get_raw_path(intermediate, dst)
+  return path_cache.get_raw_path(src, dst)
 
 
 def _check_path (p):
@@ -431,7 +489,7 @@ class l2_multi (EventMixin):
     sw1 = switches[l.dpid1]
     sw2 = switches[l.dpid2]
 
-    # Invalidate all flows and path info.
+    # Invalidate all flows.
     # For link adds, this makes sure that if a new link leads to an
     # improved path, we use it.
     # For link removals, this makes sure that we don't use a
@@ -441,7 +499,10 @@ class l2_multi (EventMixin):
     for sw in switches.itervalues():
       if sw.connection is None: continue
       sw.connection.send(clear)
-    path_map.clear()
+
+    # Path info is only invalidated where the switch-level connectivity
+    # actually changes (a removed link may be replaced by a parallel one).
+    was_connected = adjacency[sw1][sw2] is not None
 
     if event.removed:
       # This link no longer okay
@@ -457,6 +518,9 @@ class l2_multi (EventMixin):
             adjacency[sw2][sw1] = ll.port2
             # Fixed -- new link chosen to connect these
             break
+
+      if was_connected and adjacency[sw1][sw2] is None:
+        path_cache.link_down(sw1, sw2)
     else:
       # If we already consider these nodes connected, we can
       # ignore this link up.
@@ -469,6 +533,9 @@ class l2_multi (EventMixin):
           adjacency[sw1][sw2] = l.port1
           adjacency[sw2][sw1] = l.port2
 
+      if not was_connected and adjacency[sw1][sw2] is not None:
+        path_cache.link_up(sw1, sw2)
+
       # If we have learned a MAC on this port which we now know to
       # be connected to a switch, unlearn it.
       bad_macs = set()
@@ -34,6 +34,9 @@ def launch (src_mac = None, no_flow = False, **kw):
     elif k == 'pingLim':
       host_tracker.PingCtrl.pingLim = int(v)
       log.debug("Changing ping limit to %s",v)
+    elif k == 'pingRate':
+      host_tracker.PingCtrl.pingRate = float(v)
+      log.debug("Changing ping rate to %s",v)
     else:
       log.error("Unknown option: %s(=%s)",k,v)
   core.registerNew(host_tracker.host_tracker, ping_src_mac = src_mac,
@@ -38,6 +38,16 @@ Good values for testing:
 
 You can also specify how many ARP pings we try before deciding it failed:
   --pingLim=2
+
+Entries are kept in a heap ordered by when they might expire, so each timer
+activation only looks at the ones which are due.  ARP pings aren't sent
+right away; they're queued and sent at an even pace over the following
+timer interval (but no faster than pingRate per second), so that lots of
+entries going quiet at once doesn't hold everything else up:
+  --pingRate=1000
+
+Counts of entries, outstanding pings and expirations are available from the
+stats property.
 """
 
 from pox.core import core
@@ -57,6 +67,9 @@ import pox.openflow.discovery as discovery
 from pox.lib.revent.revent import *
 
 import time
+import heapq
+import itertools
+from collections import deque
 
 import pox
 log = core.getLogger()
@@ -74,6 +87,12 @@ timeoutSec = dict(
 # The particular one here is just an arbitrary locally administered address.
 DEFAULT_ARP_PING_SRC_MAC = '02:00:00:00:be:ef'
 
+# Seconds between sending batches of queued ARP pings
+PING_TICK = 0.1
+
+# Seconds of history expirations per second is averaged over
+STATS_WINDOW = 60
+
 
 class HostEvent (Event):
   """
@@ -120,6 +139,10 @@ class Alive (object):
     self.lastTimeSeen = time.time()
     self.interval=livelinessInterval
 
+  @property
+  def deadline (self):
+    return self.lastTimeSeen + self.interval
+
   def expired (self):
     return time.time() > self.lastTimeSeen + self.interval
 
@@ -134,9 +157,13 @@ class PingCtrl (Alive):
   # Number of ARP ping attemps before deciding it failed
   pingLim=3
 
+  # Maximum number of ARP pings to send per second
+  pingRate=1000
+
   def __init__ (self):
     super(PingCtrl,self).__init__(timeoutSec['arpReply'])
     self.pending = 0
+    self.queued = False # Waiting in host_tracker's ping queue
 
   def sent (self):
     self.refresh()
@@ -222,8 +249,31 @@ class host_tracker (EventMixin):
 
     # The following tables should go to Topology later
     self.entryByMAC = {}
+
+    # Heap of (deadline, seq, entry, macEntry, ip_addr), with one item for
+    # each MacEntry (ip_addr is None) and IpEntry.  An entry may have been
+    # seen since it went in, in which case it's pushed back on when it
+    # comes out; entries which have been removed are just dropped.
+    self._expiry_heap = []
+    self._seq = itertools.count()
+
+    # (macEntry, ip_addr, ipEntry) for pings waiting to be sent, and the
+    # IpEntries we've pinged and are waiting to hear from
+    self._ping_queue = deque()
+    self._ping_rate = 0.0
+    self._ping_credit = 0.0
+    self._last_ping_tick = time.time()
+    self._awaiting_reply = set()
+
+    self._started = time.time()
+    self._pings_sent = 0
+    self._expired_macs = 0
+    self._expired_ips = 0
+    self._expirations = deque() # (time, expirations) for each check
+
     self._t = Timer(timeoutSec['timerInterval'],
                     self._check_timeouts, recurring=True)
+    self._ping_timer = Timer(PING_TICK, self._send_pings, recurring=True)
 
     # Listen to openflow with high priority if we want to eat our ARP replies
     listen_args = {}
@@ -242,9 +292,35 @@ class host_tracker (EventMixin):
       result = None
     return result
 
+  @property
+  def stats (self):
+    """
+    Host tracking statistics
+
+    A dict of how many MAC and IP entries are being tracked, how many pings
+    are queued or waiting for a reply, and how many entries have expired
+    (in all, and per second over the last STATS_WINDOW seconds).
+    """
+    now = time.time()
+    recent = sum(n for t,n in self._expirations if t > now - STATS_WINDOW)
+    span = min(STATS_WINDOW, max(now - self._started, 1))
+    return {
+      'macs' : len(self.entryByMAC),
+      'ips' : sum(len(e.ipAddrs) for e in self.entryByMAC.itervalues()),
+      'pings_queued' : len(self._ping_queue),
+      'pings_outstanding' : len(self._awaiting_reply),
+      'pings_sent' : self._pings_sent,
+      'ping_rate' : self._ping_rate,
+      'expired_macs' : self._expired_macs,
+      'expired_ips' : self._expired_ips,
+      'expirations_per_second' : recent / float(span),
+    }
+
   def sendPing (self, macEntry, ipAddr):
     """
     Builds an ETH/IP any-to-any ARP packet (an "ARP ping")
+
+    Returns True if it was sent.
     """
     r = arp()
     r.opcode = arp.REQUEST
@@ -261,12 +337,13 @@ class host_tracker (EventMixin):
     if core.openflow.sendToDPID(macEntry.dpid, msg.pack()):
       ipEntry = macEntry.ipAddrs[ipAddr]
       ipEntry.pings.sent()
+      return True
     else:
       # macEntry is stale, remove it.
       log.debug("%i %i ERROR sending ARP REQ to %s %s",
                 macEntry.dpid, macEntry.port, str(r.hwdst), str(r.protodst))
-      del macEntry.ipAddrs[ipAddr]
-    return
+      self._awaiting_reply.discard(macEntry.ipAddrs.pop(ipAddr))
+      return False
 
   def getSrcIPandARP (self, packet):
     """
@@ -308,9 +385,11 @@ class host_tracker (EventMixin):
       # new mapping
       ipEntry = IpEntry(hasARP)
       macEntry.ipAddrs[pckt_srcip] = ipEntry
+      self._push_expiry(ipEntry, macEntry, pckt_srcip)
       log.info("Learned %s got IP %s", str(macEntry), str(pckt_srcip) )
     if hasARP:
       ipEntry.pings.received()
+      self._awaiting_reply.discard(ipEntry)
 
   def _handle_openflow_ConnectionUp (self, event):
     if not self.install_flow: return
@@ -361,6 +440,7 @@ class host_tracker (EventMixin):
       # should we raise a NewHostFound event (at the end)?
       macEntry = MacEntry(dpid,inport,packet.src)
       self.entryByMAC[packet.src] = macEntry
+      self._push_expiry(macEntry, macEntry)
       log.info("Learned %s", str(macEntry))
       self.raiseEventNoErrors(HostEvent, macEntry, join=True)
     elif macEntry != (dpid, inport, packet.src):
@@ -388,29 +468,128 @@ class host_tracker (EventMixin):
     if self.eat_packets and packet.dst == self.ping_src_mac:
       return EventHalt
 
+  def _push_expiry (self, entry, macEntry, ip_addr = None, deadline = None):
+    if deadline is None: deadline = entry.deadline
+    heapq.heappush(self._expiry_heap,
+                   (deadline, next(self._seq), entry, macEntry, ip_addr))
+
   def _check_timeouts (self):
     """
     Checks for timed out entries
+
+    Only entries which are due come off the heap.  IP addresses which have
+    gone quiet are queued to be pinged, and checked again once the ping
+    has had time to be answered.  MAC entries expire once they've gone
+    quiet and none of their addresses are (or are about to be) pinged.
+    """
+    now = time.time()
+    heap = self._expiry_heap
+    expired = 0
+    while heap and heap[0][0] <= now:
+      _,_,entry,macEntry,ip_addr = heapq.heappop(heap)
+      if self.entryByMAC.get(macEntry.macaddr) is not macEntry:
+        continue # Already removed
+      if ip_addr is None:
+        if self._check_mac(macEntry, now):
+          expired += 1
+      elif macEntry.ipAddrs.get(ip_addr) is entry:
+        if self._check_ip(macEntry, ip_addr, entry, now):
+          expired += 1
+
+    if expired:
+      self._expirations.append((now, expired))
+    while self._expirations and self._expirations[0][0] < now - STATS_WINDOW:
+      self._expirations.popleft()
+
+    # Spread the pings we have to send over the next interval
+    interval = timeoutSec['timerInterval']
+    self._ping_rate = min(PingCtrl.pingRate,
+                          max(len(self._ping_queue) / float(interval),
+                              1.0 / PING_TICK))
+
+  def _check_ip (self, macEntry, ip_addr, ipEntry, now):
+    """
+    Handles an IpEntry coming off the expiry heap
+
+    Returns True if it expired.
+    """
+    pings = ipEntry.pings
+    if not ipEntry.expired():
+      self._push_expiry(ipEntry, macEntry, ip_addr)
+    elif pings.queued:
+      # Still waiting for its turn to be pinged
+      self._push_expiry(ipEntry, macEntry, ip_addr,
+                        now + timeoutSec['arpReply'])
+    elif pings.pending and not pings.expired():
+      # Give the last ping time to be answered
+      self._push_expiry(ipEntry, macEntry, ip_addr, pings.deadline)
+    elif pings.failed():
+      del macEntry.ipAddrs[ip_addr]
+      self._awaiting_reply.discard(ipEntry)
+      self._expired_ips += 1
+      log.info("Entry %s: IP address %s expired",
+               str(macEntry), str(ip_addr) )
+      return True
+    else:
+      pings.queued = True
+      self._ping_queue.append((macEntry, ip_addr, ipEntry))
+      self._push_expiry(ipEntry, macEntry, ip_addr,
+                        now + timeoutSec['arpReply'])
+    return False
+
+  def _check_mac (self, macEntry, now):
+    """
+    Handles a MacEntry coming off the expiry heap
+
+    Returns True if it expired.
+    """
+    if not macEntry.expired():
+      self._push_expiry(macEntry, macEntry)
+      return False
+    for ipEntry in macEntry.ipAddrs.itervalues():
+      pings = ipEntry.pings
+      if (pings.queued or pings.pending
+          or (ipEntry.expired() and not pings.failed())):
+        # Wait and see if it answers
+        self._push_expiry(macEntry, macEntry, None,
+                          now + timeoutSec['arpReply'])
+        return False
+
+    log.info("Entry %s expired", str(macEntry))
+    # sanity check: there should be no IP addresses left
+    if len(macEntry.ipAddrs) > 0:
+      for ip_addr in macEntry.ipAddrs.keys():
+        log.warning("Entry %s expired but still had IP address %s",
+                    str(macEntry), str(ip_addr) )
+        self._awaiting_reply.discard(macEntry.ipAddrs.pop(ip_addr))
+    self._expired_macs += 1
+    self.raiseEventNoErrors(HostEvent, macEntry, leave=True)
+    del self.entryByMAC[macEntry.macaddr]
+    return True
+
+  def _send_pings (self):
+    """
+    Sends queued ARP pings at (about) the current ping rate
     """
-    for macEntry in self.entryByMAC.values():
-      entryPinged = False
-      for ip_addr, ipEntry in macEntry.ipAddrs.items():
-        if ipEntry.expired():
-          if ipEntry.pings.failed():
-            del macEntry.ipAddrs[ip_addr]
-            log.info("Entry %s: IP address %s expired",
-                     str(macEntry), str(ip_addr) )
-          else:
-            self.sendPing(macEntry,ip_addr)
-            ipEntry.pings.sent()
-            entryPinged = True
-      if macEntry.expired() and not entryPinged:
-        log.info("Entry %s expired", str(macEntry))
-        # sanity check: there should be no IP addresses left
-        if len(macEntry.ipAddrs) > 0:
-          for ip in macEntry.ipAddrs.keys():
-            log.warning("Entry %s expired but still had IP address %s",
-                        str(macEntry), str(ip_addr) )
-            del macEntry.ipAddrs[ip_addr]
-        self.raiseEventNoErrors(HostEvent, macEntry, leave=True)
-        del self.entryByMAC[macEntry.macaddr]
+    now = time.time()
+    elapsed = now - self._last_ping_tick
+    self._last_ping_tick = now
+    queue = self._ping_queue
+    if not queue:
+      self._ping_credit = 0.0
+      return
+
+    # Don't let credit build up into a burst if the tick was late
+    rate = self._ping_rate
+    self._ping_credit = min(self._ping_credit + rate * elapsed,
+                            max(1.0, rate * PING_TICK))
+    while queue and self._ping_credit >= 1:
+      macEntry,ip_addr,ipEntry = queue.popleft()
+      ipEntry.pings.queued = False
+      if self.entryByMAC.get(macEntry.macaddr) is not macEntry: continue
+      if macEntry.ipAddrs.get(ip_addr) is not ipEntry: continue
+      if not ipEntry.expired(): continue # Heard from it in the meantime
+      self._ping_credit -= 1
+      if self.sendPing(macEntry, ip_addr):
+        self._pings_sent += 1
+        self._awaiting_reply.add(ipEntry)
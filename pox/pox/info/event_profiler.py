@@ -0,0 +1,302 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Profiles revent event dispatch
+
+While this is running, every event handler call is timed.  For each event
+type and each handler, it keeps call counts, cumulative time, a latency
+histogram (from which percentiles are estimated), and how many times the
+event was halted or the handler raised an exception.  Handlers which take
+longer than the warning threshold are logged right away, since they're
+holding up the whole cooperative loop.
+
+The statistics (along with the recoco scheduler's statistics) are
+available as core.EventProfiler.as_dict(), can be dumped to a JSON file
+periodically and at shutdown, and are served as JSON by the web server
+(if it's running) at /profile/events.
+
+  info.event_profiler --warn=0.05 --dump=events.json --interval=30
+"""
+
+from pox.core import core
+from pox.lib.revent import Event, setEventProfiler
+from pox.lib.revent.revent import CallProxy
+import json
+import time
+
+log = core.getLogger()
+
+# Histogram buckets are powers of two in microseconds; bucket i counts
+# calls which took less than 2**i us (the last also counts anything longer)
+_BUCKETS = 32
+
+
+def _event_name (eventType):
+  return "%s.%s" % (eventType.__module__, eventType.__name__)
+
+
+def _handler_key (handler):
+  """
+  Returns (function, class) for a handler
+
+  Bound methods are different objects every time they're looked up, so
+  they're identified by their function and the class of their object.
+  """
+  if isinstance(handler, CallProxy):
+    o = handler.obj() if handler.obj is not None else None
+    return (handler.method, type(o) if o is not None else None)
+  f = getattr(handler, 'im_func', None)
+  if f is not None:
+    return (f, handler.im_class)
+  return (handler, None)
+
+
+def _handler_name (key):
+  f,cls = key
+  name = getattr(f, '__name__', None)
+  if name is None: return str(f)
+  if cls is not None:
+    return "%s.%s.%s" % (cls.__module__, cls.__name__, name)
+  return "%s.%s" % (getattr(f, '__module__', '?'), name)
+
+
+class LatencyStats (object):
+  """
+  Call count, time and latency histogram for a handler or event type
+  """
+  def __init__ (self):
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+    self.halts = 0
+    self.errors = 0
+    self.buckets = [0] * _BUCKETS
+
+  def add (self, elapsed):
+    self.count += 1
+    self.total += elapsed
+    if elapsed > self.max: self.max = elapsed
+    b = int(elapsed * 1000000).bit_length()
+    if b >= _BUCKETS: b = _BUCKETS - 1
+    self.buckets[b] += 1
+
+  def percentile (self, p):
+    """
+    Estimates the p-th percentile latency (in seconds)
+
+    This is the upper edge of the histogram bucket it falls into, so it
+    is never an underestimate (but is capped at the maximum seen).
+    """
+    if self.count == 0: return 0.0
+    want = self.count * p / 100.0
+    seen = 0
+    for i,n in enumerate(self.buckets):
+      seen += n
+      if seen >= want:
+        return min((1 << i) / 1000000.0, self.max)
+    return self.max
+
+  def as_dict (self):
+    return {
+      'count' : self.count,
+      'total' : self.total,
+      'mean' : self.total / self.count if self.count else 0.0,
+      'max' : self.max,
+      'p50' : self.percentile(50),
+      'p90' : self.percentile(90),
+      'p99' : self.percentile(99),
+      'halts' : self.halts,
+      'errors' : self.errors,
+      'histogram' : dict(("<%ius" % (1 << i), n)
+                         for i,n in enumerate(self.buckets) if n),
+    }
+
+
+class EventProfiler (object):
+  """
+  Times event handlers as revent invokes them
+
+  Call start() to begin instrumenting and stop() to go back to plain
+  dispatch.
+  """
+  def __init__ (self, warn = 0.1, warn_interval = 5):
+    """
+    warn is how long (in seconds) a handler can take before it's logged;
+    each handler is logged at most every warn_interval seconds.
+    """
+    self.warn = warn
+    self.warn_interval = warn_interval
+    self.reset()
+
+  def reset (self):
+    self.started = time.time()
+    self._events = {}     # eventType -> [raised count, LatencyStats]
+    self._handlers = {}   # (eventType, handler key) -> LatencyStats
+    self._names = {}      # handler key -> name
+    self._warned = {}     # handler key -> time of last warning
+
+  def start (self):
+    setEventProfiler(self)
+
+  def stop (self):
+    setEventProfiler(None)
+
+  def _event_stats (self, eventType):
+    e = self._events.get(eventType)
+    if e is None:
+      e = self._events[eventType] = [0, LatencyStats()]
+    return e
+
+  def raised (self, eventType):
+    self._event_stats(eventType)[0] += 1
+
+  def invoke (self, eventType, event, handler, classCall, args, kw):
+    key = _handler_key(handler)
+    start = time.time()
+    try:
+      if classCall:
+        rv = event._invoke(handler, *args, **kw)
+      else:
+        rv = handler(event, *args, **kw)
+    except:
+      self._record(eventType, event, key, time.time() - start, None, True)
+      raise
+    self._record(eventType, event, key, time.time() - start, rv, False)
+    return rv
+
+  def _record (self, eventType, event, key, elapsed, rv, error):
+    hkey = (eventType, key)
+    stats = self._handlers.get(hkey)
+    if stats is None:
+      stats = self._handlers[hkey] = LatencyStats()
+      if key not in self._names:
+        self._names[key] = _handler_name(key)
+    estats = self._event_stats(eventType)[1]
+    stats.add(elapsed)
+    estats.add(elapsed)
+
+    # The same things raiseEvent() takes as a halt
+    if (rv is True or (type(rv) is tuple and (len(rv) == 0 or rv[0]))
+        or (isinstance(event, Event) and event.halt)):
+      stats.halts += 1
+      estats.halts += 1
+    if error:
+      stats.errors += 1
+      estats.errors += 1
+
+    if self.warn is not None and elapsed >= self.warn:
+      now = time.time()
+      if now - self._warned.get(key, 0) >= self.warn_interval:
+        self._warned[key] = now
+        log.warning("%s took %.3f s to handle %s", self._names[key],
+                    elapsed, eventType.__name__)
+
+  def as_dict (self):
+    """
+    Returns the statistics as a dict (suitable for JSON)
+
+    Handlers are listed by event type, slowest (by total time) first.
+    """
+    # Copies, since this may be called from another thread (e.g., the
+    # web server's) while events are being raised
+    events = dict(self._events)
+    handlers = dict(self._handlers)
+    names = dict(self._names)
+
+    by_event = {}
+    for (eventType,key),stats in handlers.items():
+      d = stats.as_dict()
+      d['handler'] = names.get(key) or _handler_name(key)
+      by_event.setdefault(eventType, []).append(d)
+
+    r = {}
+    for eventType,(raised,stats) in events.items():
+      d = stats.as_dict()
+      d['raised'] = raised
+      d['handlers'] = sorted(by_event.get(eventType, []),
+                             key = lambda h: h['total'], reverse = True)
+      r[_event_name(eventType)] = d
+    r = {'started' : self.started, 'now' : time.time(), 'events' : r}
+    scheduler = getattr(core, 'scheduler', None)
+    if scheduler is not None:
+      r['scheduler'] = scheduler.stats
+    return r
+
+  def as_json (self):
+    return json.dumps(self.as_dict(), indent = 2, sort_keys = True)
+
+  def dump (self, filename):
+    with open(filename, "w") as f:
+      f.write(self.as_json())
+      f.write("\n")
+
+
+def _launch_web (profiler, path):
+  from pox.web.webcore import SplitRequestHandler
+
+  class EventProfileHandler (SplitRequestHandler):
+    """
+    Serves the event profile as JSON (GET ?reset to also clear it)
+    """
+    def do_GET (self):
+      self.do_content(True)
+
+    def do_HEAD (self):
+      self.do_content(False)
+
+    def do_content (self, is_get):
+      r = profiler.as_json()
+      if self.path.split("?", 1)[-1] == "reset":
+        core.callLater(profiler.reset)
+      self.send_response(200)
+      self.send_header("Content-type", "application/json")
+      self.send_header("Content-Length", str(len(r)))
+      self.end_headers()
+      if is_get:
+        self.wfile.write(r)
+
+  core.WebServer.set_handler(path, EventProfileHandler, None, True)
+
+
+def launch (warn = 0.1, dump = None, interval = 0, web_path = "/profile/events"):
+  """
+  Starts profiling event dispatch
+
+  warn is in seconds ("none" to not warn about slow handlers).  If dump is
+  a filename, the statistics are written there at shutdown, and every
+  interval seconds if interval is set.  web_path is where the web server
+  (if any) serves them.
+  """
+  if str(warn).lower() == "none":
+    warn = None
+  else:
+    warn = float(warn)
+
+  profiler = EventProfiler(warn = warn)
+  core.register("EventProfiler", profiler)
+  profiler.start()
+
+  if dump:
+    def do_dump (event = None):
+      try:
+        profiler.dump(dump)
+      except Exception:
+        log.exception("Couldn't write event profile to %s", dump)
+    if float(interval):
+      from pox.lib.recoco import Timer
+      Timer(float(interval), do_dump, recurring = True)
+    core.addListenerByName("GoingDownEvent", do_dump)
+
+  if web_path and str(web_path).lower() != "none":
+    core.call_when_ready(_launch_web, "WebServer",
+                         args = (profiler, web_path))
@@ -26,7 +26,7 @@ from collections import deque
 import socket
 
 from pox.lib.util import assert_type, makePinger
-from pox.lib.recoco import Select, Task
+from pox.lib.recoco import Select, Task, TASK_IO
 
 from pox.core import core
 log = core.getLogger()
@@ -351,6 +351,7 @@ class RecocoIOLoop (Task):
   """
   recoco task that handles the actual IO for our IO workers
   """
+  task_class = TASK_IO
   _select_timeout = 5
   _BUF_SIZE = 8192
   more_debugging = False
@@ -42,6 +42,11 @@ class ethernet(packet_base):
 
   resolve_names = False
 
+  # If True, parsing only unpacks the Ethernet type.  The addresses and the
+  # layers above Ethernet are parsed when they are first accessed, so
+  # nothing above the Ethernet header is touched (or copied) unless used.
+  lazy = False
+
   MIN_LEN = 14
 
   IP_TYPE    = 0x0800
@@ -71,7 +76,8 @@ class ethernet(packet_base):
 
   type_parsers = {}
 
-  def __init__(self, raw=None, prev=None, **kw):
+  def __init__(self, raw=None, prev=None, lazy=None, **kw):
+    self._lazy_next = False
     packet_base.__init__(self)
 
     if len(ethernet.type_parsers) == 0:
@@ -103,11 +109,14 @@ class ethernet(packet_base):
     self.next = b''
 
     if raw is not None:
-      self.parse(raw)
+      self.parse(raw, lazy)
 
     self._init(kw)
 
-  def parse (self, raw):
+  def parse (self, raw, lazy = None):
+    """
+    Parses raw (lazily if lazy, or if it's None and ethernet.lazy is set)
+    """
     assert isinstance(raw, bytes)
     self.next = None # In case of unfinished parsing
     self.raw = raw
@@ -117,16 +126,56 @@ class ethernet(packet_base):
                % (alen,))
       return
 
-    self.dst = EthAddr(raw[:6])
-    self.src = EthAddr(raw[6:12])
-    self.type = struct.unpack('!H', raw[12:ethernet.MIN_LEN])[0]
+    self.type = struct.unpack_from('!H', raw, 12)[0]
 
     self.hdr_len = ethernet.MIN_LEN
     self.payload_len = alen - self.hdr_len
 
-    self.next = ethernet.parse_next(self, self.type, raw, ethernet.MIN_LEN)
+    if lazy or (lazy is None and self.lazy):
+      self._dst = None
+      self._src = None
+      self._lazy_next = self.type
+    else:
+      self.dst = EthAddr(raw[:6])
+      self.src = EthAddr(raw[6:12])
+      self.next = ethernet.parse_next(self, self.type, raw, ethernet.MIN_LEN)
     self.parsed = True
 
+  @property
+  def dst (self):
+    if self._dst is None:
+      self._dst = EthAddr(self.raw[:6])
+    return self._dst
+
+  @dst.setter
+  def dst (self, value):
+    self._dst = value
+
+  @property
+  def src (self):
+    if self._src is None:
+      self._src = EthAddr(self.raw[6:12])
+    return self._src
+
+  @src.setter
+  def src (self, value):
+    self._src = value
+
+  @property
+  def next (self):
+    # _lazy_next is the ethertype of a payload which isn't parsed yet
+    if self._lazy_next is not False:
+      typelen = self._lazy_next
+      self._lazy_next = False
+      self._next = ethernet.parse_next(self, typelen, self.raw,
+                                       ethernet.MIN_LEN)
+    return self._next
+
+  @next.setter
+  def next (self, value):
+    self._lazy_next = False
+    self._next = value
+
   @staticmethod
   def parse_next (prev, typelen, raw, offset=0, allow_llc=True):
     parser = ethernet.type_parsers.get(typelen)
@@ -16,6 +16,10 @@
 A parser for pcap data files.
 
 It's not great, but does the job for now.
+
+PCapParser is fed data in chunks (e.g., as it comes off a socket).  For
+files on disk, PCapFileReader maps the file into memory and hands out views
+of the packets without copying them.
 """
 
 #TODO:
@@ -23,11 +27,25 @@ It's not great, but does the job for now.
 # Add usec to the datetime one?
 
 from datetime import datetime
-from struct import unpack_from
+from struct import unpack_from, Struct
+import mmap
+
+_GLOBAL_HEADER_LEN = 4 + 2 + 2 + 4 + 4 + 4 + 4
+_RECORD_HEADER_LEN = 16
+
+# Magic numbers (as they appear in the file) -> (struct prefix, ticks/sec)
+_MAGIC = {
+  b"\xd4\xc3\xb2\xa1" : ("<", 1000000),
+  b"\xa1\xb2\xc3\xd4" : (">", 1000000),
+  b"\x4d\x3c\xb2\xa1" : ("<", 1000000000), # Nanosecond timestamps
+  b"\xa1\xb2\x3c\x4d" : (">", 1000000000),
+}
+
 
 class PCapParser (object):
   def __init__ (self, callback = None):
     self._buf = b''
+    self._pos = 0 # Offset of unprocessed data in _buf
     self._proc = self._proc_global_header
     self._prefix = ''
     self.version = None
@@ -44,11 +62,11 @@ class PCapParser (object):
     return unpack_from(self._prefix + format, data, offset)
 
   def _proc_global_header (self):
-    header_len = 4 + 2 + 2 + 4 + 4 + 4 + 4
-    if len(self._buf) < header_len: return
+    header_len = _GLOBAL_HEADER_LEN
+    pos = self._pos
+    if len(self._buf) - pos < header_len: return
 
-    magic = self._buf[0:4]
-    header = self._buf[4:header_len]
+    magic = self._buf[pos:pos+4]
 
     if magic == "\xd4\xc3\xb2\xa1":
       self._prefix = "<"
@@ -57,22 +75,23 @@ class PCapParser (object):
     else:
       raise RuntimeError("Wrong magic number")
 
-    major,minor = self._unpack("HH", header[:4])
+    major,minor = self._unpack("HH", self._buf, pos + 4)
     self.version = float("%s.%s" % (major,minor))
 
     if self.version != 2.4:
       raise RuntimeError("Unknown PCap version: %s" % (self.version,))
 
-    tz,accuracy,self.snaplen,self.lltype = self._unpack("LLLL", header[4:])
+    tz,accuracy,self.snaplen,self.lltype = self._unpack("LLLL", self._buf,
+                                                        pos + 8)
 
-    self._buf = self._buf[header_len:]
+    self._pos += header_len
     self._proc = self._proc_header
 
   def _proc_header (self):
-    if len(self._buf) < 16: return
+    if len(self._buf) - self._pos < _RECORD_HEADER_LEN: return
     self._sec_raw,self._usec,self._cap_size, self._wire_size \
-        = self._unpack("LLLL", self._buf[:16])
-    self._buf = self._buf[16:]
+        = self._unpack("LLLL", self._buf, self._pos)
+    self._pos += _RECORD_HEADER_LEN
     self._proc = self._proc_packet
 
   @property
@@ -86,18 +105,88 @@ class PCapParser (object):
     return s
 
   def _proc_packet (self):
-    if len(self._buf) < self._cap_size: return
-    data = self._buf[:self._cap_size]
-    self._buf = self._buf[self._cap_size:]
+    pos = self._pos
+    if len(self._buf) - pos < self._cap_size: return
+    data = self._buf[pos:pos+self._cap_size]
+    self._pos += self._cap_size
     self._proc = self._proc_header
     self._packet(data)
 
   def feed (self, data):
-    self._buf += data
-
-    s = len(self._buf)
-    while s > 0:
-      self._proc()
-      new_s = len(self._buf)
-      if new_s == s: break
-      s = new_s
+    # Only drop what's been processed once per feed, rather than slicing
+    # the whole remaining buffer for every record
+    if self._pos:
+      self._buf = self._buf[self._pos:] + data
+      self._pos = 0
+    else:
+      self._buf += data
+
+    while True:
+      proc,pos = self._proc,self._pos
+      proc()
+      if self._pos == pos and self._proc == proc: break
+
+
+class PCapFileReader (object):
+  """
+  Reads a pcap file through a memory mapping
+
+  Iterating over it gives (time, data) for each packet, where data is a
+  read-only buffer which refers to the mapping rather than a copy of the
+  packet (str() it if you need to keep it past close()).
+
+  r = PCapFileReader("trace.pcap")
+  for t,data in r:
+    ...
+  r.close()
+  """
+  def __init__ (self, filename):
+    self._file = open(filename, "rb")
+    try:
+      self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    except:
+      self._file.close()
+      raise
+    if len(self._map) < _GLOBAL_HEADER_LEN:
+      self.close()
+      raise RuntimeError("Not a pcap file")
+
+    magic = self._map[0:4]
+    if magic not in _MAGIC:
+      self.close()
+      raise RuntimeError("Wrong magic number")
+    prefix,self._ticks = _MAGIC[magic]
+
+    major,minor,tz,accuracy,self.snaplen,self.lltype = unpack_from(
+        prefix + "HHlLLL", self._map, 4)
+    self.version = float("%s.%s" % (major,minor))
+    if self.version != 2.4:
+      self.close()
+      raise RuntimeError("Unknown PCap version: %s" % (self.version,))
+
+    self._record_header = Struct(prefix + "LLLL")
+
+  def __iter__ (self):
+    m = self._map
+    end = len(m)
+    unpack = self._record_header.unpack_from
+    ticks = float(self._ticks)
+    pos = _GLOBAL_HEADER_LEN
+    while pos + _RECORD_HEADER_LEN <= end:
+      sec,frac,cap_size,wire_size = unpack(m, pos)
+      pos += _RECORD_HEADER_LEN
+      if pos + cap_size > end: break # Truncated
+      yield sec + frac / ticks, buffer(m, pos, cap_size)
+      pos += cap_size
+
+  def close (self):
+    if self._map is not None:
+      self._map.close()
+      self._map = None
+    self._file.close()
+
+  def __enter__ (self):
+    return self
+
+  def __exit__ (self, *args):
+    self.close()
@@ -87,6 +87,7 @@ def launch (infile, outfile, in_only=False, out_only = False):
   p = pxparse.PCapParser(callback=pi_cb)
   _writer = pxwriter.PCapRawWriter(open(outfile, "w"))
   p.feed(data)
+  _writer.close()
 
   log.info("%i packet_ins, %i packet_outs", _pis, _pos)
 
@@ -18,17 +18,28 @@ Utilities for writing/synthesizing pcap files
 
 import time as pytime
 import datetime
-from struct import pack
+from struct import pack, Struct
+
+_record_header = Struct("IIII")
 
 #TODO: Incorporate the one from lib.socketcapture
 
 class PCapRawWriter (object):
-  def __init__ (self, outstream, flush = False):
+  """
+  Writes packets to a pcap file
+
+  Records are collected and written to the stream in chunks of about
+  buffer_size bytes (or after every packet if flush is True), so call
+  flush() or close() when you're done.
+  """
+  def __init__ (self, outstream, flush = False, buffer_size = 64*1024):
     """
     outstream is the stream to write the PCAP trace to.
     """
     self._out = outstream
     self._flush = flush
+    self._buffer_size = buffer_size
+    self._pending = bytearray()
 
     outstream.write(pack("IHHiIII",
       0xa1b2c3d4,      # Magic
@@ -56,11 +67,30 @@ class PCapRawWriter (object):
     ut = t - int(t)
     t = int(t)
     ut = int(ut * 1000000)
-    self._out.write(pack("IIII",
+    self._pending += _record_header.pack(
       t,ut,          # Timestamp
       len(buf),      # Saved size
       wire_size,     # Original size
-      ))
+      )
+    self._pending += buf
+
+    if self._flush:
+      self.flush()
+    elif len(self._pending) >= self._buffer_size:
+      self._write_pending()
 
-    self._out.write(buf)
-    if self._flush: self._out.flush()
+  def _write_pending (self):
+    if self._pending:
+      self._out.write(self._pending)
+      del self._pending[:]
+
+  def flush (self):
+    self._write_pending()
+    self._out.flush()
+
+  def close (self):
+    """
+    Writes anything buffered and closes the stream
+    """
+    self._write_pending()
+    self._out.close()
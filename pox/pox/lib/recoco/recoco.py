@@ -32,6 +32,20 @@ from pox.lib.epoll_select import EpollSelect
 
 CYCLE_MAXIMUM = 2
 
+# Task classes, from most to least urgent.  When tasks of several classes
+# are ready, each class gets a share of the scheduler's time in proportion
+# to its weight.
+TASK_IO = 0           # Socket I/O (e.g., OpenFlow connections)
+TASK_CONTROL = 1      # The default (callLater(), timers, most tasks)
+TASK_BACKGROUND = 2   # Bulk work which can wait
+TASK_CLASS_NAMES = ('io', 'control', 'background')
+TASK_CLASS_WEIGHTS = (8, 4, 1)
+
+# How long a task which has a lot of small things to do (like the task
+# behind callLater()) should run before giving other tasks a turn.  Slices
+# over twice this long are counted as overruns in the scheduler statistics.
+SLICE_BUDGET = 0.01
+
 # A ReturnFunction can return this to skip a scheduled slice at the last
 # moment.
 ABORT = object()
@@ -48,6 +62,7 @@ class BaseTask  (object):
   id = None
   #running = False
   priority = 1
+  task_class = TASK_CONTROL
 
   @classmethod
   def new (cls, *args, **kw):
@@ -68,15 +83,17 @@ class BaseTask  (object):
     self.rv = None
     self.rf = None # ReturnFunc
 
-  def start (self, scheduler = None, priority = None, fast = False):
+  def start (self, scheduler = None, priority = None, fast = False,
+             task_class = None):
     """
     Schedules this task.
 
     See Scheduler.schedule() and Scheduler.fast_schedule() for the meaning
-    of the 'fast' argument.
+    of the 'fast' argument.  task_class is one of the TASK_XXX classes.
     """
     if scheduler is None: scheduler = defaultScheduler
     if priority != None: self.priority = priority
+    if task_class != None: self.task_class = task_class
     if fast:
       scheduler.fast_schedule(self)
     else:
@@ -133,13 +150,117 @@ class Task (BaseTask):
     return "<" + self.__class__.__name__ + "/tid" + str(self.name) + ">"
 
 
+class TaskClassStats (object):
+  """
+  Scheduling statistics for one task class
+  """
+  def __init__ (self, name):
+    self.name = name
+    self.scheduled = 0   # Times a task was made ready
+    self.runs = 0        # Slices run
+    self.run_time = 0.0
+    self.max_run = 0.0
+    self.overruns = 0    # Slices longer than 2 * SLICE_BUDGET
+    self.wait_time = 0.0 # Time tasks spent ready but not running
+    self.max_wait = 0.0
+    self.max_depth = 0
+
+  def as_dict (self, depth = 0):
+    return dict(name = self.name, depth = depth, max_depth = self.max_depth,
+                scheduled = self.scheduled, runs = self.runs,
+                run_time = self.run_time, max_run = self.max_run,
+                overruns = self.overruns, wait_time = self.wait_time,
+                max_wait = self.max_wait,
+                mean_wait = self.wait_time / self.runs if self.runs else 0.0)
+
+
+class ReadyQueue (object):
+  """
+  The ready Tasks of a Scheduler, in a queue per task class
+
+  Tasks are taken from the class which has had the least run time for its
+  weight (so, e.g., with weights of 8 and 1, I/O tasks can use eight times
+  as much time as background ones before the background ones get priority).
+  A class which has been idle only gets credit back to the level of the
+  busy classes, so that it can't catch up by monopolizing the scheduler.
+
+  Tasks are woken from other threads (e.g., the SelectHub), so appending
+  only does things which are safe to race with popleft().
+  """
+  def __init__ (self, weights = TASK_CLASS_WEIGHTS):
+    self.weights = tuple(weights)
+    self.queues = [deque() for _ in self.weights]
+    self.stats = [TaskClassStats(n) for n in TASK_CLASS_NAMES]
+    self._vtime = [0.0] * len(self.weights)
+    self._running = None # Class of the task between popleft() and charge()
+    # Kept here since the scheduler thread may still be running when the
+    # interpreter is shutting down and module globals are gone
+    self.clock = time.time
+
+  def __len__ (self):
+    return sum(len(q) for q in self.queues)
+
+  def __contains__ (self, task):
+    return any(task in q for q in self.queues)
+
+  def append (self, task, first = False):
+    c = task.task_class
+    q = self.queues[c]
+    if not q and c != self._running:
+      busy = [self._vtime[i] for i,bq in enumerate(self.queues) if bq]
+      if busy and self._vtime[c] < min(busy):
+        self._vtime[c] = min(busy)
+    task._ready_time = self.clock()
+    if first:
+      q.appendleft(task)
+    else:
+      q.append(task)
+    stats = self.stats[c]
+    stats.scheduled += 1
+    if len(q) > stats.max_depth: stats.max_depth = len(q)
+
+  def appendleft (self, task):
+    self.append(task, True)
+
+  def popleft (self):
+    """
+    Removes and returns the next Task to run (IndexError if none)
+    """
+    best = None
+    for c,q in enumerate(self.queues):
+      if q and (best is None or self._vtime[c] < self._vtime[best]):
+        best = c
+    if best is None: raise IndexError("no ready tasks")
+    self._running = best
+    t = self.queues[best].popleft()
+    wait = self.clock() - t._ready_time
+    stats = self.stats[best]
+    stats.wait_time += wait
+    if wait > stats.max_wait: stats.max_wait = wait
+    return t
+
+  def charge (self, task, elapsed):
+    """
+    Accounts for task having just run for elapsed seconds
+    """
+    c = task.task_class
+    self._running = None
+    self._vtime[c] += elapsed / self.weights[c]
+    stats = self.stats[c]
+    stats.runs += 1
+    stats.run_time += elapsed
+    if elapsed > stats.max_run: stats.max_run = elapsed
+    if elapsed > 2 * SLICE_BUDGET: stats.overruns += 1
+
+
 class Scheduler (object):
   """ Scheduler for Tasks """
 
   def __init__ (self, isDefaultScheduler = None, startInThread = True,
-                daemon = False, use_epoll=False, threaded_selecthub = True):
+                daemon = False, use_epoll=False, threaded_selecthub = True,
+                class_weights = TASK_CLASS_WEIGHTS):
 
-    self._ready = deque()
+    self._ready = ReadyQueue(class_weights)
     self._hasQuit = False
 
     self._selectHub = SelectHub(self, use_epoll=use_epoll,
@@ -184,6 +305,18 @@ class Scheduler (object):
   def synchronized (self):
     return Synchronizer(self)
 
+  @property
+  def stats (self):
+    """
+    Scheduling statistics for each task class
+
+    A dict mapping class names to dicts of the ready queue depth, the time
+    tasks spent waiting and running, and so on (see TaskClassStats).
+    """
+    r = self._ready
+    return dict((s.name, s.as_dict(len(q)))
+                for s,q in zip(r.stats, r.queues))
+
   def schedule (self, task, first = False):
     """
     Schedule the given task to run later.
@@ -276,6 +409,20 @@ class Scheduler (object):
 
     #print(len(self._ready), "tasks")
 
+    clock = self._ready.clock
+    start = clock()
+    try:
+      self._run_slice(t)
+    finally:
+      try:
+        self._ready.charge(t, clock() - start)
+      except:
+        # Accounting must not take the scheduler down (which can happen if
+        # the interpreter is shutting down underneath us)
+        pass
+    return True
+
+  def _run_slice (self, t):
     while True:
       try:
         rv = t.execute()
@@ -882,16 +1029,28 @@ class CallLaterTask (BaseTask):
     self._pinger = pox.lib.util.makePinger()
     from collections import deque
     self._calls = deque()
+    # Whether we've pinged since we last ponged.  Pinging only once in that
+    # time keeps the pipe from filling (and blocking pings) when the queue
+    # stays busy and we don't wait on it.
+    self._pinged = False
 
   def callLater (self, func, *args, **kw):
     assert callable(func)
     self._calls.append((func,args,kw))
-    self._pinger.ping()
+    if not self._pinged:
+      self._pinged = True
+      self._pinger.ping()
 
   def run (self):
     while True:
-      yield Select([self._pinger], None, None)
-      self._pinger.pongAll()
+      if not self._calls:
+        yield Select([self._pinger], None, None)
+        self._pinger.pongAll()
+        # (After the pong, or a ping since then could go missing)
+        self._pinged = False
+      # Only run calls for so long, so that a flood of them doesn't keep
+      # other tasks (especially I/O) from running
+      deadline = time.time() + SLICE_BUDGET
       try:
         while True:
           e = self._calls.popleft()
@@ -900,8 +1059,11 @@ class CallLaterTask (BaseTask):
           except:
             import logging
             logging.getLogger("recoco").exception("Exception calling %s", e[0])
-      except:
+          if time.time() >= deadline: break
+      except IndexError:
         pass
+      if self._calls:
+        yield 0
 
 
 class BlockingTask (BaseTask):
@@ -101,6 +101,23 @@ import operator
 import weakref
 
 
+# If set (see setEventProfiler()), raiseEvent() has this invoke handlers
+_profiler = None
+
+def setEventProfiler (profiler):
+  """
+  Sets an object which instruments event dispatch (or None to remove it)
+
+  The profiler is told about every event which has handlers with
+  profiler.raised(eventType), and then calls each handler itself with
+  profiler.invoke(eventType, event, handler, classCall, args, kw), which
+  must call the handler just like raiseEvent() would and return its
+  return value.  See pox.info.event_profiler.
+  """
+  global _profiler
+  _profiler = profiler
+
+
 _nextEventID = 0
 def _generateEventID ():
   """
@@ -276,8 +293,13 @@ class EventMixin (object):
     # Create a copy so that it can be modified freely during event
     # processing.  It might make sense to change this.
     handlers = self._eventMixin_handlers.get(eventType, [])
+    profiler = _profiler
+    if profiler is not None and handlers:
+      profiler.raised(eventType)
     for (priority, handler, once, eid) in handlers:
-      if classCall:
+      if profiler is not None:
+        rv = profiler.invoke(eventType, event, handler, classCall, args, kw)
+      elif classCall:
         rv = event._invoke(handler, *args, **kw)
       else:
         rv = handler(event, *args, **kw)
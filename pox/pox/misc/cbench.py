@@ -17,6 +17,9 @@ a dummy module for oflops cbench benchmark
 
 this is intended to be comparable with ryu cbench app.
 	https://github.com/osrg/ryu/blob/master/ryu/app/cbench.py
+
+tools/bench_controller.py runs it (and other controllers) against emulated
+switches, so oflops isn't needed.
 """
 
 from pox.core import core
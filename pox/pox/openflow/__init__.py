@@ -34,7 +34,7 @@ NOTE: This module is usually automatically loaded by pox.py
 """
 
 from pox.lib.revent import *
-from pox.lib.util import dpidToStr
+from pox.lib.util import dpidToStr, str_to_bool
 import libopenflow_01 as of
 from pox.lib.packet.ethernet import ethernet
 
@@ -382,8 +382,14 @@ def _launch (default_arbiter=True):
     core.registerNew(OpenFlowConnectionArbiter)
   core.register("openflow", OpenFlowNexus())
 
-def launch (default_arbiter=True):
+def launch (default_arbiter=True, lazy_parsing=False):
+  """
+  With --lazy_parsing, the layers above Ethernet of PacketIns are only
+  parsed when they're first accessed
+  """
   from pox.core import core
+  if str_to_bool(lazy_parsing):
+    ethernet.lazy = True
   if core.hasComponent("openflow"):
     return
   return _launch(default_arbiter)
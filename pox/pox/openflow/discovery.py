@@ -32,28 +32,44 @@ import pox.lib.packet as pkt
 
 import struct
 import time
-from collections import namedtuple
+from collections import namedtuple, deque
+import heapq
 from random import shuffle, random
 
 
 log = core.getLogger()
 
+# What LLDPSender's packets look like at fixed offsets
+_lldp_type_raw = struct.pack("!H", pkt.ethernet.LLDP_TYPE)
+_ndp_multicast_raw = pkt.ETHERNET.NDP_MULTICAST.toRaw()
+_chassis_id_prefix = struct.pack("!HB", pkt.lldp.CHASSIS_ID_TLV << 9 | 22,
+                                 pkt.chassis_id.SUB_LOCAL) + b'dpid:'
+_tlv_header = struct.Struct("!H")
+
 
 class LLDPSender (object):
   """
   Sends out discovery packets
-  """
 
-  SendItem = namedtuple("LLDPSenderItem", ('dpid','port_num','packet'))
-
-  #NOTE: This class keeps the packets to send in a flat list, which makes
-  #      adding/removing them on switch join/leave or (especially) port
-  #      status changes relatively expensive. Could easily be improved.
+  The discovery packets for each switch are built (and packed) when its
+  ports change, so sending them is just a write.  Usually, they're a single
+  ofp_packet_out: LLDP packets sent out different ports only differ in the
+  port ID TLV and the Ethernet source address, so the packet-out carries a
+  single LLDP packet whose port ID says to look at the Ethernet source, and
+  has a set-source and an output action for each port.  Ports which don't
+  have an address unique on their switch get packets of their own.
+  """
 
   # Maximum times to run the timer per second
   _sends_per_sec = 15
 
-  def __init__ (self, send_cycle_time, ttl = 120):
+  # Maximum number of ports a single batched packet-out goes out of
+  _max_batch = 256
+
+  # Port ID (subtype "local") of LLDP packets sent out several ports
+  PORT_ID_BY_SOURCE = 'dl_src'
+
+  def __init__ (self, send_cycle_time, ttl = 120, batch = True):
     """
     Initialize an LLDP packet sender
 
@@ -64,18 +80,31 @@ class LLDPSender (object):
     ttl is the time (in seconds) for which a receiving LLDP agent should
       consider the rest of the data to be valid.  We don't use this, but
       other LLDP agents might.  Can't be 0 (this means revoke).
+
+    batch is whether to send the packets for several ports of a switch in
+      a single packet-out.
     """
-    # Packets remaining to be sent in this cycle
-    self._this_cycle = []
+    # DPIDs of switches remaining to be sent to in this cycle
+    self._this_cycle = deque()
 
-    # Packets we've already sent in this cycle
-    self._next_cycle = []
+    # DPIDs of switches we've already sent to in this cycle
+    self._next_cycle = deque()
 
-    # Packets to send in a batch
+    # DPID -> {port_num:port_addr}
+    self._ports = {}
+
+    # DPID -> packed packet-outs to send to it
+    self._packets = {}
+
+    # DPID -> {raw port_addr:port_num} for ports in batched packet-outs
+    self._port_addrs = {}
+
+    # Switches to send to in a batch
     self._send_chunk_size = 1
 
     self._timer = None
     self._ttl = ttl
+    self._batch = batch
     self._send_cycle_time = send_cycle_time
     core.listen_to_dependencies(self)
 
@@ -83,57 +112,105 @@ class LLDPSender (object):
     """
     Track changes to switch ports
     """
-    if event.added:
+    if event.added or event.modified:
       self.add_port(event.dpid, event.port, event.ofp.desc.hw_addr)
     elif event.deleted:
       self.del_port(event.dpid, event.port)
 
   def _handle_openflow_ConnectionUp (self, event):
     self.del_switch(event.dpid, set_timer = False)
-
-    ports = [(p.port_no, p.hw_addr) for p in event.ofp.ports]
-
-    for port_num, port_addr in ports:
-      self.add_port(event.dpid, port_num, port_addr, set_timer = False)
-
-    self._set_timer()
+    self.add_switch(event.dpid, [(p.port_no, p.hw_addr)
+                                 for p in event.ofp.ports])
 
   def _handle_openflow_ConnectionDown (self, event):
     self.del_switch(event.dpid)
 
+  def add_switch (self, dpid, ports, set_timer = True):
+    """
+    Starts sending to a switch
+
+    ports is a list of (port_num, port_addr) pairs.
+    """
+    if dpid not in self._ports:
+      self._next_cycle.append(dpid)
+    self._ports[dpid] = dict((port_num, port_addr)
+                             for port_num, port_addr in ports
+                             if port_num <= of.OFPP_MAX)
+    self._build(dpid)
+    if set_timer: self._set_timer()
+
   def del_switch (self, dpid, set_timer = True):
-    self._this_cycle = [p for p in self._this_cycle if p.dpid != dpid]
-    self._next_cycle = [p for p in self._next_cycle if p.dpid != dpid]
+    if self._ports.pop(dpid, None) is None: return
+    self._packets.pop(dpid, None)
+    self._port_addrs.pop(dpid, None)
+    for q in (self._this_cycle, self._next_cycle):
+      if dpid in q: q.remove(dpid)
     if set_timer: self._set_timer()
 
   def del_port (self, dpid, port_num, set_timer = True):
     if port_num > of.OFPP_MAX: return
-    self._this_cycle = [p for p in self._this_cycle
-                        if p.dpid != dpid or p.port_num != port_num]
-    self._next_cycle = [p for p in self._next_cycle
-                        if p.dpid != dpid or p.port_num != port_num]
-    if set_timer: self._set_timer()
+    ports = self._ports.get(dpid)
+    if ports is None or ports.pop(port_num, None) is None: return
+    self._build(dpid)
 
   def add_port (self, dpid, port_num, port_addr, set_timer = True):
     if port_num > of.OFPP_MAX: return
-    self.del_port(dpid, port_num, set_timer = False)
-    self._next_cycle.append(LLDPSender.SendItem(dpid, port_num,
-          self.create_packet_out(dpid, port_num, port_addr)))
-    if set_timer: self._set_timer()
+    if dpid not in self._ports:
+      self.add_switch(dpid, [(port_num, port_addr)], set_timer)
+      return
+    self._ports[dpid][port_num] = port_addr
+    self._build(dpid)
+
+  def port_for_addr (self, dpid, addr):
+    """
+    Returns the port of a switch which sent a batched discovery packet
+
+    addr is the packet's (raw) Ethernet source address.
+    """
+    return self._port_addrs.get(dpid, {}).get(addr)
+
+  def _build (self, dpid):
+    """
+    Builds the packet-outs to send to a switch
+    """
+    ports = sorted(self._ports[dpid].iteritems())
+    addr_count = {}
+    for port_num, port_addr in ports:
+      addr_count[port_addr] = addr_count.get(port_addr, 0) + 1
+
+    if self._batch:
+      batch = [(n,a) for n,a in ports if addr_count[a] == 1]
+      single = [(n,a) for n,a in ports if addr_count[a] != 1]
+    else:
+      batch = []
+      single = ports
+    if len(batch) < 2:
+      single = ports
+      batch = []
+
+    packets = []
+    for i in range(0, len(batch), self._max_batch):
+      packets.append(self.create_batch_packet_out(dpid,
+                                                  batch[i:i+self._max_batch]))
+    for port_num, port_addr in single:
+      packets.append(self.create_packet_out(dpid, port_num, port_addr))
+
+    self._packets[dpid] = b''.join(packets)
+    self._port_addrs[dpid] = dict((a.toRaw(), n) for n,a in batch)
 
   def _set_timer (self):
     if self._timer: self._timer.cancel()
     self._timer = None
-    num_packets = len(self._this_cycle) + len(self._next_cycle)
+    num_switches = len(self._packets)
 
-    if num_packets == 0: return
+    if num_switches == 0: return
 
     self._send_chunk_size = 1 # One at a time
-    interval = self._send_cycle_time / float(num_packets)
+    interval = self._send_cycle_time / float(num_switches)
     if interval < 1.0 / self._sends_per_sec:
       # Would require too many sends per sec -- send more than one at once
       interval = 1.0 / self._sends_per_sec
-      chunk = float(num_packets) / self._send_cycle_time / self._sends_per_sec
+      chunk = float(num_switches) / self._send_cycle_time / self._sends_per_sec
       self._send_chunk_size = chunk
 
     self._timer = Timer(interval,
@@ -143,22 +220,23 @@ class LLDPSender (object):
     """
     Called by a timer to actually send packets.
 
-    Picks the first packet off this cycle's list, sends it, and then puts
-    it on the next-cycle list.  When this cycle's list is empty, starts
-    the next cycle.
+    Takes the first switch off this cycle's queue, sends its packets, and
+    then puts it on the next cycle's queue.  When this cycle's queue is
+    empty, starts the next cycle.
     """
     num = int(self._send_chunk_size)
     fpart = self._send_chunk_size - num
     if random() < fpart: num += 1
 
     for _ in range(num):
-      if len(self._this_cycle) == 0:
-        self._this_cycle = self._next_cycle
-        self._next_cycle = []
-        #shuffle(self._this_cycle)
-      item = self._this_cycle.pop(0)
-      self._next_cycle.append(item)
-      core.openflow.sendToDPID(item.dpid, item.packet)
+      if not self._this_cycle:
+        if not self._next_cycle: return
+        self._this_cycle,self._next_cycle = self._next_cycle,self._this_cycle
+      dpid = self._this_cycle.popleft()
+      self._next_cycle.append(dpid)
+      data = self._packets[dpid]
+      if data:
+        core.openflow.sendToDPID(dpid, data)
 
   def create_packet_out (self, dpid, port_num, port_addr):
     """
@@ -169,17 +247,39 @@ class LLDPSender (object):
     po.data = eth.pack()
     return po.pack()
 
+  def create_batch_packet_out (self, dpid, ports):
+    """
+    Create an ofp_packet_out sending a discovery packet out several ports
+
+    ports is a list of (port_num, port_addr), and each port_addr must be
+    unique on the switch.
+    """
+    eth = self._create_discovery_packet(dpid, None, ports[0][1], self._ttl)
+    po = of.ofp_packet_out()
+    for port_num, port_addr in ports:
+      po.actions.append(of.ofp_action_dl_addr.set_src(port_addr))
+      po.actions.append(of.ofp_action_output(port=port_num))
+    po.data = eth.pack()
+    return po.pack()
+
   @staticmethod
   def _create_discovery_packet (dpid, port_num, port_addr, ttl):
     """
     Build discovery packet
+
+    If port_num is None, the port is identified by the Ethernet source.
     """
 
     chassis_id = pkt.chassis_id(subtype=pkt.chassis_id.SUB_LOCAL)
-    chassis_id.id = bytes('dpid:' + hex(long(dpid))[2:-1])
+    # Always 16 digits, so that Discovery can find things at fixed offsets
+    chassis_id.id = bytes('dpid:%016x' % (dpid,))
     # Maybe this should be a MAC.  But a MAC of what?  Local port, maybe?
 
-    port_id = pkt.port_id(subtype=pkt.port_id.SUB_PORT, id=str(port_num))
+    if port_num is None:
+      port_id = pkt.port_id(subtype=pkt.port_id.SUB_LOCAL,
+                            id=LLDPSender.PORT_ID_BY_SOURCE)
+    else:
+      port_id = pkt.port_id(subtype=pkt.port_id.SUB_PORT, id=str(port_num))
 
     ttl = pkt.ttl(ttl = ttl)
 
@@ -264,14 +364,21 @@ class Discovery (EventMixin):
   Link = Link
 
   def __init__ (self, install_flow = True, explicit_drop = True,
-                link_timeout = None, eat_early_packets = False):
+                link_timeout = None, eat_early_packets = False,
+                batch = True):
     self._eat_early_packets = eat_early_packets
     self._explicit_drop = explicit_drop
     self._install_flow = install_flow
     if link_timeout: self._link_timeout = link_timeout
 
     self.adjacency = {} # From Link to time.time() stamp
-    self._sender = LLDPSender(self.send_cycle_time)
+    self._sender = LLDPSender(self.send_cycle_time, batch = batch)
+
+    # Heap of (deadline, link), with at most one entry for each link in
+    # adjacency.  The deadline may be earlier than the link really expires
+    # (if it's been seen since), in which case it's pushed back on.
+    self._expiry_heap = []
+    self._expiry_links = set() # Links in _expiry_heap
 
     # Listen with a high priority (mostly so we get PacketIns early)
     core.listen_to_dependencies(self,
@@ -321,8 +428,20 @@ class Discovery (EventMixin):
     """
     now = time.time()
 
-    expired = [link for link,timestamp in self.adjacency.iteritems()
-               if timestamp + self._link_timeout < now]
+    expired = []
+    heap = self._expiry_heap
+    while heap and heap[0][0] < now:
+      _,link = heapq.heappop(heap)
+      timestamp = self.adjacency.get(link)
+      if timestamp is None:
+        # Already deleted
+        self._expiry_links.discard(link)
+      elif timestamp + self._link_timeout < now:
+        self._expiry_links.discard(link)
+        expired.append(link)
+      else:
+        heapq.heappush(heap, (timestamp + self._link_timeout, link))
+
     if expired:
       for link in expired:
         log.info('link timeout: %s', link)
@@ -334,16 +453,18 @@ class Discovery (EventMixin):
     Receive and process LLDP packets
     """
 
-    packet = event.parsed
-
-    if (packet.effective_ethertype != pkt.ethernet.LLDP_TYPE
-        or packet.dst != pkt.ETHERNET.NDP_MULTICAST):
-      if not self._eat_early_packets: return
-      if not event.connection.connect_time: return
-      enable_time = time.time() - self.send_cycle_time - 1
-      if event.connection.connect_time > enable_time:
-        return EventHalt
-      return
+    data = event.data
+    if data[12:14] != _lldp_type_raw or data[:6] != _ndp_multicast_raw:
+      # Not an untagged LLDP packet, but may still be a tagged one
+      packet = event.parsed
+      if (packet.effective_ethertype != pkt.ethernet.LLDP_TYPE
+          or packet.dst != pkt.ETHERNET.NDP_MULTICAST):
+        if not self._eat_early_packets: return
+        if not event.connection.connect_time: return
+        enable_time = time.time() - self.send_cycle_time - 1
+        if event.connection.connect_time > enable_time:
+          return EventHalt
+        return
 
     if self._explicit_drop:
       if event.ofp.buffer_id is not None:
@@ -353,22 +474,93 @@ class Discovery (EventMixin):
         msg.in_port = event.port
         event.connection.send(msg)
 
+    origin = self._parse_own_lldp(data)
+    if origin is None:
+      origin = self._parse_lldp(event.parsed)
+      if origin is None:
+        return EventHalt
+    originatorDPID, originatorPort = origin
+
+    if originatorDPID not in core.openflow.connections:
+      log.info('Received LLDP packet from unknown switch')
+      return EventHalt
+
+    if originatorPort is None:
+      log.warning("Thought we found a DPID, but port number didn't " +
+                  "make sense")
+      return EventHalt
+
+    if (event.dpid, event.port) == (originatorDPID, originatorPort):
+      log.warning("Port received its own LLDP packet; ignoring")
+      return EventHalt
+
+    link = Discovery.Link(originatorDPID, originatorPort, event.dpid,
+                          event.port)
+    self._link_seen(link, event)
+
+    return EventHalt # Probably nobody else needs this event
+
+  def _link_seen (self, link, event = None):
+    now = time.time()
+    if link not in self.adjacency:
+      self.adjacency[link] = now
+      if link not in self._expiry_links:
+        self._expiry_links.add(link)
+        heapq.heappush(self._expiry_heap, (now + self._link_timeout, link))
+      log.info('link detected: %s', link)
+      self.raiseEventNoErrors(LinkEvent, True, link, event)
+    else:
+      # Just update timestamp
+      self.adjacency[link] = now
+
+  def _parse_own_lldp (self, data):
+    """
+    Gets (dpid, port) from an LLDP packet in the format LLDPSender sends
+
+    This just looks at fixed offsets in the raw packet.  Returns None if
+    it's some other kind of LLDP packet.  The port may be None if the
+    packet came from a port we don't know about.
+    """
+    if data[14:22] != _chassis_id_prefix or len(data) < 41: return None
+    try:
+      dpid = int(data[22:38], 16)
+    except ValueError:
+      return None
+    port_tlv = _tlv_header.unpack_from(data, 38)[0]
+    end = 40 + (port_tlv & 0x1ff)
+    if port_tlv >> 9 != pkt.lldp.PORT_ID_TLV or end > len(data): return None
+    subtype = ord(data[40])
+    port_id = data[41:end]
+    if subtype == pkt.port_id.SUB_PORT and port_id.isdigit():
+      return dpid, int(port_id)
+    if (subtype == pkt.port_id.SUB_LOCAL
+        and port_id == LLDPSender.PORT_ID_BY_SOURCE):
+      return dpid, self._sender.port_for_addr(dpid, data[6:12])
+    return None
+
+  def _parse_lldp (self, packet):
+    """
+    Gets (dpid, port) from a parsed LLDP packet of any sort
+
+    Returns None (after logging why) if that isn't possible.  The port may
+    be None if it doesn't make sense.
+    """
     lldph = packet.find(pkt.lldp)
     if lldph is None or not lldph.parsed:
       log.error("LLDP packet could not be parsed")
-      return EventHalt
+      return None
     if len(lldph.tlvs) < 3:
       log.error("LLDP packet without required three TLVs")
-      return EventHalt
+      return None
     if lldph.tlvs[0].tlv_type != pkt.lldp.CHASSIS_ID_TLV:
       log.error("LLDP packet TLV 1 not CHASSIS_ID")
-      return EventHalt
+      return None
     if lldph.tlvs[1].tlv_type != pkt.lldp.PORT_ID_TLV:
       log.error("LLDP packet TLV 2 not PORT_ID")
-      return EventHalt
+      return None
     if lldph.tlvs[2].tlv_type != pkt.lldp.TTL_TLV:
       log.error("LLDP packet TLV 3 not TTL")
-      return EventHalt
+      return None
 
     def lookInSysDesc ():
       r = None
@@ -414,16 +606,12 @@ class Discovery (EventMixin):
 
     if originatorDPID == None:
       log.warning("Couldn't find a DPID in the LLDP packet")
-      return EventHalt
-
-    if originatorDPID not in core.openflow.connections:
-      log.info('Received LLDP packet from unknown switch')
-      return EventHalt
+      return None
 
     # Get port number from port TLV
     if lldph.tlvs[1].subtype != pkt.port_id.SUB_PORT:
       log.warning("Thought we found a DPID, but packet didn't have a port")
-      return EventHalt
+      return None
     originatorPort = None
     if lldph.tlvs[1].id.isdigit():
       # We expect it to be a decimal value
@@ -434,27 +622,8 @@ class Discovery (EventMixin):
         originatorPort  =  struct.unpack("!H", lldph.tlvs[1].id)[0]
       except:
         pass
-    if originatorPort is None:
-      log.warning("Thought we found a DPID, but port number didn't " +
-                  "make sense")
-      return EventHalt
 
-    if (event.dpid, event.port) == (originatorDPID, originatorPort):
-      log.warning("Port received its own LLDP packet; ignoring")
-      return EventHalt
-
-    link = Discovery.Link(originatorDPID, originatorPort, event.dpid,
-                          event.port)
-
-    if link not in self.adjacency:
-      self.adjacency[link] = time.time()
-      log.info('link detected: %s', link)
-      self.raiseEventNoErrors(LinkEvent, True, link, event)
-    else:
-      # Just update timestamp
-      self.adjacency[link] = time.time()
-
-    return EventHalt # Probably nobody else needs this event
+    return originatorDPID, originatorPort
 
   def _delete_links (self, links):
     for link in links:
@@ -475,12 +644,13 @@ class Discovery (EventMixin):
 
 
 def launch (no_flow = False, explicit_drop = True, link_timeout = None,
-            eat_early_packets = False):
+            eat_early_packets = False, batch = True):
   explicit_drop = str_to_bool(explicit_drop)
+  batch = str_to_bool(batch)
   eat_early_packets = str_to_bool(eat_early_packets)
   install_flow = not str_to_bool(no_flow)
   if link_timeout: link_timeout = int(link_timeout)
 
   core.registerNew(Discovery, explicit_drop=explicit_drop,
                    install_flow=install_flow, link_timeout=link_timeout,
-                   eat_early_packets=eat_early_packets)
+                   eat_early_packets=eat_early_packets, batch=batch)
@@ -21,6 +21,7 @@ from pox.lib.revent import *
 
 import time
 import math
+import heapq
 
 # FlowTable Entries:
 #   match - ofp_match (13-tuple)
@@ -125,6 +126,22 @@ class TableEntry (object):
         return True
     return False
 
+  @property
+  def expiry_deadline (self):
+    """
+    The time after which this entry may have expired (or None if never)
+
+    Touching the entry can push the deadline further out, so an entry isn't
+    necessarily expired once the deadline has passed.
+    """
+    deadline = None
+    if self.idle_timeout > 0:
+      deadline = self.last_touched + self.idle_timeout
+    if self.hard_timeout > 0:
+      hard = self.created + self.hard_timeout
+      if deadline is None or hard < deadline: deadline = hard
+    return deadline
+
   def is_expired (self, now=None):
     """
     Tests whether this flow entry is expired due to its idle or hard timeout
@@ -192,12 +209,72 @@ class FlowTableModification (Event):
     self.reason = reason
 
 
+# Match fields (other than nw_src/nw_dst) which make up index keys
+_index_fields = ('in_port', 'dl_src', 'dl_dst', 'dl_vlan', 'dl_vlan_pcp',
+                 'dl_type', 'nw_tos', 'nw_proto', 'tp_src', 'tp_dst')
+
+def _ip_to_int (ip):
+  if ip is None: return None
+  return IPAddr(ip).toUnsigned()
+
+def _prefix_mask (bits):
+  return ~((1 << (32-bits))-1) & 0xffFFffFF
+
+
+class _MaskBucket (object):
+  """
+  All table entries which share a wildcard pattern
+
+  Entries are hashed on the values of the fields they don't wildcard, so
+  finding the entries of this pattern which match a packet is a single
+  dict lookup.  Each key maps to a list of entries, best first.
+  """
+  def __init__ (self, fields, nw_src_bits, nw_dst_bits):
+    self.fields = fields
+    self.nw_src_bits = nw_src_bits
+    self.nw_dst_bits = nw_dst_bits
+    self.nw_src_mask = _prefix_mask(nw_src_bits) if nw_src_bits else 0
+    self.nw_dst_mask = _prefix_mask(nw_dst_bits) if nw_dst_bits else 0
+    self.entries = {} # key -> [TableEntry]
+    self.count = 0
+    self.max_order = None # Order of the best entry in this bucket
+
+    # Heap of (-priority, -seq, TableEntry), so the best entry is on top.
+    # Removed entries are left in until they come up (or the heap gets
+    # compacted).
+    self.heap = []
+    self.stale = 0
+
+  def project (self, values, nw_src, nw_dst):
+    """
+    Returns the key a packet would have in this bucket
+
+    values is a dict of match field values.  nw_src and nw_dst are the
+    packet's addresses as integers (or None).  Returns None if the packet
+    can't match anything in this bucket.
+    """
+    key = tuple(values[f] for f in self.fields)
+    if self.nw_src_bits:
+      if nw_src is None: return None
+      key += (nw_src & self.nw_src_mask,)
+    if self.nw_dst_bits:
+      if nw_dst is None: return None
+      key += (nw_dst & self.nw_dst_mask,)
+    return key
+
+
 class FlowTable (EventMixin):
   """
   General model of a flow table.
 
   Maintains an ordered list of flow entries, and finds matching entries for
   packets and other entries. Supports expiration of flows.
+
+  Besides the ordered list, entries are indexed by wildcard pattern (tuple
+  space search).  Finding the entry for a packet costs one hash lookup per
+  distinct pattern rather than a scan of the whole table.  Exact-match
+  entries all share a single pattern which, due to their effective
+  priority, is always searched first.
   """
   _eventMixin_events = set([FlowTableModification])
 
@@ -207,6 +284,29 @@ class FlowTable (EventMixin):
     # Table is a list of TableEntry sorted by descending effective_priority.
     self._table = []
 
+    # Index state.  The order of an entry is (effective_priority, seq); the
+    # table is sorted by descending order (newer entries go before older
+    # ones with the same priority).
+    self._seq = 0
+    self._order = {}        # TableEntry -> order
+    self._entry_index = {}  # TableEntry -> (bucket, key)
+    self._buckets = {}      # (fields, nw_src_bits, nw_dst_bits) -> bucket
+    self._bucket_list = []  # Buckets by descending max_order
+    self._buckets_dirty = False
+    self._by_priority = {}  # effective_priority -> set(TableEntry)
+
+    # Heap of (expiry_deadline, seq, TableEntry).  Entries are only re-armed
+    # when their deadline comes up, and removed entries are left in until
+    # they're popped (or the heap gets compacted).
+    self._expiry_heap = []
+    self._expiry_stale = 0
+
+    # Expiry statistics
+    self.expiry_ticks = 0
+    self.expired_total = 0
+    self.last_expired_count = 0 # Entries expired on last tick
+    self.last_expiry_time = 0.0 # Seconds spent on last tick
+
   def _dirty (self):
     """
     Call when table changes
@@ -240,6 +340,7 @@ class FlowTable (EventMixin):
           continue
         low = middle + 1
     table.insert(low, entry)
+    self._index_entry(entry)
 
     self._dirty()
 
@@ -248,12 +349,125 @@ class FlowTable (EventMixin):
   def remove_entry (self, entry, reason=None):
     assert isinstance(entry, TableEntry)
     self._table.remove(entry)
+    self._unindex_entry(entry)
     self._dirty()
     self.raiseEvent(FlowTableModification(removed=[entry], reason=reason))
 
+  @staticmethod
+  def _match_pattern (match):
+    """
+    Returns (pattern, key) for the index
+    """
+    fields = tuple(f for f in _index_fields if getattr(match, f) is not None)
+    key = tuple(getattr(match, f) for f in fields)
+    nw_src,nw_src_bits = match.get_nw_src()
+    nw_dst,nw_dst_bits = match.get_nw_dst()
+    if nw_src is None:
+      nw_src_bits = 0
+    else:
+      key += (_ip_to_int(nw_src),)
+    if nw_dst is None:
+      nw_dst_bits = 0
+    else:
+      key += (_ip_to_int(nw_dst),)
+    return (fields, nw_src_bits, nw_dst_bits), key
+
+  def _index_entry (self, entry):
+    self._seq += 1
+    priority = entry.effective_priority
+    order = (priority, self._seq)
+    self._order[entry] = order
+    self._by_priority.setdefault(priority, set()).add(entry)
+
+    deadline = entry.expiry_deadline
+    if deadline is not None:
+      heapq.heappush(self._expiry_heap, (deadline, self._seq, entry))
+
+    pattern,key = self._match_pattern(entry.match)
+    bucket = self._buckets.get(pattern)
+    if bucket is None:
+      bucket = _MaskBucket(*pattern)
+      self._buckets[pattern] = bucket
+      self._bucket_list.append(bucket)
+      self._buckets_dirty = True
+    self._entry_index[entry] = (bucket, key)
+
+    # The new entry is the newest, so it goes first among equal priorities
+    l = bucket.entries.setdefault(key, [])
+    i = 0
+    while i < len(l) and self._order[l[i]][0] > priority:
+      i += 1
+    l.insert(i, entry)
+    bucket.count += 1
+    heapq.heappush(bucket.heap, (-priority, -self._seq, entry))
+    if bucket.max_order is None or order > bucket.max_order:
+      bucket.max_order = order
+      self._buckets_dirty = True
+
+  def _unindex_entry (self, entry):
+    order = self._order.pop(entry)
+    if entry.expiry_deadline is not None:
+      self._expiry_stale += 1
+    same = self._by_priority[order[0]]
+    same.discard(entry)
+    if not same: del self._by_priority[order[0]]
+
+    bucket,key = self._entry_index.pop(entry)
+    l = bucket.entries[key]
+    l.remove(entry)
+    if not l: del bucket.entries[key]
+    bucket.count -= 1
+    if bucket.count == 0:
+      del self._buckets[(bucket.fields, bucket.nw_src_bits,
+                         bucket.nw_dst_bits)]
+      self._bucket_list.remove(bucket)
+    else:
+      bucket.stale += 1
+      if bucket.stale > len(bucket.heap) // 2:
+        self._compact_bucket_heap(bucket)
+      if order == bucket.max_order:
+        # Drop removed entries from the top to find the new best
+        heap = bucket.heap
+        while self._order.get(heap[0][2]) != (-heap[0][0], -heap[0][1]):
+          heapq.heappop(heap)
+          bucket.stale -= 1
+        bucket.max_order = (-heap[0][0], -heap[0][1])
+        self._buckets_dirty = True
+
+  def _compact_bucket_heap (self, bucket):
+    order = self._order
+    bucket.heap = [(-order[e][0], -order[e][1], e)
+                   for es in bucket.entries.itervalues() for e in es]
+    heapq.heapify(bucket.heap)
+    bucket.stale = 0
+
+  def _sorted_buckets (self):
+    if self._buckets_dirty:
+      self._bucket_list.sort(key=lambda b: b.max_order, reverse=True)
+      self._buckets_dirty = False
+    return self._bucket_list
+
   def matching_entries (self, match, priority=0, strict=False, out_port=None):
     entry_match = lambda e: e.is_matched_by(match, priority, strict, out_port)
-    return [ entry for entry in self._table if entry_match(entry) ]
+
+    pattern,key = self._match_pattern(match)
+    if strict:
+      # Strict matches have to be equal, so they're in the same bucket
+      bucket = self._buckets.get(pattern)
+      if bucket is None: return []
+      return [ entry for entry in bucket.entries.get(key, ())
+               if entry_match(entry) ]
+
+    # Non-strict matches can only be found in buckets which specify at least
+    # the fields that match does
+    fields = set(pattern[0])
+    r = []
+    for bucket in self._buckets.itervalues():
+      if not fields.issubset(bucket.fields): continue
+      for es in bucket.entries.itervalues():
+        r.extend(entry for entry in es if entry_match(entry))
+    r.sort(key=self._order.__getitem__, reverse=True)
+    return r
 
   def flow_stats (self, match, out_port=None, now=None):
     mc_es = self.matching_entries(match=match, strict=False, out_port=out_port)
@@ -279,30 +493,74 @@ class FlowTable (EventMixin):
     if not flows: return
     self._dirty()
     remove_flows = set(flows)
-    i = 0
-    while i < len(self._table):
-      entry = self._table[i]
-      if entry in remove_flows:
-        del self._table[i]
-        remove_flows.remove(entry)
-        if not remove_flows: break
-      else:
-        i += 1
-    assert len(remove_flows) == 0
+    assert remove_flows.issubset(self._order)
+    self._table[:] = [e for e in self._table if e not in remove_flows]
+    for entry in remove_flows:
+      self._unindex_entry(entry)
     self.raiseEvent(FlowTableModification(removed=flows, reason=reason))
 
   def remove_expired_entries (self, now=None):
+    """
+    Removes entries which have timed out
+
+    Only entries whose deadline has passed are looked at, so the work done
+    is proportional to the number of entries expiring (or which have been
+    touched since they were last looked at) rather than to the table size.
+    """
+    start = time.time()
     idle = []
     hard = []
-    if now is None: now = time.time()
-    for entry in self._table:
+    if now is None: now = start
+    heap = self._expiry_heap
+    rearm = []
+    while heap and heap[0][0] < now:
+      deadline,seq,entry = heapq.heappop(heap)
+      order = self._order.get(entry)
+      if order is None or order[1] != seq:
+        # No longer in the table
+        self._expiry_stale -= 1
+        continue
       if entry.is_idle_timed_out(now):
         idle.append(entry)
       elif entry.is_hard_timed_out(now):
         hard.append(entry)
+      else:
+        # Touched since it was armed
+        rearm.append((entry.expiry_deadline, seq, entry))
+    for item in rearm:
+      heapq.heappush(heap, item)
+
+    # Remove in table order like a scan of the table would
+    idle.sort(key=self._order.__getitem__, reverse=True)
+    hard.sort(key=self._order.__getitem__, reverse=True)
     self._remove_specific_entries(idle, OFPRR_IDLE_TIMEOUT)
     self._remove_specific_entries(hard, OFPRR_HARD_TIMEOUT)
 
+    # The entries just removed are no longer in the heap
+    self._expiry_stale -= len(idle) + len(hard)
+    if self._expiry_stale > len(heap) // 2:
+      self._compact_expiry_heap()
+
+    expired = len(idle) + len(hard)
+    self.expiry_ticks += 1
+    self.expired_total += expired
+    self.last_expired_count = expired
+    self.last_expiry_time = time.time() - start
+
+  def _compact_expiry_heap (self):
+    order = self._order
+    self._expiry_heap = [item for item in self._expiry_heap
+                         if order.get(item[2], (0,None))[1] == item[1]]
+    heapq.heapify(self._expiry_heap)
+    self._expiry_stale = 0
+
+  @property
+  def expiry_stats (self):
+    return dict(ticks = self.expiry_ticks,
+                expired_total = self.expired_total,
+                last_expired = self.last_expired_count,
+                last_time = self.last_expiry_time)
+
   def remove_matching_entries (self, match, priority=0, strict=False,
                                out_port=None, reason=None):
     remove_flows = self.matching_entries(match, priority, strict, out_port)
@@ -314,16 +572,44 @@ class FlowTable (EventMixin):
     Finds the flow table entry that matches the given packet.
 
     Returns the highest priority flow table entry that matches the given packet
-    on the given in_port, or None if no matching entry is found.
+    on the given in_port, or None if no matching entry is found.  The packet
+    may also be given as the raw frame, which is quicker to match.
+    """
+    if isinstance(packet, bytes):
+      packet_match = ofp_match.from_raw(packet, in_port, spec_frags = True)
+    else:
+      packet_match = ofp_match.from_packet(packet, in_port, spec_frags = True)
+    return self.entry_for_match(packet_match)
+
+  def entry_for_match (self, packet_match):
+    """
+    Finds the highest priority entry matching an exact packet match
+
+    This is equivalent to returning the first entry in the table whose
+    match.matches_with_wildcards(packet_match, False) is True.
     """
-    packet_match = ofp_match.from_packet(packet, in_port, spec_frags = True)
+    if not self._order: return None
+
+    values = dict((f, getattr(packet_match, f)) for f in _index_fields)
+    nw_src = _ip_to_int(packet_match.get_nw_src()[0])
+    nw_dst = _ip_to_int(packet_match.get_nw_dst()[0])
 
-    for entry in self._table:
-      if entry.match.matches_with_wildcards(packet_match,
-                                            consider_other_wildcards=False):
-        return entry
+    best = None
+    best_order = None
+    for bucket in self._sorted_buckets():
+      if best_order is not None and bucket.max_order < best_order:
+        # Nothing further down can beat what we have
+        break
+      key = bucket.project(values, nw_src, nw_dst)
+      if key is None: continue
+      es = bucket.entries.get(key)
+      if not es: continue
+      order = self._order[es[0]]
+      if best_order is None or order > best_order:
+        best = es[0]
+        best_order = order
 
-    return None
+    return best
 
   def check_for_overlapping_entry (self, in_entry):
     """
@@ -336,18 +622,11 @@ class FlowTable (EventMixin):
     #NOTE: Ambiguous whether matching should be based on effective_priority
     #      or the regular priority.  Doing it based on effective_priority
     #      since that's what actually affects packet matching.
-    #NOTE: We could improve performance by doing a binary search to find the
-    #      right priority entries.
 
     priority = in_entry.effective_priority
 
-    for e in self._table:
-      if e.effective_priority < priority:
-        break
-      elif e.effective_priority > priority:
-        continue
-      else:
-        if e.is_matched_by(in_entry.match) or in_entry.is_matched_by(e.match):
-          return True
+    for e in self._by_priority.get(priority, ()):
+      if e.is_matched_by(in_entry.match) or in_entry.is_matched_by(e.match):
+        return True
 
     return False
@@ -917,6 +917,16 @@ class ofp_queue_prop_min_rate (ofp_base):
 
 
 ##2.3 Flow Match Structures
+
+# Header layouts used by ofp_match.from_raw()
+_raw_ethertype = struct.Struct("!H")
+_raw_vlan = struct.Struct("!HH")                # TCI, inner type
+_raw_ipv4 = struct.Struct("!BBHxxHxBxxII")      # Up to the addresses
+_raw_ports = struct.Struct("!HH")               # TCP and UDP
+_raw_tcp = struct.Struct("!HHxxxxxxxxB")        # Ports and data offset
+_raw_icmp = struct.Struct("!BB")
+_raw_arp = struct.Struct("!HHBBHxxxxxxIxxxxxxI")
+
 class ofp_match (ofp_base):
   adjust_wildcards = True # Set to true to "fix" outgoing wildcards
 
@@ -932,8 +942,7 @@ class ofp_match (ofp_base):
     @param spec_frags Handle IP fragments as specified in the spec.
     """
     if isinstance(packet, ofp_packet_in):
-      in_port = packet.in_port
-      packet = ethernet(packet.data)
+      return cls.from_raw(packet.data, packet.in_port, spec_frags)
     assert assert_type("packet", packet, ethernet, none_ok=False)
 
     match = cls()
@@ -989,6 +998,122 @@ class ofp_match (ofp_base):
 
     return match
 
+  @classmethod
+  def from_raw (cls, raw, in_port = None, spec_frags = False):
+    """
+    Constructs an exact match for the given raw Ethernet frame
+
+    The result is the same as from_packet(ethernet(raw)), but the fields
+    are read straight out of the frame without building packet objects.
+    Frames that from_packet() treats specially (LLC, truncated or bogus
+    headers, TCP options) are passed on to it.
+
+    @param in_port The switch port the packet arrived on if you want
+                   the resulting match to have its in_port set.
+                   If "raw" is a packet_in, this is ignored.
+    @param raw     The frame as bytes or a packet_in
+    @param spec_frags Handle IP fragments as specified in the spec.
+    """
+    if isinstance(raw, ofp_packet_in):
+      in_port = raw.in_port
+      raw = raw.data
+
+    slow = lambda: cls.from_packet(ethernet(raw), in_port, spec_frags)
+
+    dlen = len(raw)
+    if dlen < ethernet.MIN_LEN: return slow()
+    dl_type = _raw_ethertype.unpack_from(raw, 12)[0]
+    if dl_type < 1536: return slow()
+
+    if cls is ofp_match:
+      # Skip __init__(), which goes through __setattr__() for every field
+      match = cls.__new__(cls)
+      match.__dict__.update(_empty_match_fields)
+    else:
+      match = cls()
+    d = match.__dict__
+    w = match.wildcards & ~(OFPFW_DL_SRC | OFPFW_DL_DST | OFPFW_DL_TYPE
+                            | OFPFW_DL_VLAN | OFPFW_DL_VLAN_PCP)
+
+    if in_port is not None:
+      d['_in_port'] = in_port
+      w &= ~OFPFW_IN_PORT
+
+    d['_dl_dst'] = EthAddr(raw[:6])
+    d['_dl_src'] = EthAddr(raw[6:12])
+    offset = ethernet.MIN_LEN
+
+    if dl_type == ethernet.VLAN_TYPE:
+      if dlen < offset + vlan.MIN_LEN: return slow()
+      tci,dl_type = _raw_vlan.unpack_from(raw, offset)
+      d['_dl_vlan'] = tci & 0x0fff
+      d['_dl_vlan_pcp'] = tci >> 13
+      offset += vlan.MIN_LEN
+    else:
+      d['_dl_vlan'] = OFP_VLAN_NONE
+      d['_dl_vlan_pcp'] = 0
+    d['_dl_type'] = dl_type
+
+    if dl_type == ethernet.IP_TYPE:
+      iplen = dlen - offset
+      if iplen < ipv4.MIN_LEN: return slow()
+      (vhl, tos, length, frag, proto,
+       srcip, dstip) = _raw_ipv4.unpack_from(raw, offset)
+      hl = (vhl & 0x0f) * 4
+      if (vhl >> 4 != ipv4.IPv4 or hl < ipv4.MIN_LEN or length <= hl
+          or hl > iplen):
+        return slow()
+      d['_nw_src'] = IPAddr(srcip)
+      d['_nw_dst'] = IPAddr(dstip)
+      d['_nw_proto'] = proto
+      d['_nw_tos'] = tos
+      w &= ~(OFPFW_NW_SRC_MASK | OFPFW_NW_DST_MASK | OFPFW_NW_PROTO
+             | OFPFW_NW_TOS)
+
+      if spec_frags and ((frag >> 13) & ipv4.MF_FLAG or frag & 0x1fff):
+        # This seems a bit strange, but see page 9 of the spec.
+        d['_tp_src'] = 0
+        d['_tp_dst'] = 0
+        w &= ~(OFPFW_TP_SRC | OFPFW_TP_DST)
+      else:
+        # Like ipv4.parse(), only look at what's within the IP length
+        l4len = min(length, iplen) - hl
+        offset += hl
+        if proto == ipv4.UDP_PROTOCOL:
+          if l4len >= udp.MIN_LEN:
+            d['_tp_src'],d['_tp_dst'] = _raw_ports.unpack_from(raw, offset)
+            w &= ~(OFPFW_TP_SRC | OFPFW_TP_DST)
+        elif proto == ipv4.TCP_PROTOCOL:
+          if l4len >= tcp.MIN_LEN:
+            tp_src,tp_dst,off = _raw_tcp.unpack_from(raw, offset)
+            off >>= 4
+            if off > 5:
+              # Options; from_packet() depends on whether they parse
+              return slow()
+            if off == 5:
+              d['_tp_src'] = tp_src
+              d['_tp_dst'] = tp_dst
+              w &= ~(OFPFW_TP_SRC | OFPFW_TP_DST)
+        elif proto == ipv4.ICMP_PROTOCOL:
+          if l4len >= icmp.MIN_LEN:
+            d['_tp_src'],d['_tp_dst'] = _raw_icmp.unpack_from(raw, offset)
+            w &= ~(OFPFW_TP_SRC | OFPFW_TP_DST)
+    elif dl_type == ethernet.ARP_TYPE or dl_type == ethernet.RARP_TYPE:
+      if dlen - offset < arp.MIN_LEN: return slow()
+      (hwtype, prototype, hwlen, protolen, opcode,
+       protosrc, protodst) = _raw_arp.unpack_from(raw, offset)
+      if (hwtype != arp.HW_TYPE_ETHERNET or hwlen != 6
+          or prototype != arp.PROTO_TYPE_IP or protolen != 4):
+        return slow()
+      if opcode <= 255:
+        d['_nw_proto'] = opcode
+        d['_nw_src'] = IPAddr(protosrc)
+        d['_nw_dst'] = IPAddr(protodst)
+        w &= ~(OFPFW_NW_SRC_MASK | OFPFW_NW_DST_MASK | OFPFW_NW_PROTO)
+
+    match.wildcards = w
+    return match
+
   def clone (self):
     n = ofp_match()
     for k,v in ofp_match_data.iteritems():
@@ -4451,3 +4576,6 @@ ofp_match_data = {
   'tp_src' : (0, OFPFW_TP_SRC),
   'tp_dst' : (0, OFPFW_TP_DST),
 }
+
+# The attributes of a new ofp_match, for from_raw()
+_empty_match_fields = ofp_match().__dict__.copy()
@@ -34,12 +34,16 @@ log = core.getLogger()
 
 import socket
 import select
+import struct
 
 # List where the index is an OpenFlow message type (OFPT_xxx), and
 # the values are unpack functions that unpack the wire format of that
 # type into a message object.
 unpackers = make_type_to_unpacker_table()
 
+# The version, type and length fields of the OpenFlow header
+_ofp_header_struct = struct.Struct("!BBH")
+
 try:
   PIPE_BUF = select.PIPE_BUF
 except:
@@ -696,6 +700,14 @@ class Connection (EventMixin):
   # Globally unique identifier for the Connection instance
   ID = 0
 
+  # Maximum number of bytes to read from the socket at once
+  read_size = 64 * 1024
+
+  # Bytes read at once from a new connection.  This doubles (up to
+  # read_size) whenever a read fills the buffer, so only busy connections
+  # end up with big receive buffers.
+  initial_read_size = 4 * 1024
+
   _aborted_connections = 0
 
   def msg (self, m):
@@ -714,7 +726,12 @@ class Connection (EventMixin):
 
     self.ofnexus = _dummyOFNexus
     self.sock = sock
-    self.buf = b''
+    # Receive buffer.  Received data is between _rstart and _rend.
+    self._read_size = min(self.initial_read_size, self.read_size)
+    self._rbuf = bytearray(self._read_size)
+    self._rview = memoryview(self._rbuf)
+    self._rstart = 0
+    self._rend = 0
     Connection.ID += 1
     self.ID = Connection.ID
 
@@ -846,45 +863,80 @@ class Connection (EventMixin):
         self.msg("Socket error: " + strerror)
         self.disconnect(defer_event=True)
 
+  @property
+  def buf (self):
+    """
+    Received data which has not been handled yet
+    """
+    return self._rview[self._rstart:self._rend].tobytes()
+
+  def _make_room (self):
+    """
+    Makes sure there's room for _read_size bytes after the received data
+
+    The pending (partial message) data is moved to the start of the
+    buffer, and the buffer is replaced with a larger one if needed.
+    """
+    pending = self._rend - self._rstart
+    if len(self._rbuf) < pending + self._read_size:
+      rbuf = bytearray(pending + self._read_size)
+      rbuf[:pending] = self._rview[self._rstart:self._rend]
+      self._rbuf = rbuf
+      self._rview = memoryview(rbuf)
+    elif pending:
+      self._rbuf[:pending] = self._rview[self._rstart:self._rend].tobytes()
+    self._rstart = 0
+    self._rend = pending
+
   def read (self):
     """
     Read data from this connection.  Generally this is just called by the
     main OpenFlow loop below.
 
+    Data is received into a reusable buffer, which starts small and grows
+    while reads fill it.  The received data is copied out of it once, and
+    the complete messages are unpacked at their offsets in that copy.
+
     Note: This function will block if data is not available.
     """
+    size = self._read_size
+    if len(self._rbuf) - self._rend < size:
+      self._make_room()
     try:
-      d = self.sock.recv(2048)
+      l = self.sock.recv_into(self._rview[self._rend:], size)
     except:
       return False
-    if len(d) == 0:
+    if l == 0:
       return False
-    self.buf += d
-    buf_len = len(self.buf)
-
+    self._rend += l
+    if l == size and size < self.read_size:
+      self._read_size = min(size * 2, self.read_size)
 
+    start = self._rstart
+    data = self._rview[start:self._rend].tobytes()
+    data_len = len(data)
     offset = 0
-    while buf_len - offset >= 8: # 8 bytes is minimum OF message size
-      # We pull the first four bytes of the OpenFlow header off by hand
-      # (using ord) to find the version/length/type so that we can
-      # correctly call libopenflow to unpack it.
-
-      ofp_type = ord(self.buf[offset+1])
-
-      if ord(self.buf[offset]) != of.OFP_VERSION:
+    good = True
+    while data_len - offset >= 8: # 8 bytes is minimum OF message size
+      ofp_version,ofp_type,msg_length = _ofp_header_struct.unpack_from(data,
+                                                                    offset)
+      if ofp_version != of.OFP_VERSION:
         if ofp_type == of.OFPT_HELLO:
           # We let this through and hope the other side switches down.
           pass
         else:
           log.warning("Bad OpenFlow version (0x%02x) on connection %s"
-                      % (ord(self.buf[offset]), self))
-          return False # Throw connection away
-
-      msg_length = ord(self.buf[offset+2]) << 8 | ord(self.buf[offset+3])
-
-      if buf_len - offset < msg_length: break
+                      % (ofp_version, self))
+          good = False # Throw connection away (after the good messages)
+          break
+      if msg_length < 8:
+        log.warning("Bad OpenFlow message length (%i) on connection %s"
+                    % (msg_length, self))
+        good = False
+        break
 
-      new_offset,msg = self.unpackers[ofp_type](self.buf, offset)
+      if data_len - offset < msg_length: break
+      new_offset,msg = self.unpackers[ofp_type](data, offset)
       assert new_offset - offset == msg_length
       offset = new_offset
 
@@ -897,10 +949,11 @@ class Connection (EventMixin):
                       ("\n" + str(self) + " ").join(str(msg).split('\n')))
         continue
 
-    if offset != 0:
-      self.buf = self.buf[offset:]
-
-    return True
+    if offset == data_len:
+      self._rstart = self._rend = 0
+    else:
+      self._rstart = start + offset
+    return good
 
   def _incoming_stats_reply (self, ofp):
     # This assumes that you don't receive multiple stats replies
@@ -967,6 +1020,8 @@ class OpenFlow_01_Task (Task):
   """
   The main recoco thread for listening to openflow messages
   """
+  task_class = TASK_IO
+
   def __init__ (self, port = 6633, address = '0.0.0.0',
                 ssl_key = None, ssl_cert = None, ssl_ca_cert = None):
     """
@@ -1002,10 +1057,10 @@ class OpenFlow_01_Task (Task):
     self.started = True
     return super(OpenFlow_01_Task,self).start()
 
-  def run (self):
-    # List of open sockets/connections to select on
-    sockets = []
-
+  def _bind_listener (self):
+    """
+    Returns a listening socket, or None if the address can't be bound
+    """
     listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
@@ -1020,14 +1075,95 @@ class OpenFlow_01_Task (Task):
         log.error(" You may have another controller running.")
         log.error(" Use openflow.of_01 --port=<port> to run POX on "
                   "another port.")
-      return
+      return None
 
     listener.listen(16)
     listener.setblocking(0)
-    sockets.append(listener)
 
     log.debug("Listening on %s:%s" %
               (self.address, self.port))
+    return listener
+
+  def _accept (self, listener):
+    """
+    Accepts a switch, and returns its new Connection (or None)
+    """
+    new_sock = listener.accept()[0]
+
+    if self.ssl_key or self.ssl_cert or self.ssl_ca_cert:
+      cert_reqs = ssl.CERT_REQUIRED
+      if self.ssl_ca_cert is None:
+        cert_reqs = ssl.CERT_NONE
+      new_sock = ssl.wrap_socket(new_sock, server_side=True,
+          keyfile = self.ssl_key, certfile = self.ssl_cert,
+          ca_certs = self.ssl_ca_cert, cert_reqs = cert_reqs,
+          do_handshake_on_connect = False,
+          suppress_ragged_eofs = True)
+      #FIXME: We currently do a blocking handshake so that SSL errors
+      #       can't occur out of the blue later.  This isn't a good
+      #       thing, but getting around it will take some effort.
+      try:
+        new_sock.setblocking(1)
+        new_sock.do_handshake()
+      except ssl.SSLError as exc:
+        if exc.errno == 8 and "EOF occurred" in exc.strerror:
+          # Annoying, but just ignore
+          pass
+        else:
+          #log.exception("SSL negotiation failed")
+          log.warn("SSL negotiation failed: " + str(exc))
+        return None
+
+    if pox.openflow.debug.pcap_traces:
+      new_sock = wrap_socket(new_sock)
+    new_sock.setblocking(0)
+    # Note that instantiating a Connection object fires a
+    # ConnectionUp event (after negotation has completed)
+    return Connection(new_sock)
+
+  def _handle_exception (self, con, listener):
+    """
+    Handles an exception raised while serving con (or the listener)
+
+    Returns (close con?, leave the OpenFlow loop?)
+    """
+    def log_tb ():
+      log.exception("Exception reading connection " + str(con))
+
+    do_break = False # Break OpenFlow loop?
+    do_close = True # Close this socket?
+
+    sock_error = None
+    if sys.exc_info()[0] is socket.error:
+      sock_error = sys.exc_info()[1][0]
+
+    if con is listener:
+      do_close = False
+      if sock_error == ECONNRESET:
+        con.info("Connection reset")
+      elif sock_error == EMFILE:
+        log.error("Couldn't accept connection: out of file descriptors.")
+      else:
+        do_close = True
+        log_tb()
+        log.error("Exception on OpenFlow listener.  Aborting.")
+        do_break = True
+    else:
+      # Normal socket
+      if sock_error == ECONNRESET:
+        con.info("Connection reset")
+      else:
+        log_tb()
+    return do_close, do_break
+
+  def run (self):
+    # List of open sockets/connections to select on
+    sockets = []
+
+    listener = self._bind_listener()
+    if listener is None:
+      return
+    sockets.append(listener)
 
     con = None
     while core.running:
@@ -1054,38 +1190,8 @@ class OpenFlow_01_Task (Task):
           timestamp = time.time()
           for con in rlist:
             if con is listener:
-              new_sock = listener.accept()[0]
-
-              if self.ssl_key or self.ssl_cert or self.ssl_ca_cert:
-                cert_reqs = ssl.CERT_REQUIRED
-                if self.ssl_ca_cert is None:
-                  cert_reqs = ssl.CERT_NONE
-                new_sock = ssl.wrap_socket(new_sock, server_side=True,
-                    keyfile = self.ssl_key, certfile = self.ssl_cert,
-                    ca_certs = self.ssl_ca_cert, cert_reqs = cert_reqs,
-                    do_handshake_on_connect = False,
-                    suppress_ragged_eofs = True)
-                #FIXME: We currently do a blocking handshake so that SSL errors
-                #       can't occur out of the blue later.  This isn't a good
-                #       thing, but getting around it will take some effort.
-                try:
-                  new_sock.setblocking(1)
-                  new_sock.do_handshake()
-                except ssl.SSLError as exc:
-                  if exc.errno == 8 and "EOF occurred" in exc.strerror:
-                    # Annoying, but just ignore
-                    pass
-                  else:
-                    #log.exception("SSL negotiation failed")
-                    log.warn("SSL negotiation failed: " + str(exc))
-                  continue
-
-              if pox.openflow.debug.pcap_traces:
-                new_sock = wrap_socket(new_sock)
-              new_sock.setblocking(0)
-              # Note that instantiating a Connection object fires a
-              # ConnectionUp event (after negotation has completed)
-              newcon = Connection(new_sock)
+              newcon = self._accept(listener)
+              if newcon is None: continue
               sockets.append( newcon )
               #print str(newcon) + " connected"
             else:
@@ -1096,33 +1202,7 @@ class OpenFlow_01_Task (Task):
       except KeyboardInterrupt:
         break
       except:
-        def log_tb ():
-          log.exception("Exception reading connection " + str(con))
-
-        do_break = False # Break OpenFlow loop?
-        do_close = True # Close this socket?
-
-        sock_error = None
-        if sys.exc_info()[0] is socket.error:
-          sock_error = sys.exc_info()[1][0]
-
-        if con is listener:
-          do_close = False
-          if sock_error == ECONNRESET:
-            con.info("Connection reset")
-          elif sock_error == EMFILE:
-            log.error("Couldn't accept connection: out of file descriptors.")
-          else:
-            do_close = True
-            log_tb()
-            log.error("Exception on OpenFlow listener.  Aborting.")
-            do_break = True
-        else:
-          # Normal socket
-          if sock_error == ECONNRESET:
-            con.info("Connection reset")
-          else:
-            log_tb()
+        do_close,do_break = self._handle_exception(con, listener)
 
         if do_close:
           try:
@@ -1143,13 +1223,82 @@ class OpenFlow_01_Task (Task):
     #pox.core.quit()
 
 
+class OpenFlow_01_EpollTask (OpenFlow_01_Task):
+  """
+  An OpenFlow listener which keeps its sockets in its own epoll object
+
+  The task only selects on the epoll object and then asks it for the ready
+  sockets.  Sockets are registered when they connect and unregistered when
+  they go away, so an iteration costs O(ready connections) instead of
+  O(connections).
+  """
+  def run (self):
+    listener = self._bind_listener()
+    if listener is None:
+      return
+
+    poller = select.epoll()
+    # fd -> listener or Connection
+    fds = {listener.fileno() : listener}
+    poller.register(listener.fileno(), select.EPOLLIN)
+
+    def drop (fd, con):
+      fds.pop(fd, None)
+      try:
+        poller.unregister(fd)
+      except Exception:
+        pass
+      try:
+        con.close()
+      except:
+        pass
+
+    do_break = False
+    while core.running and not do_break:
+      rlist, wlist, elist = yield Select([poller], [], [], 5)
+      if len(rlist) == 0:
+        continue
+
+      timestamp = time.time()
+      for fd, event in poller.poll(0):
+        con = fds.get(fd)
+        if con is None: continue
+        try:
+          if con is listener:
+            newcon = self._accept(listener)
+            if newcon is None: continue
+            fds[newcon.fileno()] = newcon
+            poller.register(newcon.fileno(), select.EPOLLIN|select.EPOLLPRI)
+          elif not event & (select.EPOLLIN|select.EPOLLPRI):
+            # Error or hangup
+            drop(fd, con)
+          else:
+            con.idle_time = timestamp
+            if con.read() is False:
+              drop(fd, con)
+        except KeyboardInterrupt:
+          do_break = True
+          break
+        except:
+          do_close,do_break = self._handle_exception(con, listener)
+          if do_close:
+            drop(fd, con)
+          if do_break:
+            break
+
+    for fd, con in fds.items():
+      drop(fd, con)
+    poller.close()
+    log.debug("No longer listening for connections")
+
+
 
 # Used by the Connection class
 deferredSender = None
 
 def launch (port=6633, address="0.0.0.0", name=None,
             private_key=None, certificate=None, ca_cert=None,
-            __INSTANCE__=None):
+            read_size=None, epoll=False, workers=0, __INSTANCE__=None):
   """
   Start a listener for OpenFlow connections
 
@@ -1157,7 +1306,16 @@ def launch (port=6633, address="0.0.0.0", name=None,
   combinations and pointing to reasonable key/cert files.  These have the same
   meanings as with Open vSwitch's old test controller, but they are more
   flexible (e.g., ca-cert can be skipped).
+
+  read_size sets the maximum number of bytes read from a switch at once.
+
+  With --epoll, connections are polled with epoll (instead of select()ing
+  on all of them).  With --workers=N, switch connections are served by N
+  worker processes (see of_01_workers).
   """
+  if read_size is not None:
+    Connection.read_size = int(read_size)
+
   if name is None:
     basename = "of_01"
     counter = 1
@@ -1177,8 +1335,20 @@ def launch (port=6633, address="0.0.0.0", name=None,
   if of._logger is None:
     of._logger = core.getLogger('libopenflow_01')
 
-  l = OpenFlow_01_Task(port = int(port), address = address,
-                       ssl_key = private_key, ssl_cert = certificate,
-                       ssl_ca_cert = ca_cert)
+  workers = int(workers)
+  if workers > 0:
+    if private_key or certificate or ca_cert:
+      raise RuntimeError("SSL is not supported with --workers")
+    from pox.openflow.of_01_workers import OpenFlow_01_WorkerTask
+    l = OpenFlow_01_WorkerTask(workers = workers, port = int(port),
+                               address = address)
+  else:
+    if pox.lib.util.str_to_bool(epoll):
+      task_class = OpenFlow_01_EpollTask
+    else:
+      task_class = OpenFlow_01_Task
+    l = task_class(port = int(port), address = address,
+                   ssl_key = private_key, ssl_cert = certificate,
+                   ssl_ca_cert = ca_cert)
   core.register(name, l)
   return l
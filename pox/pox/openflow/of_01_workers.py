@@ -0,0 +1,622 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Shards OpenFlow switch connections across worker processes
+
+The listening socket is shared by N forked worker processes.  Each worker
+accepts switches and epolls their sockets, frames their OpenFlow messages,
+answers echo requests itself, and drops the message types nobody in the
+controller listens to (PacketIns and FlowRemoveds).  It decodes everything
+else, and sends the decoded messages (pickled) to the controller process
+over a socketpair, where they are handled by a regular of_01 Connection.
+Unpickling a message costs about a third of decoding it, so this moves most
+of the decoding out of the controller.  Messages sent to a switch are sent
+raw to its worker.
+
+So the controller process only selects on N sockets, however many switches
+are connected.
+
+Nothing is dropped for a switch until its ConnectionUp has been handled
+(so listeners added by ConnectionUp handlers see its first PacketIns).  The
+controller then pushes the updated message types to drop to the workers,
+followed by a record which turns on dropping for that switch.  Later
+listener changes (noticed on Connections and core.openflow) are pushed when
+the controller next wakes up, and everything is checked again every
+SUBSCRIPTION_INTERVAL seconds.
+
+Start with openflow.of_01 --workers=N
+"""
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from pox.openflow import PacketIn, FlowRemoved
+from pox.openflow.of_01 import OpenFlow_01_Task, Connection, unpackers
+from pox.lib.recoco import Select
+
+import os
+import socket
+import select
+import struct
+import sys
+import threading
+import time
+import traceback
+import cPickle as pickle
+from errno import EAGAIN, EINTR, EPIPE
+
+log = core.getLogger()
+
+# Records between the workers and the controller process are the record
+# header (kind, connection id, payload length) followed by the payload
+_record = struct.Struct("!BII")
+_ofp_header = struct.Struct("!BBH")
+
+# Worker -> controller
+_CONNECT = 1     # A switch connected.  Payload: its "address:port"
+_MESSAGES = 2    # Messages from a switch.  Payload: a pickled list of them
+_DISCONNECT = 3  # A switch went away.  Payload: why, if it was bad
+_ERROR = 8       # The worker failed.  Payload: the traceback
+# Controller -> worker
+_CLOSE = 4       # Close a switch connection
+_DROP = 5        # Message types to drop.  Payload: the type numbers
+_FILTER = 6      # Start dropping messages for a switch (it's up)
+_DATA = 7        # Raw messages to send to a switch
+
+# Message types which are dropped if there's no listener for their event
+_filterable = {
+  of.OFPT_PACKET_IN : PacketIn,
+  of.OFPT_FLOW_REMOVED : FlowRemoved,
+}
+
+# Seconds between full updates of the dropped message types (in case some
+# listener change went unnoticed)
+SUBSCRIPTION_INTERVAL = 1
+
+
+def _parse_records (buf):
+  """
+  Returns a list of (kind, connection id, payload) for the complete records
+  in buf
+
+  The records are removed from buf (a bytearray) before they're returned,
+  so they aren't handled again if handling one of them fails.
+  """
+  records = []
+  offset = 0
+  end = len(buf)
+  while end - offset >= _record.size:
+    kind,con_id,length = _record.unpack_from(buf, offset)
+    if end - offset - _record.size < length: break
+    start = offset + _record.size
+    offset = start + length
+    records.append((kind, con_id, bytes(buf[start:offset])))
+  del buf[:offset]
+  return records
+
+
+def _close_inherited_fds (keep):
+  """
+  Closes the file descriptors a worker inherited, except keep and stdio
+  """
+  try:
+    fds = [int(fd) for fd in os.listdir('/proc/self/fd')]
+  except OSError:
+    fds = range(3, 1024)
+  for fd in fds:
+    if fd > 2 and fd not in keep:
+      try:
+        os.close(fd)
+      except OSError:
+        pass
+
+
+class _Switch (object):
+  """
+  A switch connection in a worker
+  """
+  def __init__ (self, con_id, sock):
+    self.id = con_id
+    self.sock = sock
+    self.rbuf = bytearray()
+    self.wbuf = bytearray()
+    self.filtering = False # Drop unwanted messages? (once it's up)
+
+
+class _Worker (object):
+  """
+  The I/O loop of a worker process
+
+  This runs in a forked process, so it doesn't use the POX core (or log).
+  Things worth logging are sent to the controller instead.
+  """
+  read_size = 64 * 1024
+
+  def __init__ (self, index, listener, control):
+    self.index = index
+    self.listener = listener
+    self.control = control
+    self.control.setblocking(0)
+    self.poller = select.epoll()
+    self.switches = {} # fd -> _Switch
+    self.by_id = {} # connection id -> _Switch
+    self.next_id = 0
+    self.drop_types = set()
+    self.cbuf = bytearray() # from the controller
+    self.cwbuf = bytearray() # to the controller
+    self.poller.register(listener.fileno(), select.EPOLLIN)
+    self.poller.register(control.fileno(), select.EPOLLIN)
+
+  def run (self):
+    while True:
+      try:
+        events = self.poller.poll(1)
+      except IOError as e:
+        if e.errno == EINTR: continue
+        raise
+      for fd, event in events:
+        if fd == self.listener.fileno():
+          self._accept()
+        elif fd == self.control.fileno():
+          if event & select.EPOLLOUT:
+            self._flush_control()
+          if event & (select.EPOLLIN|select.EPOLLERR|select.EPOLLHUP):
+            if not self._read_control():
+              return
+        else:
+          sw = self.switches.get(fd)
+          if sw is None: continue
+          if event & select.EPOLLOUT:
+            self._flush(sw)
+          if event & (select.EPOLLIN|select.EPOLLERR|select.EPOLLHUP):
+            self._read(sw)
+
+  def _send_control (self, kind, con_id, payload = b''):
+    self.cwbuf += _record.pack(kind, con_id, len(payload))
+    self.cwbuf += payload
+    self._flush_control()
+
+  def _flush_control (self):
+    try:
+      n = self.control.send(self.cwbuf)
+    except socket.error as e:
+      if e.errno != EAGAIN: raise
+      n = 0
+    del self.cwbuf[:n]
+    mask = select.EPOLLIN
+    if self.cwbuf: mask |= select.EPOLLOUT
+    self.poller.modify(self.control.fileno(), mask)
+
+  def _read_control (self):
+    try:
+      data = self.control.recv(self.read_size)
+    except socket.error as e:
+      if e.errno == EAGAIN: return True
+      return False
+    if not data:
+      # The controller went away
+      return False
+    self.cbuf += data
+    for kind,con_id,payload in _parse_records(self.cbuf):
+      if kind == _DROP:
+        self.drop_types = set(bytearray(payload))
+        continue
+      sw = self.by_id.get(con_id)
+      if sw is None: continue
+      if kind == _DATA:
+        sw.wbuf += payload
+        self._flush(sw)
+      elif kind == _FILTER:
+        sw.filtering = True
+      elif kind == _CLOSE:
+        self._close(sw, notify = False)
+    return True
+
+  def _accept (self):
+    try:
+      sock = self.listener.accept()[0]
+    except socket.error:
+      # Another worker got it
+      return
+    sock.setblocking(0)
+    self.next_id += 1
+    # Connection ids are unique across the workers
+    sw = _Switch(self.next_id << 8 | self.index, sock)
+    self.switches[sock.fileno()] = sw
+    self.by_id[sw.id] = sw
+    self.poller.register(sock.fileno(), select.EPOLLIN)
+    try:
+      peer = "%s:%s" % sock.getpeername()
+    except Exception:
+      peer = ""
+    self._send_control(_CONNECT, sw.id, peer)
+
+  def report (self, text):
+    """
+    Sends text (a traceback) to the controller to log, and waits until
+    it's sent
+    """
+    self._send_control(_ERROR, 0, text)
+    self.control.setblocking(1)
+    self.control.sendall(bytes(self.cwbuf))
+    del self.cwbuf[:]
+
+  def _close (self, sw, notify = True, reason = ''):
+    fd = sw.sock.fileno()
+    self.switches.pop(fd, None)
+    self.by_id.pop(sw.id, None)
+    try:
+      self.poller.unregister(fd)
+    except Exception:
+      pass
+    try:
+      sw.sock.close()
+    except Exception:
+      pass
+    if notify:
+      self._send_control(_DISCONNECT, sw.id, reason)
+
+  def _flush (self, sw):
+    if sw.wbuf:
+      try:
+        n = sw.sock.send(sw.wbuf)
+      except socket.error as e:
+        if e.errno != EAGAIN:
+          self._close(sw)
+          return
+        n = 0
+      del sw.wbuf[:n]
+    mask = select.EPOLLIN
+    if sw.wbuf: mask |= select.EPOLLOUT
+    self.poller.modify(sw.sock.fileno(), mask)
+
+  def _read (self, sw):
+    try:
+      data = sw.sock.recv(self.read_size)
+    except socket.error as e:
+      if e.errno == EAGAIN: return
+      data = b''
+    if not data:
+      self._close(sw)
+      return
+
+    rbuf = sw.rbuf
+    rbuf += data
+    drop_types = self.drop_types if sw.filtering else ()
+    msgs = []
+    replied = False
+    bad = None
+    offset = 0
+    end = len(rbuf)
+    while end - offset >= 8:
+      version,ofp_type,length = _ofp_header.unpack_from(rbuf, offset)
+      if version != of.OFP_VERSION and ofp_type != of.OFPT_HELLO:
+        # (We let hellos through and hope the other side switches down)
+        bad = "Bad OpenFlow version (0x%02x)" % (version,)
+        break
+      if length < 8:
+        bad = "Bad OpenFlow message length (%i)" % (length,)
+        break
+      if end - offset < length: break
+      if ofp_type == of.OFPT_ECHO_REQUEST:
+        reply = rbuf[offset:offset+length]
+        reply[1] = of.OFPT_ECHO_REPLY
+        sw.wbuf += reply
+        replied = True
+      elif ofp_type not in drop_types:
+        try:
+          msgs.append(unpackers[ofp_type](bytes(rbuf[offset:offset+length]),
+                                          0)[1])
+        except Exception:
+          bad = "Bad OpenFlow message (type %i)" % (ofp_type,)
+          break
+      offset += length
+    del rbuf[:offset]
+
+    # Send the good messages, even if there were bad ones after them
+    if msgs:
+      self._send_control(_MESSAGES, sw.id,
+                         pickle.dumps(msgs, pickle.HIGHEST_PROTOCOL))
+    if replied:
+      self._flush(sw)
+    if bad and sw.id in self.by_id:
+      self._close(sw, reason = bad)
+
+
+class _WorkerSocket (object):
+  """
+  Stands in for the socket of a switch served by a worker
+
+  A Connection's sends go to the worker.  It never reads from it, since
+  the worker sends decoded messages (see _WorkerConnection).
+  """
+  def __init__ (self, link, con_id, peer):
+    self.link = link
+    self.con_id = con_id
+    self.peer = peer
+    self.closed = False
+
+  def send (self, data):
+    if self.closed:
+      raise socket.error(EPIPE, "Connection closed")
+    self.link.send_record(_DATA, self.con_id, data)
+    return len(data)
+
+  def shutdown (self, how = None):
+    if not self.closed:
+      self.closed = True
+      self.link.send_record(_CLOSE, self.con_id)
+
+  def close (self):
+    self.shutdown()
+
+  def setblocking (self, flag):
+    pass
+
+  def fileno (self):
+    return self.link.fileno()
+
+  def getpeername (self):
+    host,port = self.peer.rsplit(":", 1)
+    return (host, int(port))
+
+
+class _WorkerConnection (Connection):
+  """
+  A Connection to a switch served by a worker
+
+  It's handed the messages its worker decoded, instead of reading them.
+  It tells its link when its listeners change, since that may change which
+  messages the workers should drop.
+  """
+  def __init__ (self, link, sock):
+    self.link = link
+    self.filtering = False # Told the worker to drop unwanted messages?
+    Connection.__init__(self, sock)
+
+  def handle_messages (self, msgs):
+    """
+    Handles messages like Connection.read() does once it's decoded them
+    """
+    self.idle_time = time.time()
+    for msg in msgs:
+      try:
+        h = self.handlers[msg.header_type]
+        h(self, msg)
+      except:
+        log.exception("%s: Exception while handling OpenFlow message:\n" +
+                      "%s %s", self,self,
+                      ("\n" + str(self) + " ").join(str(msg).split('\n')))
+
+  def addListener (self, *args, **kw):
+    r = Connection.addListener(self, *args, **kw)
+    self.link.listeners_changed()
+    return r
+
+  def removeListener (self, *args, **kw):
+    r = Connection.removeListener(self, *args, **kw)
+    self.link.listeners_changed()
+    return r
+
+
+class _WorkerLink (object):
+  """
+  The controller's end of the socketpair to a worker process
+  """
+  def __init__ (self, task, index, sock, pid):
+    self.task = task
+    self.index = index
+    self.sock = sock
+    self.pid = pid
+    self.rbuf = bytearray()
+    self.connections = {} # connection id -> Connection
+    self.drop_types = None
+    self._lock = threading.Lock()
+
+  def fileno (self):
+    return self.sock.fileno()
+
+  def send_record (self, kind, con_id, payload = b''):
+    with self._lock:
+      self.sock.sendall(_record.pack(kind, con_id, len(payload)) + payload)
+
+  def set_drop_types (self, drop_types):
+    if drop_types != self.drop_types:
+      self.drop_types = drop_types
+      self.send_record(_DROP, 0, bytes(bytearray(sorted(drop_types))))
+
+  def listeners_changed (self):
+    self.task.listeners_changed()
+
+  def read (self):
+    """
+    Reads the worker's records, and feeds them to the Connections
+
+    Returns False if the worker went away.
+    """
+    data = self.sock.recv(256 * 1024)
+    if not data:
+      return False
+    self.rbuf += data
+    for kind,con_id,payload in _parse_records(self.rbuf):
+      try:
+        self._handle_record(kind, con_id, payload)
+      except Exception:
+        log.exception("Exception handling record from OpenFlow worker %i",
+                      self.index)
+    return True
+
+  def _handle_record (self, kind, con_id, payload):
+    if kind == _CONNECT:
+      con = _WorkerConnection(self, _WorkerSocket(self, con_id, payload))
+      self.connections[con_id] = con
+      return
+    if kind == _ERROR:
+      log.error("OpenFlow worker %i failed:\n%s", self.index, payload)
+      return
+    con = self.connections.get(con_id)
+    if con is None: return
+    if kind == _MESSAGES:
+      con.handle_messages(pickle.loads(payload))
+      if not con.filtering and con.connect_time is not None:
+        # Its ConnectionUp has been handled, so the workers can be
+        # told what to drop, and then to drop it for this switch
+        con.filtering = True
+        self.task.update_drop_types()
+        self.send_record(_FILTER, con_id)
+    elif kind == _DISCONNECT:
+      if payload:
+        log.warning("%s on connection %s", payload, con)
+      con.sock.closed = True
+      self._close(con_id, con)
+
+  def _close (self, con_id, con):
+    self.connections.pop(con_id, None)
+    try:
+      con.close()
+    except:
+      pass
+
+  def close (self):
+    for con_id,con in self.connections.items():
+      self._close(con_id, con)
+    try:
+      self.sock.close()
+    except:
+      pass
+
+
+def _has_listeners (obj, event):
+  handlers = getattr(obj, '_eventMixin_handlers', None)
+  return bool(handlers and handlers.get(event))
+
+
+class OpenFlow_01_WorkerTask (OpenFlow_01_Task):
+  """
+  OpenFlow listener which serves switches from worker processes
+  """
+  def __init__ (self, workers = 2, port = 6633, address = '0.0.0.0'):
+    OpenFlow_01_Task.__init__(self, port = port, address = address)
+    self.workers = workers
+    self.links = []
+    self._listeners_changed = True
+    self._nexus_listening = None
+
+  def _fork_workers (self, listener):
+    for index in range(self.workers):
+      mine,theirs = socket.socketpair()
+      pid = os.fork()
+      if pid == 0:
+        # Worker process
+        status = 0
+        worker = None
+        try:
+          mine.close()
+          for link in self.links:
+            link.sock.close()
+          _close_inherited_fds((listener.fileno(), theirs.fileno()))
+          worker = _Worker(index, listener, theirs)
+          worker.run()
+        except KeyboardInterrupt:
+          pass
+        except BaseException:
+          status = 1
+          tb = traceback.format_exc()
+          try:
+            worker.report(tb)
+          except Exception:
+            sys.stderr.write("OpenFlow worker %i failed:\n%s" % (index, tb))
+        os._exit(status)
+      theirs.close()
+      self.links.append(_WorkerLink(self, index, mine, pid))
+      log.debug("Started OpenFlow worker %i (pid %i)", index, pid)
+
+  def _drop_types (self):
+    """
+    The filterable message types no one listens to
+    """
+    drop = set()
+    nexus = core.components.get('openflow')
+    for ofp_type,event in _filterable.iteritems():
+      if nexus is not None and _has_listeners(nexus, event):
+        continue
+      listened = False
+      for link in self.links:
+        for con in link.connections.itervalues():
+          if _has_listeners(con, event) or (con.ofnexus is not nexus and
+                                            _has_listeners(con.ofnexus, event)):
+            listened = True
+            break
+        if listened: break
+      if not listened:
+        drop.add(ofp_type)
+    return drop
+
+  def listeners_changed (self):
+    self._listeners_changed = True
+
+  def update_drop_types (self, force = False):
+    """
+    Tells the workers which message types to drop, if that may have changed
+    """
+    nexus = core.components.get('openflow')
+    listening = tuple(_has_listeners(nexus, event)
+                      for event in _filterable.itervalues())
+    if not (force or self._listeners_changed
+            or listening != self._nexus_listening):
+      return
+    self._listeners_changed = False
+    self._nexus_listening = listening
+    drop = self._drop_types()
+    for link in self.links:
+      link.set_drop_types(drop)
+
+  def run (self):
+    listener = self._bind_listener()
+    if listener is None:
+      return
+    self._fork_workers(listener)
+    listener.close()
+
+    next_update = 0
+    while core.running and self.links:
+      now = time.time()
+      if now >= next_update:
+        next_update = now + SUBSCRIPTION_INTERVAL
+        self.update_drop_types(force = True)
+      else:
+        self.update_drop_types()
+
+      rlist, wlist, elist = yield Select(self.links, [], [],
+                                         SUBSCRIPTION_INTERVAL)
+      for link in rlist:
+        try:
+          alive = link.read()
+        except socket.error:
+          alive = False
+        except:
+          log.exception("Exception reading from OpenFlow worker %i",
+                        link.index)
+          continue
+        if not alive:
+          log.error("OpenFlow worker %i went away", link.index)
+          link.close()
+          self.links.remove(link)
+
+    for link in self.links:
+      link.close()
+    for link in self.links:
+      try:
+        os.waitpid(link.pid, 0)
+      except OSError:
+        pass
+    log.debug("No longer listening for connections")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import os.path
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import pox.core
+if pox.core.core is None:
+  pox.core.initialize(threaded_selecthub=False, handle_signals=False)
+
+from pox.openflow.libopenflow_01 import *
+from pox.datapaths.pcap_replay import ReplaySwitch, ReplayStats
+from pox.lib.pxpcap.writer import PCapRawWriter
+from pox.lib.packet import ethernet
+from pox.lib.addresses import EthAddr
+
+
+class MockConnection (object):
+  def __init__ (self):
+    self.received = []
+
+  def set_message_handler (self, handler):
+    self.on_message_received = handler
+
+  def send (self, msg):
+    self.received.append(msg)
+
+
+class ReplaySwitchTest (unittest.TestCase):
+  def setUp (self):
+    fd,self.filename = tempfile.mkstemp(suffix = ".pcap")
+    os.close(fd)
+    w = PCapRawWriter(open(self.filename, "wb"))
+    for i in range(10):
+      e = ethernet(src = EthAddr("00:00:00:00:00:%02x" % (1 + i % 3,)),
+                   dst = EthAddr("00:00:00:00:00:ff"), type = 0x0800,
+                   payload = "x" * (100 + i * 10))
+      w.write(e.pack())
+    w.close()
+    self.conn = MockConnection()
+
+  def tearDown (self):
+    os.unlink(self.filename)
+
+  def _switch (self, **kw):
+    sw = ReplaySwitch(self.filename, dpid = 1, ports = 4, **kw)
+    sw.set_connection(self.conn)
+    sw._packets = sw._iter_packets()
+    sw.started = time.time()
+    sw.total = ReplayStats(sw.started)
+    sw.interval = ReplayStats(sw.started)
+    return sw
+
+  def _sent (self):
+    return [ofp_packet_in.unpack_new(m)[1] for m in self.conn.received]
+
+  def test_packet_ins (self):
+    sw = self._switch(loops = 2)
+    self.assertEqual(sw.send_batch(time.time()), 20)
+    pis = self._sent()
+    self.assertEqual([pi.buffer_id for pi in pis], range(20))
+    self.assertEqual(pis[2].total_len, 134)
+    self.assertEqual(len(pis[2].data), sw.miss_send_len)
+    # Ports follow source addresses
+    self.assertEqual(pis[0].in_port, pis[3].in_port)
+    self.assertNotEqual(pis[0].in_port, pis[1].in_port)
+    self.assertEqual(sw.send_batch(time.time()), 0)
+    self.assertFalse(sw.done)
+
+    for pi in pis[:10]:
+      sw.rx_message(self.conn, ofp_packet_out(buffer_id = pi.buffer_id))
+    for pi in pis[10:19]:
+      sw.rx_message(self.conn, ofp_flow_mod(buffer_id = pi.buffer_id))
+    sw.rx_message(self.conn, ofp_packet_out(buffer_id = 0))
+    self.assertEqual(sw.total.replies, 19)
+    self.assertEqual(sw.total.unmatched, 1)
+    self.assertEqual(len(sw.table), 0) # Flows aren't installed
+
+    sw._expire(time.time() + sw.timeout + 1)
+    self.assertEqual(sw.total.lost, 1)
+    self.assertTrue(sw.done)
+
+  def test_window_and_rate (self):
+    sw = self._switch(window = 4)
+    self.assertEqual(sw.send_batch(time.time()), 4)
+    self.assertEqual(sw.send_batch(time.time()), 0)
+    sw.rx_message(self.conn, ofp_packet_out(buffer_id = 0))
+    self.assertEqual(sw.send_batch(time.time()), 1)
+
+    self.conn.received = []
+    sw = self._switch(rate = 100)
+    self.assertEqual(sw.send_batch(sw.started + 0.055), 5)
+    self.assertEqual(sw.send_batch(sw.started + 0.055), 0)
+    self.assertEqual(sw.send_batch(sw.started + 10), 5)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import pox.forwarding.l2_multi as l2m
+
+class FakeSwitch (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+  def __repr__ (self):
+    return "s%i" % (self.dpid,)
+
+def _distances (sws):
+  """ Reference all-pairs hop counts (Floyd-Warshall) """
+  inf = float('inf')
+  d = dict(((i,j), 0 if i is j else inf) for i in sws for j in sws)
+  for i in sws:
+    for j,port in l2m.adjacency[i].iteritems():
+      if port is not None: d[i,j] = 1
+  for k in sws:
+    for i in sws:
+      for j in sws:
+        if d[i,k] + d[k,j] < d[i,j]:
+          d[i,j] = d[i,k] + d[k,j]
+  return d
+
+class PathCacheTest (unittest.TestCase):
+  def setUp (self):
+    l2m.adjacency.clear()
+    self.cache = l2m.PathCache()
+    self.sws = [FakeSwitch(i) for i in range(12)]
+
+  def tearDown (self):
+    l2m.adjacency.clear()
+
+  def _link (self, a, b, up):
+    if up:
+      if l2m.adjacency[a][b] is not None: return
+      l2m.adjacency[a][b] = b.dpid
+      l2m.adjacency[b][a] = a.dpid
+      self.cache.link_up(a, b)
+    else:
+      if l2m.adjacency[a][b] is None: return
+      del l2m.adjacency[a][b]
+      del l2m.adjacency[b][a]
+      self.cache.link_down(a, b)
+
+  def _check (self):
+    ref = _distances(self.sws)
+    for src in self.sws:
+      for dst in self.sws:
+        p = self.cache.get_raw_path(src, dst)
+        if ref[src,dst] == float('inf'):
+          self.assertEqual(p, None)
+          continue
+        if src is dst:
+          self.assertEqual(p, [])
+          continue
+        self.assertEqual(len(p) + 1, ref[src,dst])
+        hops = [src] + p + [dst]
+        for a,b in zip(hops[:-1], hops[1:]):
+          self.assertNotEqual(l2m.adjacency[a][b], None)
+
+  def test_line (self):
+    s = self.sws
+    for a,b in zip(s[:-1], s[1:]):
+      self._link(a, b, True)
+    self.assertEqual(self.cache.get_raw_path(s[0], s[3]), s[1:3])
+    self.assertEqual(self.cache.get_raw_path(s[0], s[1]), [])
+    self._link(s[0], s[3], True)
+    self.assertEqual(self.cache.get_raw_path(s[0], s[3]), [])
+    self._link(s[5], s[6], False)
+    self.assertEqual(self.cache.get_raw_path(s[0], s[6]), None)
+
+  def test_link_down_keeps_unaffected_trees (self):
+    # Two separate lines
+    s = self.sws
+    for a,b in zip(s[:-1], s[1:]):
+      if a.dpid == 5: continue
+      self._link(a, b, True)
+    self.cache.get_raw_path(s[0], s[2])
+    self.cache.get_raw_path(s[6], s[11])
+    self._link(s[0], s[1], False)
+    self.assertEqual(len(self.cache), 1)
+
+  def test_storm (self):
+    rand = random.Random(1)
+    for _ in range(300):
+      a,b = rand.sample(self.sws, 2)
+      self._link(a, b, rand.random() < 0.6)
+      # Only ask for some paths so that the cache is partially filled
+      for _ in range(5):
+        self.cache.get_raw_path(*rand.sample(self.sws, 2))
+      if rand.random() < 0.2:
+        self._check()
+    self._check()
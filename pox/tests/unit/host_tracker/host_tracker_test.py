@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import pox.core
+if pox.core.core is None:
+  pox.core.initialize(threaded_selecthub=False, handle_signals=False)
+
+from pox.host_tracker.host_tracker import (host_tracker, MacEntry, IpEntry,
+                                           PingCtrl,
+                                           timeoutSec)
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+class Tracker (host_tracker):
+  """
+  host_tracker which records pings instead of sending them
+  """
+  def __init__ (self):
+    super(Tracker,self).__init__()
+    self._t.cancel()
+    self._ping_timer.cancel()
+    self.pinged = []
+
+  def sendPing (self, macEntry, ipAddr):
+    self.pinged.append(ipAddr)
+    macEntry.ipAddrs[ipAddr].pings.sent()
+    return True
+
+  def learn (self, n, age = 0, hasARP = True):
+    """
+    Adds a host last seen age seconds ago
+    """
+    mac = EthAddr("00:00:00:00:%02x:%02x" % (n >> 8, n & 0xff))
+    ip = IPAddr("10.0.%i.%i" % (n >> 8, n & 0xff))
+    e = MacEntry(1, n, mac)
+    e.lastTimeSeen -= age
+    self.entryByMAC[mac] = e
+    self._push_expiry(e, e)
+    ipEntry = IpEntry(hasARP)
+    ipEntry.lastTimeSeen -= age
+    e.ipAddrs[ip] = ipEntry
+    self._push_expiry(ipEntry, e, ip)
+    return e, ip
+
+  def age (self, seconds):
+    """
+    Makes everything look seconds older
+    """
+    for e in self.entryByMAC.values():
+      e.lastTimeSeen -= seconds
+      for ipEntry in e.ipAddrs.values():
+        ipEntry.lastTimeSeen -= seconds
+        ipEntry.pings.lastTimeSeen -= seconds
+    self._expiry_heap = sorted((h[0] - seconds,) + h[1:]
+                               for h in self._expiry_heap)
+
+  def drain (self):
+    """
+    Sends everything queued, regardless of the ping rate
+    """
+    self._ping_rate = self._ping_credit = float(len(self._ping_queue))
+    self._last_ping_tick -= 1
+    self._send_pings()
+
+
+class HostTrackerTest (unittest.TestCase):
+  def test_only_due_entries_checked (self):
+    t = Tracker()
+    for n in range(100):
+      t.learn(n)
+    old,ip = t.learn(200, age = timeoutSec['arpAware'] + 1)
+    heap_len = len(t._expiry_heap)
+    t._check_timeouts()
+    # Only the old host's entries came off the heap (and went back on)
+    self.assertEqual(len(t._expiry_heap), heap_len)
+    self.assertEqual(len(t._ping_queue), 1)
+    self.assertEqual(t.stats['pings_queued'], 1)
+    self.assertEqual(t.pinged, [])
+    t.drain()
+    self.assertEqual(t.pinged, [ip])
+    self.assertEqual(t.stats['pings_outstanding'], 1)
+
+  def test_reply_keeps_host (self):
+    t = Tracker()
+    e,ip = t.learn(1, age = timeoutSec['arpAware'] + 1)
+    t._check_timeouts()
+    t.drain()
+    self.assertEqual(t.pinged, [ip])
+    # The host answers the ping
+    e.refresh()
+    t.updateIPInfo(ip, e, True)
+    self.assertEqual(t.stats['pings_outstanding'], 0)
+    t.age(timeoutSec['arpReply'] + 1)
+    t._check_timeouts()
+    self.assertIn(e.macaddr, t.entryByMAC)
+    self.assertEqual(len(t._ping_queue), 0)
+
+  def test_silent_host_expires (self):
+    t = Tracker()
+    e,ip = t.learn(1, age = timeoutSec['arpAware'] + 1)
+    left = []
+    t.addListenerByName("HostEvent", lambda event: left.append(event.leave))
+    for i in range(PingCtrl.pingLim + 3):
+      t._check_timeouts()
+      t.drain()
+      t.age(timeoutSec['arpReply'] + 1)
+    self.assertEqual(len(t.pinged), PingCtrl.pingLim + 1)
+    self.assertNotIn(e.macaddr, t.entryByMAC)
+    self.assertEqual(left, [True])
+    stats = t.stats
+    self.assertEqual(stats['expired_ips'], 1)
+    self.assertEqual(stats['expired_macs'], 1)
+    self.assertEqual(stats['pings_outstanding'], 0)
+    self.assertEqual(stats['macs'], 0)
+    self.assertGreater(stats['expirations_per_second'], 0)
+
+  def test_pings_spread_over_interval (self):
+    t = Tracker()
+    count = 1000
+    for n in range(count):
+      t.learn(n, age = timeoutSec['arpAware'] + 1)
+    t._check_timeouts()
+    self.assertEqual(len(t._ping_queue), count)
+    rate = min(PingCtrl.pingRate, count / float(timeoutSec['timerInterval']))
+    self.assertEqual(t._ping_rate, rate)
+    # One tick only sends a tick's worth
+    t._last_ping_tick = time.time() - 0.1
+    t._send_pings()
+    self.assertTrue(0 < len(t.pinged) <= rate * 0.1 + 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
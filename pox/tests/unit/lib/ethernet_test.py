@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.packet import *
+from pox.lib.packet.ethernet import ETHER_BROADCAST
+from pox.lib.packet.icmp import TYPE_ECHO_REQUEST, echo
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+def _frames ():
+  """
+  Raw frames of a few common kinds
+  """
+  src = EthAddr("00:00:00:00:00:01")
+  dst = EthAddr("00:00:00:00:00:02")
+  frames = []
+
+  a = arp(opcode = arp.REQUEST, hwsrc = src,
+          protosrc = IPAddr("10.0.0.1"), protodst = IPAddr("10.0.0.2"))
+  frames.append(ethernet(src = src, dst = ETHER_BROADCAST,
+                         type = ethernet.ARP_TYPE, payload = a).pack())
+
+  for proto,l4 in ((ipv4.TCP_PROTOCOL, tcp(srcport = 1234, dstport = 80,
+                                           off = 5, payload = "GET /")),
+                   (ipv4.UDP_PROTOCOL, udp(srcport = 53, dstport = 5353,
+                                           payload = "x" * 40)),
+                   (ipv4.ICMP_PROTOCOL, icmp(type = TYPE_ECHO_REQUEST,
+                                             payload = echo(id = 7)))):
+    ip = ipv4(srcip = IPAddr("10.0.0.1"), dstip = IPAddr("10.0.0.2"),
+              protocol = proto, payload = l4)
+    frames.append(ethernet(src = src, dst = dst, type = ethernet.IP_TYPE,
+                           payload = ip).pack())
+
+  ip = ipv4(srcip = IPAddr("10.0.0.1"), dstip = IPAddr("10.0.0.2"),
+            protocol = ipv4.UDP_PROTOCOL, payload = udp(srcport = 1,
+                                                        dstport = 2))
+  v = vlan(id = 10, eth_type = ethernet.IP_TYPE, payload = ip)
+  frames.append(ethernet(src = src, dst = dst, type = ethernet.VLAN_TYPE,
+                         payload = v).pack())
+
+  frames.append(b"\x00\x01\x02") # Too short
+  return frames
+
+
+class LazyEthernetTest (unittest.TestCase):
+  def test_same_as_eager (self):
+    for raw in _frames():
+      eager = ethernet(raw)
+      lazy = ethernet(raw, lazy = True)
+      self.assertEqual(eager.parsed, lazy.parsed)
+      self.assertEqual(eager.dump(), lazy.dump())
+      if eager.parsed:
+        self.assertEqual(eager.effective_ethertype, lazy.effective_ethertype)
+        self.assertEqual(eager.pack(), lazy.pack())
+
+  def test_upper_layers_parsed_on_access (self):
+    raw = _frames()[1]
+    e = ethernet(raw, lazy = True)
+    self.assertEqual(e.type, ethernet.IP_TYPE)
+    self.assertIs(e._next, None)
+    self.assertIs(e._dst, None)
+    self.assertEqual(e.dst, EthAddr("00:00:00:00:00:02"))
+    self.assertIs(e._next, None)
+    self.assertEqual(e.find('tcp').dstport, 80)
+    self.assertIsInstance(e._next, ipv4)
+
+  def test_modified_before_access (self):
+    raw = _frames()[2]
+    e = ethernet(raw, lazy = True)
+    e.src = EthAddr("00:00:00:00:00:03")
+    e.next.next.dstport = 9
+    packed = ethernet(e.pack())
+    self.assertEqual(packed.src, EthAddr("00:00:00:00:00:03"))
+    self.assertEqual(packed.find('udp').dstport, 9)
+
+  def test_class_default (self):
+    raw = _frames()[0]
+    old = ethernet.lazy
+    try:
+      ethernet.lazy = True
+      self.assertIs(ethernet(raw)._next, None)
+      self.assertIsInstance(ethernet(raw, lazy = False)._next, arp)
+    finally:
+      ethernet.lazy = old
+    self.assertIsInstance(ethernet(raw)._next, arp)
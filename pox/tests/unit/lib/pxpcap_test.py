@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import os.path
+import tempfile
+from StringIO import StringIO
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.pxpcap.parser import PCapParser, PCapFileReader
+from pox.lib.pxpcap.writer import PCapRawWriter
+
+
+def _packets ():
+  return [(1000 + i / 8.0, chr(i % 256) * (1 + i * 7 % 200))
+          for i in range(500)]
+
+
+class PCapTest (unittest.TestCase):
+  def setUp (self):
+    fd,self.filename = tempfile.mkstemp(suffix = ".pcap")
+    os.close(fd)
+    w = PCapRawWriter(open(self.filename, "wb"), buffer_size = 1000)
+    for t,data in _packets():
+      w.write(data, time = t)
+    w.close()
+
+  def tearDown (self):
+    os.unlink(self.filename)
+
+  def test_reader (self):
+    with PCapFileReader(self.filename) as r:
+      self.assertEqual(r.lltype, 1)
+      got = [(t, str(data)) for t,data in r]
+    self.assertEqual(got, _packets())
+
+  def test_parser_chunks (self):
+    data = open(self.filename, "rb").read()
+    for chunk in (1, 7, 4096, len(data)):
+      got = []
+      p = PCapParser(callback = lambda d, p: got.append((p._time, d)))
+      for i in range(0, len(data), chunk):
+        p.feed(data[i:i+chunk])
+      self.assertEqual(got, _packets())
+
+  def test_writer_buffers (self):
+    out = StringIO()
+    w = PCapRawWriter(out)
+    header = out.getvalue()
+    w.write("x" * 100, time = 1)
+    self.assertEqual(out.getvalue(), header)
+    w.flush()
+    self.assertEqual(len(out.getvalue()), len(header) + 16 + 100)
+
+    out = StringIO()
+    w = PCapRawWriter(out, flush = True)
+    w.write("x" * 100, time = 1)
+    self.assertEqual(len(out.getvalue()), 24 + 16 + 100)
+
+  def test_truncated (self):
+    with open(self.filename, "r+b") as f:
+      f.truncate(os.path.getsize(self.filename) - 1)
+    with PCapFileReader(self.filename) as r:
+      self.assertEqual(len(list(r)), len(_packets()) - 1)
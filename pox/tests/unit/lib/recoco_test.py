@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import select
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.recoco.recoco import *
+
+
+class FakeTask (object):
+  def __init__ (self, name, task_class):
+    self.name = name
+    self.task_class = task_class
+  def __repr__ (self):
+    return self.name
+
+
+class ReadyQueueTest (unittest.TestCase):
+  def _run (self, q, cost, n):
+    """
+    Runs n tasks like Scheduler.cycle() with tasks which yield 0, charging
+    each cost[task_class]
+    """
+    order = []
+    for _ in range(n):
+      t = q.popleft()
+      order.append(t.name)
+      q.append(t)
+      q.charge(t, cost[t.task_class])
+    return order
+
+  def test_weighted_shares (self):
+    q = ReadyQueue(weights = (8, 4, 1))
+    for name,c in (("io", TASK_IO), ("ctl", TASK_CONTROL),
+                   ("bg", TASK_BACKGROUND)):
+      q.append(FakeTask(name, c))
+    order = self._run(q, {TASK_IO:1.0, TASK_CONTROL:1.0,
+                          TASK_BACKGROUND:1.0}, 130)
+    self.assertEqual(order[0], "io")
+    self.assertTrue(abs(order.count("io") - 80) <= 2)
+    self.assertTrue(abs(order.count("ctl") - 40) <= 2)
+    self.assertTrue(abs(order.count("bg") - 10) <= 2)
+
+  def test_idle_class_gets_no_backlog (self):
+    q = ReadyQueue(weights = (8, 4, 1))
+    ctl = FakeTask("ctl", TASK_CONTROL)
+    q.append(ctl)
+    self._run(q, {TASK_CONTROL:1.0}, 100)
+    # Background work which shows up now doesn't get to make up for the
+    # time it wasn't ready
+    q.append(FakeTask("bg", TASK_BACKGROUND))
+    order = self._run(q, {TASK_CONTROL:1.0, TASK_BACKGROUND:1.0}, 50)
+    self.assertTrue(order.count("bg") <= 11)
+    self.assertTrue(order.count("bg") >= 1)
+
+  def test_stats (self):
+    q = ReadyQueue()
+    t = FakeTask("io", TASK_IO)
+    q.append(t)
+    self.assertEqual(len(q), 1)
+    self.assertTrue(t in q)
+    self.assertTrue(q.popleft() is t)
+    q.charge(t, 3 * SLICE_BUDGET)
+    self.assertEqual(len(q), 0)
+    self.assertRaises(IndexError, q.popleft)
+    s = q.stats[TASK_IO]
+    self.assertEqual((s.scheduled, s.runs, s.overruns, s.max_depth),
+                     (1, 1, 1, 1))
+
+
+class CallLaterTaskTest (unittest.TestCase):
+  def _pings (self, task):
+    """ Reads (and returns) the pings waiting for task """
+    fd = task._pinger.fileno()
+    if not select.select([fd], [], [], 0)[0]: return 0
+    return len(os.read(fd, 64 * 1024))
+
+  def test_busy_queue_pings_once (self):
+    t = CallLaterTask()
+    called = []
+    # More than a pipe holds, if every call were to ping
+    for i in range(100000):
+      t.callLater(called.append, i)
+    r = t.run()
+    n = 100000
+    while not isinstance(r.next(), Select):
+      t.callLater(called.append, n)
+      n += 1
+    self.assertEqual(called, range(n))
+    self.assertEqual(self._pings(t), 1)
+
+  def test_ping_after_pong (self):
+    t = CallLaterTask()
+    called = []
+    t.callLater(called.append, 1)
+    r = t.run()
+    self.assertTrue(isinstance(r.next(), Select))
+    self.assertEqual(called, [1])
+    # The Select would return right away, and pong
+    self.assertTrue(isinstance(r.next(), Select))
+    self.assertEqual(self._pings(t), 0)
+    t.callLater(called.append, 2)
+    self.assertEqual(self._pings(t), 1)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import json
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.revent import *
+from pox.info.event_profiler import EventProfiler
+
+
+class Ping (Event):
+  pass
+
+class Source (EventMixin):
+  _eventMixin_events = set([Ping])
+
+class Sink (object):
+  def __init__ (self):
+    self.pings = 0
+  def _handle_Ping (self, event):
+    self.pings += 1
+
+
+class EventProfilerTest (unittest.TestCase):
+  def setUp (self):
+    self.source = Source()
+    self.sink = Sink()
+    self.source.addListenerByName("Ping", self.sink._handle_Ping)
+    self.profiler = EventProfiler(warn = None)
+
+  def tearDown (self):
+    self.profiler.stop()
+
+  def test_counts_and_halts (self):
+    def halter (event):
+      return EventHalt
+    def never (event):
+      raise AssertionError("Called after halt")
+    self.source.addListener(Ping, halter)
+    self.source.addListener(Ping, never)
+
+    self.profiler.start()
+    for _ in range(5):
+      self.assertTrue(self.source.raiseEvent(Ping).halt)
+    self.profiler.stop()
+    self.source.raiseEvent(Ping)
+
+    self.assertEqual(self.sink.pings, 6)
+    stats = json.loads(self.profiler.as_json())['events']
+    ping = stats[__name__ + '.Ping']
+    self.assertEqual(ping['raised'], 5)
+    self.assertEqual(ping['count'], 10)
+    self.assertEqual(ping['halts'], 5)
+    handlers = dict((h['handler'], h) for h in ping['handlers'])
+    self.assertEqual(sorted(handlers),
+                     [__name__ + '.Sink._handle_Ping', __name__ + '.halter'])
+    self.assertEqual(handlers[__name__ + '.halter']['halts'], 5)
+    self.assertEqual(handlers[__name__ + '.Sink._handle_Ping']['count'], 5)
+
+  def test_errors (self):
+    def broken (event):
+      raise RuntimeError("broken")
+    self.source.addListener(Ping, broken)
+    self.profiler.start()
+    self.assertRaises(RuntimeError, self.source.raiseEvent, Ping)
+    ping = self.profiler.as_dict()['events'][__name__ + '.Ping']
+    self.assertEqual(ping['errors'], 1)
+    self.assertEqual(ping['count'], 2)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import pox.core
+if pox.core.core is None:
+  pox.core.initialize(threaded_selecthub=False, handle_signals=False)
+
+from pox.openflow.libopenflow_01 import *
+from pox.openflow.discovery import LLDPSender, Discovery
+from pox.lib.addresses import EthAddr
+import pox.lib.packet as pkt
+
+
+def _addr (n):
+  return EthAddr("00:00:00:00:01:%02x" % (n,))
+
+
+def _sent (sender, dpid):
+  """ Unpacks the packet-outs LLDPSender would send to a switch """
+  data = sender._packets[dpid]
+  msgs = []
+  while data:
+    po = ofp_packet_out()
+    po.unpack(data)
+    msgs.append(po)
+    data = data[len(po):]
+  return msgs
+
+
+class LLDPSenderTest (unittest.TestCase):
+  def test_batched (self):
+    s = LLDPSender(5)
+    # Ports 3 and 4 share an address, so they need packets of their own
+    s.add_switch(0x1234, [(1, _addr(1)), (2, _addr(2)), (3, _addr(3)),
+                          (4, _addr(3)), (OFPP_LOCAL, _addr(9))])
+    msgs = _sent(s, 0x1234)
+    self.assertEqual(len(msgs), 3)
+    batch = msgs[0]
+    self.assertEqual([(a.type, getattr(a, 'port', None))
+                      for a in batch.actions],
+                     [(OFPAT_SET_DL_SRC, None), (OFPAT_OUTPUT, 1),
+                      (OFPAT_SET_DL_SRC, None), (OFPAT_OUTPUT, 2)])
+    self.assertEqual(batch.actions[2].dl_addr, _addr(2))
+    self.assertEqual([m.actions[0].port for m in msgs[1:]], [3, 4])
+    self.assertEqual(s.port_for_addr(0x1234, _addr(2).toRaw()), 2)
+    self.assertEqual(s.port_for_addr(0x1234, _addr(3).toRaw()), None)
+
+    s.del_port(0x1234, 2)
+    s.del_port(0x1234, 4)
+    # Only 1 and 3 are left, and they're batched
+    msgs = _sent(s, 0x1234)
+    self.assertEqual(len(msgs), 1)
+    self.assertEqual(len(msgs[0].actions), 4)
+
+    s.del_switch(0x1234)
+    self.assertEqual(len(s._this_cycle) + len(s._next_cycle), 0)
+    self.assertFalse(s._packets)
+
+  def test_one_queue_entry_per_switch (self):
+    s = LLDPSender(5)
+    s.add_port(1, 1, _addr(1))
+    s.add_port(1, 2, _addr(2))
+    s.add_port(2, 1, _addr(3))
+    s.add_switch(1, [(1, _addr(1))])
+    self.assertEqual(sorted(s._next_cycle), [1, 2])
+
+
+class DiscoveryParseTest (unittest.TestCase):
+  def setUp (self):
+    self.d = Discovery(install_flow = False)
+
+  def test_fast_same_as_full (self):
+    for dpid in (1, 0x1234, 0xffffffffffff, 0xfedcba9876543210):
+      for port in (1, 42, 65000):
+        eth = LLDPSender._create_discovery_packet(dpid, port, _addr(1), 120)
+        raw = eth.pack()
+        self.assertEqual(self.d._parse_own_lldp(raw), (dpid, port))
+        self.assertEqual(self.d._parse_lldp(pkt.ethernet(raw)),
+                         (dpid, port))
+
+  def test_batched_port_from_source (self):
+    self.d._sender.add_switch(7, [(1, _addr(1)), (2, _addr(2))])
+    eth = LLDPSender._create_discovery_packet(7, None, _addr(1), 120)
+    # As the switch would send it out of port 2
+    eth.src = _addr(2)
+    self.assertEqual(self.d._parse_own_lldp(eth.pack()), (7, 2))
+    eth.src = _addr(5)
+    self.assertEqual(self.d._parse_own_lldp(eth.pack()), (7, None))
+
+  def test_not_ours (self):
+    eth = LLDPSender._create_discovery_packet(1, 1, _addr(1), 120)
+    eth.next.tlvs[0].id = 'dpid:1'
+    raw = eth.pack()
+    self.assertEqual(self.d._parse_own_lldp(raw), None)
+    self.assertEqual(self.d._parse_lldp(pkt.ethernet(raw)), (1, 1))
+    self.assertEqual(self.d._parse_own_lldp(raw[:30]), None)
+
+
+class DiscoveryExpiryTest (unittest.TestCase):
+  def test_expiry (self):
+    d = Discovery(install_flow = False, link_timeout = 10)
+    removed = []
+    d.addListenerByName("LinkEvent",
+                        lambda e: removed.append(e.link) if e.removed else None)
+    old = Discovery.Link(1, 1, 2, 1)
+    fresh = Discovery.Link(2, 1, 1, 1)
+    gone = Discovery.Link(3, 1, 1, 2)
+    for link in (old, fresh, gone):
+      d._link_seen(link)
+    d._delete_links([gone])
+    removed[:] = []
+
+    # Everything is past its first deadline, but fresh was seen since
+    for i,(deadline,link) in enumerate(d._expiry_heap):
+      d._expiry_heap[i] = (deadline - 11, link)
+    d.adjacency[old] -= 11
+    d._expire_links()
+
+    self.assertEqual(removed, [old])
+    self.assertEqual(list(d.adjacency), [fresh])
+    self.assertEqual(d._expiry_links, set([fresh]))
+    self.assertEqual([l for _,l in d._expiry_heap], [fresh])
@@ -111,8 +111,118 @@ class FlowTableTest(unittest.TestCase):
       t.remove_expired_entries(now=time)
       self.assertEqual(sorted([e.cookie for e in t.entries]), remaining)
 
+  def test_expiry_rearm(self):
+    """ touched entries are re-armed, and only due entries are looked at """
+    t = FlowTable()
+    for cookie in range(100):
+      t.add_entry(TableEntry(now=0, cookie=cookie, idle_timeout=5,
+                             hard_timeout=50 + cookie))
+    for time in range(1, 56):
+      for e in t.entries: e.touch_packet(1, now=time)
+      t.remove_expired_entries(now=time)
+      self.assertEqual(t.last_expired_count, 1 if time > 50 else 0)
+    self.assertEqual(sorted(e.cookie for e in t.entries), range(5, 100))
+
+    t.remove_expired_entries(now=61)
+    self.assertEqual(len(t), 0)
+    self.assertEqual(t.expiry_stats['expired_total'], 100)
+
   # def test_check_for_overlap_entries(self):
 
+  def _random_match (self, rand):
+    m = ofp_match()
+    if rand.random() < 0.3: m.in_port = rand.randint(1, 3)
+    if rand.random() < 0.3:
+      m.dl_src = EthAddr("00:00:00:00:00:0%i" % (rand.randint(1, 3),))
+    if rand.random() < 0.2: m.dl_vlan = 0xffff
+    if rand.random() < 0.6:
+      m.dl_type = 0x0800
+      if rand.random() < 0.5: m.nw_proto = rand.choice([6, 17])
+      if rand.random() < 0.5:
+        m.nw_src = (IPAddr("10.0.%i.%i" % (rand.randint(0, 1),
+                                           rand.choice([0, 0, 1, 2]))),
+                    rand.choice([8, 16, 24, 32]))
+      if rand.random() < 0.5:
+        m.nw_dst = "10.0.0.%i" % (rand.randint(0, 2),)
+      if m.nw_proto is not None and rand.random() < 0.5:
+        m.tp_dst = rand.choice([80, 443])
+    return m
+
+  def _random_packet (self, rand):
+    from pox.lib.packet import ethernet, ipv4, tcp, udp, arp
+    e = ethernet(src=EthAddr("00:00:00:00:00:0%i" % (rand.randint(1, 3),)),
+                 dst=EthAddr("00:00:00:00:00:09"))
+    if rand.random() < 0.8:
+      e.type = ethernet.IP_TYPE
+      ip = ipv4(srcip=IPAddr("10.0.%i.%i" % (rand.randint(0,1),
+                                             rand.randint(0,2))),
+                dstip=IPAddr("10.0.0.%i" % (rand.randint(0, 2),)))
+      if rand.random() < 0.5:
+        ip.protocol = ipv4.TCP_PROTOCOL
+        ip.payload = tcp(srcport=1234, dstport=rand.choice([80, 443]))
+      else:
+        ip.protocol = ipv4.UDP_PROTOCOL
+        ip.payload = udp(srcport=1234, dstport=rand.choice([80, 443]))
+      e.payload = ip
+    else:
+      e.type = ethernet.ARP_TYPE
+      e.payload = arp(protosrc=IPAddr("10.0.0.1"), protodst=IPAddr("10.0.0.2"))
+    return ethernet(e.pack())
+
+  def test_index_matches_linear_scan(self):
+    """ indexed lookups return what a linear scan of the table would """
+    import random
+    rand = random.Random(42)
+    t = FlowTable()
+    for i in range(300):
+      t.add_entry(TableEntry(priority=rand.randint(1, 5), cookie=i,
+                             match=self._random_match(rand)))
+      if rand.random() < 0.2:
+        t.remove_entry(rand.choice(t.entries))
+      if rand.random() < 0.1:
+        t.remove_matching_entries(self._random_match(rand),
+                                  priority=rand.randint(1, 5),
+                                  strict=rand.random() < 0.5)
+
+      packet = self._random_packet(rand)
+      in_port = rand.randint(1, 3)
+      pm = ofp_match.from_packet(packet, in_port, spec_frags = True)
+      expected = None
+      for e in t.entries:
+        if e.match.matches_with_wildcards(pm, consider_other_wildcards=False):
+          expected = e
+          break
+      self.assertIs(t.entry_for_packet(packet, in_port), expected)
+
+      query = self._random_match(rand)
+      for strict in (False, True):
+        priority = rand.randint(1, 5)
+        expected = [e for e in t.entries
+                    if e.is_matched_by(query, priority, strict)]
+        self.assertEqual(t.matching_entries(query, priority, strict), expected)
+
+      for bucket in t._buckets.itervalues():
+        self.assertEqual(bucket.max_order,
+                         max(t._order[e] for es in bucket.entries.itervalues()
+                             for e in es))
+
+  def test_bucket_max_order(self):
+    """ a bucket's best entry is kept track of as entries are removed """
+    t = FlowTable()
+    entries = [TableEntry(priority=i % 7, cookie=i,
+                          match=ofp_match(dl_type=0x800, nw_proto=17,
+                                          tp_dst=i))
+               for i in range(100)]
+    for e in entries:
+      t.add_entry(e)
+    bucket, = t._buckets.values()
+    # Remove the best entries first, so max_order changes every time
+    while len(t.entries) > 1:
+      t.remove_entry(t.entries[0])
+      self.assertEqual(bucket.max_order, t._order[t.entries[0]])
+      self.assertTrue(len(bucket.heap) <= 2 * len(t.entries) + 1)
+    self.assertEqual(t.entry_for_match(t.entries[0].match), t.entries[0])
+
 
 
 
@@ -18,6 +18,8 @@
 import unittest
 import sys
 import os.path
+import random
+import struct
 from copy import copy
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
@@ -135,6 +137,104 @@ class ofp_match_test(unittest.TestCase):
     assertMatch(create(nw_src="10.0.0.0/25"), create(nw_src="10.0.0.127"))
     assertNoMatch(create(nw_src="10.0.0.0/25"), create(nw_src="10.0.0.128"))
 
+  def _raw_frames (self, rand, count):
+    """ Random frames of the kinds from_raw handles, many of them mangled """
+    from pox.lib.packet import ethernet, vlan, arp, ipv4, tcp, udp, icmp
+    from pox.lib.packet.icmp import TYPE_ECHO_REQUEST, echo
+    def rand_ip ():
+      return IPAddr(rand.randint(0, 0xffffffff))
+    def rand_eth ():
+      return EthAddr(struct.pack("!Q", rand.getrandbits(48))[2:])
+    for i in range(count):
+      kind = rand.choice(("arp", "tcp", "udp", "icmp", "ip", "other"))
+      if kind == "arp":
+        p = arp(opcode = rand.choice((1, 2, 3, 300)), hwsrc = rand_eth(),
+                hwdst = rand_eth(), protosrc = rand_ip(),
+                protodst = rand_ip())
+        t = rand.choice((ethernet.ARP_TYPE, ethernet.RARP_TYPE))
+      elif kind == "other":
+        p = "x" * rand.randint(0, 64)
+        t = rand.choice((ethernet.IPV6_TYPE, ethernet.LLDP_TYPE, 0x1234))
+      else:
+        payload = "y" * rand.randint(0, 40)
+        if kind == "tcp":
+          l4 = tcp(srcport = rand.randint(0, 0xffff),
+                   dstport = rand.randint(0, 0xffff), off = 5,
+                   payload = payload)
+          proto = ipv4.TCP_PROTOCOL
+        elif kind == "udp":
+          # Avoid ports with parsers of their own
+          l4 = udp(srcport = rand.randint(1024, 5000),
+                   dstport = rand.randint(1024, 5000), payload = payload)
+          proto = ipv4.UDP_PROTOCOL
+        elif kind == "icmp":
+          l4 = icmp(type = TYPE_ECHO_REQUEST, payload = echo(id = i))
+          proto = ipv4.ICMP_PROTOCOL
+        else:
+          l4 = payload
+          proto = rand.choice((2, 47, 89))
+        p = ipv4(srcip = rand_ip(), dstip = rand_ip(), protocol = proto,
+                 tos = rand.randint(0, 255), payload = l4)
+        if rand.random() < 0.3:
+          p.flags = rand.choice((0, ipv4.DF_FLAG, ipv4.MF_FLAG))
+          p.frag = rand.choice((0, 0, 185))
+        t = ethernet.IP_TYPE
+      if rand.random() < 0.3:
+        p = vlan(id = rand.randint(0, 4095), pcp = rand.randint(0, 7),
+                 eth_type = t, payload = p)
+        t = ethernet.VLAN_TYPE
+      if rand.random() < 0.1:
+        # 802.2 SNAP
+        p = struct.pack("!BBB3sH", 0xaa, 0xaa, 3, "\0\0\0", t) + (
+            p if isinstance(p, bytes) else p.pack())
+        t = len(p)
+      raw = ethernet(src = rand_eth(), dst = rand_eth(), type = t,
+                     payload = p).pack()
+      r = rand.random()
+      if r < 0.2:
+        raw = raw[:rand.randint(0, len(raw))]
+      elif r < 0.5:
+        # Mangle a few header bytes
+        raw = bytearray(raw)
+        for _ in range(rand.randint(1, 3)):
+          raw[rand.randint(12, min(len(raw), 60) - 1)] = rand.randint(0, 255)
+        raw = bytes(raw)
+      yield raw
+
+  def test_from_raw_same_as_from_packet (self):
+    """ from_raw() must give the same match as from_packet() """
+    from pox.lib.packet import ethernet
+    rand = random.Random(7)
+    checked = 0
+    for raw in self._raw_frames(rand, 3000):
+      for spec_frags in (False, True):
+        in_port = rand.choice((None, 1, 65000))
+        try:
+          slow = ofp_match.from_packet(ethernet(raw), in_port, spec_frags)
+        except Exception:
+          continue
+        fast = ofp_match.from_raw(raw, in_port, spec_frags)
+        self.assertEqual(slow, fast, "%r:\n%s\n!=\n%s" % (raw, slow, fast))
+        self.assertEqual(slow.pack(), fast.pack())
+        checked += 1
+    self.assertTrue(checked > 5000)
+
+  def test_from_raw_packet_in (self):
+    from pox.lib.packet import ethernet, ipv4, udp
+    ip = ipv4(srcip = IPAddr("10.0.0.1"), dstip = IPAddr("10.0.0.2"),
+              protocol = ipv4.UDP_PROTOCOL,
+              payload = udp(srcport = 1234, dstport = 4321))
+    raw = ethernet(src = EthAddr("00:00:00:00:00:01"),
+                   dst = EthAddr("00:00:00:00:00:02"),
+                   type = ethernet.IP_TYPE, payload = ip).pack()
+    pi = ofp_packet_in(in_port = 3, data = raw)
+    m = ofp_match.from_raw(pi)
+    self.assertEqual(m, ofp_match.from_packet(ethernet(raw), 3))
+    self.assertEqual(m, ofp_match.from_packet(pi))
+    self.assertEqual(m.in_port, 3)
+    self.assertEqual(m.tp_dst, 4321)
+    self.assertEqual(m.nw_src, IPAddr("10.0.0.1"))
+
 class ofp_command_test(unittest.TestCase):
   # custom map of POX class to header type, for validation
   ofp_type = {
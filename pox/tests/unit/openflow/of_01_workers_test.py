@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import select
+import socket
+import struct
+import cPickle as pickle
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import pox.core
+if pox.core.core is None:
+  pox.core.initialize(threaded_selecthub=False, handle_signals=False)
+from pox.core import core
+
+import pox.openflow.libopenflow_01 as of
+import pox.openflow.of_01 as of_01
+from pox.openflow import (OpenFlowNexus, OpenFlowConnectionArbiter,
+                          ConnectionUp, PacketIn)
+from pox.openflow.of_01_workers import (_parse_records, _record, _Worker,
+                                        _WorkerLink, OpenFlow_01_WorkerTask,
+                                        _CONNECT, _MESSAGES, _DISCONNECT,
+                                        _ERROR, _CLOSE, _DROP, _FILTER, _DATA)
+
+_ofp_header = struct.Struct("!BBHL")
+
+
+def _pack_record (kind, con_id, payload = b''):
+  return _record.pack(kind, con_id, len(payload)) + payload
+
+
+def _recv_all (sock, timeout = 0.1):
+  """ Receives what's readable on sock (waiting up to timeout for it) """
+  data = b''
+  while select.select([sock], [], [], timeout)[0]:
+    d = sock.recv(64 * 1024)
+    if not d: break
+    data += d
+    timeout = 0.01
+  return data
+
+
+def _messages (data):
+  """ (type, xid) of each OpenFlow message in data """
+  msgs = []
+  offset = 0
+  while offset < len(data):
+    version,ofp_type,length,xid = _ofp_header.unpack_from(data, offset)
+    msgs.append((ofp_type, xid))
+    offset += length
+  return msgs
+
+
+class ParseRecordsTest (unittest.TestCase):
+  def test_partial (self):
+    data = _pack_record(_DATA, 5, b'hello') + _pack_record(_DROP, 0, b'\x0a')
+    buf = bytearray(data[:-3])
+    self.assertEqual(list(_parse_records(buf)), [(_DATA, 5, b'hello')])
+    self.assertEqual(bytes(buf), data[len(_pack_record(_DATA, 5, b'hello')):
+                                      -3])
+    buf += data[-3:]
+    self.assertEqual(list(_parse_records(buf)), [(_DROP, 0, b'\x0a')])
+    self.assertEqual(len(buf), 0)
+
+
+class WorkerTest (unittest.TestCase):
+  """
+  Drives a worker's I/O by hand, with a switch and the controller end of
+  its socketpair
+  """
+  def setUp (self):
+    self.listener = socket.socket()
+    self.listener.bind(('127.0.0.1', 0))
+    self.listener.listen(5)
+    self.control,theirs = socket.socketpair()
+    self.worker = _Worker(3, self.listener, theirs)
+    self.switch = socket.create_connection(self.listener.getsockname())
+    select.select([self.listener], [], [], 1)
+    self.worker._accept()
+    self.sw = self.worker.by_id.values()[0]
+
+  def tearDown (self):
+    self.switch.close()
+    self.control.close()
+    self.worker.control.close()
+    self.listener.close()
+    self.worker.poller.close()
+
+  def records (self):
+    """
+    The records the worker sent, with messages as their packed forms
+    """
+    records = []
+    for kind,con_id,payload in _parse_records(
+        bytearray(_recv_all(self.control))):
+      if kind == _MESSAGES:
+        payload = [m.pack() for m in pickle.loads(payload)]
+      records.append((kind, con_id, payload))
+    return records
+
+  def from_switch (self, data):
+    self.switch.sendall(data)
+    select.select([self.sw.sock], [], [], 1)
+    self.worker._read(self.sw)
+
+  def from_controller (self, *records):
+    self.control.sendall(b''.join(_pack_record(*r) for r in records))
+    select.select([self.worker.control], [], [], 1)
+    self.worker._read_control()
+
+  def test_connect (self):
+    peer = "%s:%s" % self.switch.getsockname()
+    self.assertEqual(self.records(), [(_CONNECT, 1 << 8 | 3, peer)])
+
+  def test_echo_answered (self):
+    self.records()
+    self.from_switch(of.ofp_echo_request(xid = 5).pack())
+    self.assertEqual(_messages(_recv_all(self.switch)),
+                     [(of.OFPT_ECHO_REPLY, 5)])
+    self.assertEqual(self.records(), [])
+
+  def test_framing (self):
+    self.records()
+    hello = of.ofp_hello(xid = 1).pack()
+    pi = of.ofp_packet_in(xid = 2, data = b'x' * 60).pack()
+    self.from_switch(hello + pi[:20])
+    self.assertEqual(self.records(), [(_MESSAGES, self.sw.id, [hello])])
+    self.from_switch(pi[20:] + hello)
+    self.assertEqual(self.records(), [(_MESSAGES, self.sw.id, [pi, hello])])
+
+  def test_decoded (self):
+    self.records()
+    self.from_switch(of.ofp_features_reply(xid = 4, datapath_id = 9).pack())
+    (kind,con_id,payload), = _parse_records(
+        bytearray(_recv_all(self.control)))
+    msg, = pickle.loads(payload)
+    self.assertTrue(isinstance(msg, of.ofp_features_reply))
+    self.assertEqual((msg.xid, msg.datapath_id), (4, 9))
+
+  def test_bad_message (self):
+    self.records()
+    hello = of.ofp_hello(xid = 1).pack()
+    bad = of.ofp_hello(xid = 2).pack()
+    bad = bad[:2] + b'\x00\x04' + bad[4:]
+    self.from_switch(hello + bad)
+    self.assertEqual(self.records(),
+                     [(_MESSAGES, self.sw.id, [hello]),
+                      (_DISCONNECT, self.sw.id,
+                       "Bad OpenFlow message length (4)")])
+    self.assertEqual(_recv_all(self.switch), b'')
+
+  def test_report (self):
+    self.records()
+    self.worker.report("Traceback: oops")
+    self.assertEqual(self.records(), [(_ERROR, 0, "Traceback: oops")])
+
+  def test_to_switch (self):
+    msg = of.ofp_barrier_request(xid = 7).pack()
+    self.from_controller((_DATA, self.sw.id, msg))
+    self.assertEqual(_recv_all(self.switch), msg)
+
+  def test_close (self):
+    self.records()
+    self.from_controller((_CLOSE, self.sw.id))
+    self.assertEqual(_recv_all(self.switch), b'')
+    self.assertEqual(self.worker.by_id, {})
+    self.assertEqual(self.records(), [])
+
+  def test_disconnect (self):
+    self.records()
+    self.switch.close()
+    select.select([self.sw.sock], [], [], 1)
+    self.worker._read(self.sw)
+    self.assertEqual(self.records(), [(_DISCONNECT, self.sw.id, b'')])
+
+  def test_drop_once_filtering (self):
+    self.records()
+    pi = of.ofp_packet_in(xid = 2, data = b'x' * 60).pack()
+    fr = of.ofp_flow_removed(xid = 3).pack()
+    self.from_controller((_DROP, 0, bytes(bytearray([of.OFPT_PACKET_IN]))))
+    # Not dropped until the controller says the switch is up
+    self.from_switch(pi)
+    self.assertEqual(self.records(), [(_MESSAGES, self.sw.id, [pi])])
+    self.from_controller((_FILTER, self.sw.id))
+    self.from_switch(pi + fr + pi)
+    self.assertEqual(self.records(), [(_MESSAGES, self.sw.id, [fr])])
+
+
+class NoDeferredSender (object):
+  """
+  Stands in for of_01's DeferredSender (sends to workers never block)
+  """
+  sending = False
+
+
+class WorkerLinkTest (unittest.TestCase):
+  """
+  Connects a switch through a worker to Connections in the controller
+  """
+  def setUp (self):
+    self.deferredSender = of_01.deferredSender
+    of_01.deferredSender = NoDeferredSender()
+    self.nexus = OpenFlowNexus()
+    self.nexus.clear_flows_on_connect = False
+    core.register('OpenFlowConnectionArbiter',
+                  OpenFlowConnectionArbiter(default = self.nexus))
+    self.listener = socket.socket()
+    self.listener.bind(('127.0.0.1', 0))
+    self.listener.listen(5)
+    mine,theirs = socket.socketpair()
+    self.worker = _Worker(0, self.listener, theirs)
+    self.task = OpenFlow_01_WorkerTask(workers = 1)
+    self.link = _WorkerLink(self.task, 0, mine, None)
+    self.task.links.append(self.link)
+    self.packet_ins = []
+
+  def tearDown (self):
+    self.link.close()
+    self.worker.control.close()
+    self.listener.close()
+    self.worker.poller.close()
+    del core.components['OpenFlowConnectionArbiter']
+    of_01.deferredSender = self.deferredSender
+
+  def to_controller (self):
+    """ Passes the worker's records on to the link """
+    while select.select([self.link], [], [], 0.1)[0]:
+      self.link.read()
+
+  def to_worker (self):
+    """ Passes the link's records on to the worker """
+    while select.select([self.worker.control], [], [], 0.1)[0]:
+      self.worker._read_control()
+
+  def from_switch (self, data):
+    self.switch.sendall(data)
+    select.select([self.sw.sock], [], [], 1)
+    self.worker._read(self.sw)
+    self.to_controller()
+    self.to_worker()
+
+  def connect (self):
+    """
+    Connects a switch and does the handshake, returning its Connection
+    """
+    self.switch = socket.create_connection(self.listener.getsockname())
+    select.select([self.listener], [], [], 1)
+    self.worker._accept()
+    self.sw = self.worker.by_id.values()[0]
+    self.to_controller()
+    con = self.link.connections[self.sw.id]
+    self.to_worker()
+    self.from_switch(of.ofp_hello().pack() +
+                     of.ofp_features_reply(datapath_id = 1).pack())
+    sent = _messages(_recv_all(self.switch))
+    self.assertIn(of.OFPT_HELLO, [t for t,xid in sent])
+    barrier = [xid for t,xid in sent if t == of.OFPT_BARRIER_REQUEST]
+    self.assertEqual(len(barrier), 1)
+    self.assertIs(con.connect_time, None)
+    self.from_switch(of.ofp_barrier_reply(xid = barrier[0]).pack())
+    self.assertIsNot(con.connect_time, None)
+    return con
+
+  def _handle_PacketIn (self, event):
+    self.packet_ins.append(event)
+
+  def test_nothing_listening (self):
+    self.connect()
+    self.assertTrue(self.sw.filtering)
+    self.assertEqual(self.worker.drop_types,
+                     set([of.OFPT_PACKET_IN, of.OFPT_FLOW_REMOVED]))
+    self.switch.sendall(of.ofp_packet_in(data = b'x' * 60).pack())
+    select.select([self.sw.sock], [], [], 1)
+    self.worker._read(self.sw)
+    self.assertEqual(_recv_all(self.link.sock), b'')
+
+  def test_listener_added_on_connection_up (self):
+    # Like l2_learning, listen to each connection once it's up
+    def up (event):
+      event.connection.addListener(PacketIn, self._handle_PacketIn)
+    self.nexus.addListener(ConnectionUp, up)
+    self.task.update_drop_types()
+    self.to_worker()
+    self.assertIn(of.OFPT_PACKET_IN, self.worker.drop_types)
+    con = self.connect()
+    self.assertTrue(self.sw.filtering)
+    self.assertEqual(self.worker.drop_types, set([of.OFPT_FLOW_REMOVED]))
+    self.from_switch(of.ofp_packet_in(data = b'x' * 60).pack())
+    self.assertEqual(len(self.packet_ins), 1)
+    self.assertIs(self.packet_ins[0].connection, con)
+
+  def test_failed_record_not_replayed (self):
+    con = self.connect()
+    failed = []
+    def fail (msgs):
+      failed.append(msgs)
+      raise RuntimeError("handling failed")
+    con.handle_messages = fail
+    pi = pickle.dumps([of.ofp_packet_in(data = b'x' * 60)])
+    self.worker.control.sendall(_pack_record(_MESSAGES, self.sw.id, pi) +
+                                _pack_record(_CONNECT, 98, "1.2.3.4:5"))
+    self.to_controller()
+    self.worker.control.sendall(_pack_record(_CONNECT, 99, "1.2.3.4:6"))
+    self.to_controller()
+    self.assertEqual(len(failed), 1)
+    self.assertEqual(sorted(self.link.connections),
+                     sorted([self.sw.id, 98, 99]))
+
+  def test_listener_added_later (self):
+    con = self.connect()
+    self.assertIn(of.OFPT_PACKET_IN, self.worker.drop_types)
+    con.addListener(PacketIn, self._handle_PacketIn)
+    self.task.update_drop_types()
+    self.to_worker()
+    self.assertEqual(self.worker.drop_types, set([of.OFPT_FLOW_REMOVED]))
+    self.from_switch(of.ofp_packet_in(data = b'x' * 60).pack())
+    self.assertEqual(len(self.packet_ins), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,650 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+cbench-style controller benchmark
+
+For each scenario, starts a POX with the scenario's components, connects a
+line of emulated switches to it, and measures how fast it handles
+PacketIns in two modes (as oflops' cbench does):
+  throughput - every switch keeps up to --window PacketIns outstanding
+  latency    - every switch has one PacketIn outstanding at a time
+Replies (packet_outs and flow_mods) are matched to PacketIns by buffer ID,
+or in order for controllers which don't use them.  Each mode runs --loops
+times for --duration seconds after --warmup, and the results (replies per
+second, latency percentiles and the controller's CPU use) are printed and,
+with --json, written out.  Between modes, the controller gets up to
+--settle seconds to work through what it still has queued.
+
+The switches are emulated here with plain sockets, so nothing else (like
+oflops) is needed.  Port 2 of switch n is linked to port 1 of switch n+1:
+LLDP sent out of those ports comes back in at the other end, so discovery
+finds the links.  Hosts are on ports 3 and up.
+
+Scenarios:
+  cbench            misc.cbench (a flow_mod for every PacketIn)
+  l2_learning       forwarding.l2_learning
+  l2_multi          openflow.discovery forwarding.l2_multi, with a window
+                    of at most 8 (the emulated switches don't install the
+                    paths, so every PacketIn sets one up again; with more
+                    queued, paths take longer than l2_multi's setup time and
+                    fail, and throughput collapses)
+  discovery         openflow.discovery, with LLDP PacketIns
+  traffic_steering  our_controller's traffic_steering installing routes
+                    (driven by ts_cbench rather than PacketIns)
+"""
+
+import sys
+import os
+import os.path
+import errno
+import json
+import random
+import select
+import socket
+import struct
+import subprocess
+import tempfile
+import time
+import argparse
+from collections import deque
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+POX_DIR = os.path.join(TOOLS_DIR, "..")
+OUR_CONTROLLER_DIR = os.path.join(POX_DIR, "..", "our_controller")
+
+sys.path.insert(0, POX_DIR)
+
+import pox.core
+if pox.core.core is None:
+  pox.core.initialize(threaded_selecthub=False, handle_signals=False)
+
+import pox.openflow.libopenflow_01 as of
+import pox.lib.packet as pkt
+from pox.lib.addresses import EthAddr, IPAddr
+from pox.openflow.discovery import LLDPSender
+
+
+# name -> (POX components, kind of PacketIns, warmup before measuring,
+#          largest throughput window or None)
+SCENARIOS = {
+  'cbench' : (['misc.cbench'], 'ip', 0, None),
+  'l2_learning' : (['forwarding.l2_learning'], 'ip', 0, None),
+  'l2_multi' : (['openflow.discovery', 'forwarding.l2_multi'], 'ip', 6, 8),
+  'discovery' : (['openflow.discovery'], 'lldp', 0, None),
+  'traffic_steering' : (['traffic_steering', 'ts_cbench'], None, 0, None),
+}
+SCENARIO_ORDER = ['cbench', 'l2_learning', 'l2_multi', 'discovery',
+                  'traffic_steering']
+
+NO_BUFFER = 0xffffffff
+
+_header = struct.Struct("!BBHL")
+_packet_in = struct.Struct("!BBHLLHHBx")
+_buffer_id = struct.Struct("!L")
+_action_header = struct.Struct("!HH")
+_port = struct.Struct("!H")
+
+# Offset of buffer_id in a flow_mod (after the header, match, cookie,
+# command, timeouts and priority)
+_FLOW_MOD_BUFFER_ID = 8 + 40 + 8 + 2 + 2 + 2 + 2
+
+_LLDP_TYPE = struct.pack("!H", pkt.ethernet.LLDP_TYPE)
+
+# TCP_QUICKACK (Linux only)
+_QUICKACK = getattr(socket, 'TCP_QUICKACK', None)
+
+
+def port_addr (dpid, port_no):
+  return b"\x02" + struct.pack("!LB", dpid, port_no)
+
+
+def host_addr (dpid, host):
+  return b"\x00\x00" + struct.pack("!HH", dpid, host)
+
+
+class Switch (object):
+  """
+  An emulated switch
+
+  It does just enough OpenFlow to get connected, answers barriers and
+  echoes, and sends PacketIns on request.
+  """
+  def __init__ (self, bench, dpid, sock):
+    self.bench = bench
+    self.dpid = dpid
+    self.sock = sock
+    self.ports = range(1, 3 + bench.host_ports)
+    self.frames = []      # (in_port, frame) to send PacketIns for
+    self._next_frame = 0
+    self._next_buffer_id = 0
+    self.outstanding = {} # buffer_id -> time sent
+    self.order = deque()  # (time sent, buffer_id)
+    self.has_features = False
+    self.connected = False
+    self.echoed = None    # xid of the last echo reply
+    self._in = b''
+    self._out = []
+    self.send(_header.pack(of.OFP_VERSION, of.OFPT_HELLO, 8, 0))
+
+  def fileno (self):
+    return self.sock.fileno()
+
+  def send (self, data):
+    self._out.append(data)
+
+  @property
+  def sending (self):
+    return bool(self._out)
+
+  def flush (self):
+    if not self._out: return
+    data = b''.join(self._out)
+    try:
+      n = self.sock.send(data)
+    except socket.error as e:
+      if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK): raise
+      n = 0
+    self._out = [data[n:]] if n < len(data) else []
+
+  def send_packet_in (self, in_port, frame, now = None):
+    """
+    Sends a PacketIn (which is tracked if now is given)
+    """
+    if now is None:
+      buffer_id = NO_BUFFER
+    else:
+      buffer_id = self._next_buffer_id
+      self._next_buffer_id = (buffer_id + 1) & 0x7fffFFff
+      self.outstanding[buffer_id] = now
+      self.order.append((now, buffer_id))
+    self.send(_packet_in.pack(of.OFP_VERSION, of.OFPT_PACKET_IN,
+                              _packet_in.size + len(frame), 0, buffer_id,
+                              len(frame), in_port, of.OFPR_NO_MATCH))
+    self.send(frame)
+
+  def fill (self, now, window):
+    """
+    Sends PacketIns until window of them are outstanding
+    """
+    frames = self.frames
+    i = self._next_frame
+    while len(self.outstanding) < window:
+      in_port,frame = frames[i]
+      i = (i + 1) % len(frames)
+      self.send_packet_in(in_port, frame, now)
+    self._next_frame = i
+
+  def expire (self, now, timeout):
+    order = self.order
+    while order and order[0][0] < now - timeout:
+      _,buffer_id = order.popleft()
+      if self.outstanding.pop(buffer_id, None) is not None:
+        self.bench.lost += 1
+
+  def _reply (self, buffer_id):
+    if buffer_id == NO_BUFFER:
+      if not self.bench.in_order: return
+      # Take it as the reply to the oldest PacketIn
+      while self.order:
+        _,buffer_id = self.order.popleft()
+        if buffer_id in self.outstanding: break
+      else:
+        return
+    sent = self.outstanding.pop(buffer_id, None)
+    if sent is not None:
+      self.bench.replied(time.time() - sent)
+
+  def read (self):
+    try:
+      data = self.sock.recv(1 << 16)
+    except socket.error as e:
+      if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK): return
+      raise
+    if _QUICKACK is not None:
+      # ACK right away, like a real switch would, rather than delaying the
+      # ACK (which stalls a controller's next small write for ~40 ms when
+      # it doesn't set TCP_NODELAY).  Linux turns this off again by itself.
+      self.sock.setsockopt(socket.IPPROTO_TCP, _QUICKACK, 1)
+    if not data:
+      raise RuntimeError("Controller closed connection to %i" % (self.dpid,))
+    buf = self._in + data if self._in else data
+    offset = 0
+    while len(buf) - offset >= 8:
+      version,type,length,xid = _header.unpack_from(buf, offset)
+      if len(buf) - offset < length: break
+      self._handle(type, xid, buf[offset:offset+length])
+      offset += length
+    self._in = buf[offset:]
+
+  def _handle (self, type, xid, msg):
+    if type == of.OFPT_PACKET_OUT:
+      self.bench.packet_outs += 1
+      self._reply(_buffer_id.unpack_from(msg, 8)[0])
+      if self.bench.links: self._loop_lldp(msg)
+    elif type == of.OFPT_FLOW_MOD:
+      self.bench.flow_mods += 1
+      self._reply(_buffer_id.unpack_from(msg, _FLOW_MOD_BUFFER_ID)[0])
+    elif type == of.OFPT_BARRIER_REQUEST:
+      self.send(_header.pack(of.OFP_VERSION, of.OFPT_BARRIER_REPLY, 8, xid))
+      # POX finishes connecting with a barrier after the features
+      if self.has_features: self.connected = True
+    elif type == of.OFPT_ECHO_REQUEST:
+      self.send(_header.pack(of.OFP_VERSION, of.OFPT_ECHO_REPLY, len(msg),
+                             xid) + msg[8:])
+    elif type == of.OFPT_ECHO_REPLY:
+      self.echoed = xid
+    elif type == of.OFPT_FEATURES_REQUEST:
+      ports = [of.ofp_phy_port(port_no = p,
+                               hw_addr = EthAddr(port_addr(self.dpid, p)),
+                               name = "s%i-eth%i" % (self.dpid, p))
+               for p in self.ports]
+      self.send(of.ofp_features_reply(xid = xid, datapath_id = self.dpid,
+                                      n_buffers = 1 << 16, n_tables = 1,
+                                      capabilities = 0, actions = 0xfff,
+                                      ports = ports).pack())
+      self.has_features = True
+    elif type == of.OFPT_GET_CONFIG_REQUEST:
+      self.send(of.ofp_get_config_reply(xid = xid).pack())
+
+  def _loop_lldp (self, msg):
+    """
+    Delivers LLDP sent out of a linked port to the switch at the other end
+    """
+    actions_len = _port.unpack_from(msg, 14)[0]
+    data = msg[16 + actions_len:]
+    if data[12:14] != _LLDP_TYPE: return
+    src = data[6:12]
+    offset = 16
+    while offset < 16 + actions_len:
+      type,length = _action_header.unpack_from(msg, offset)
+      if length < 8: break
+      if type == of.OFPAT_SET_DL_SRC:
+        src = msg[offset+4:offset+10]
+      elif type == of.OFPAT_OUTPUT:
+        port_no = _port.unpack_from(msg, offset + 4)[0]
+        peer = self.bench.links.get((self.dpid, port_no))
+        if peer is not None:
+          sw,peer_port = peer
+          sw.send_packet_in(peer_port, data[:6] + src + data[12:])
+      offset += length
+
+
+class Bench (object):
+  def __init__ (self, args, kind):
+    self.args = args
+    self.kind = kind
+    self.host_ports = args.ports
+    self.in_order = False
+    self.switches = []
+    self.links = {} # (dpid, port_no) -> (Switch, port_no)
+    self._echo_xid = 0
+    self.reset()
+
+  def reset (self):
+    self.latencies = []
+    self.replies = 0
+    self.lost = 0
+    self.flow_mods = 0
+    self.packet_outs = 0
+
+  def replied (self, latency):
+    self.replies += 1
+    self.latencies.append(latency)
+
+  def connect (self, address, port, timeout = 30):
+    """
+    Connects the switches and waits for them to be set up
+    """
+    deadline = time.time() + timeout
+    for dpid in range(1, self.args.switches + 1):
+      while True:
+        try:
+          sock = socket.create_connection((address, port))
+          break
+        except socket.error:
+          if time.time() > deadline: raise
+          time.sleep(0.1)
+      sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+      sock.setblocking(0)
+      self.switches.append(Switch(self, dpid, sock))
+
+    sws = self.switches
+    for a,b in zip(sws, sws[1:]):
+      self.links[(a.dpid, 2)] = (b, 1)
+      self.links[(b.dpid, 1)] = (a, 2)
+
+    while not all(sw.connected for sw in self.switches):
+      if time.time() > deadline:
+        raise RuntimeError("Switches didn't all connect")
+      self.poll(0.05)
+
+  def make_frames (self, rand):
+    macs = self.args.macs
+    for sw in self.switches:
+      if self.kind == 'lldp':
+        sw.frames = self._lldp_frames(sw)
+      else:
+        sw.frames = [self._ip_frame(sw, h, rand) for h in range(macs)]
+      rand.shuffle(sw.frames)
+
+  def _ip_frame (self, sw, host, rand):
+    """
+    A UDP packet from host on sw to some host on another switch
+    """
+    others = [s for s in self.switches if s is not sw] or [sw]
+    dst = rand.choice(others)
+    dst_host = rand.randrange(self.args.macs)
+    in_port = 3 + host % self.host_ports
+    ip = pkt.ipv4(srcip = IPAddr((10 << 24) | (sw.dpid << 12) | host),
+                  dstip = IPAddr((10 << 24) | (dst.dpid << 12) | dst_host),
+                  protocol = pkt.ipv4.UDP_PROTOCOL,
+                  payload = pkt.udp(srcport = 1024 + host, dstport = 5001,
+                                    payload = b"\x00" * 18))
+    e = pkt.ethernet(src = EthAddr(host_addr(sw.dpid, host)),
+                     dst = EthAddr(host_addr(dst.dpid, dst_host)),
+                     type = pkt.ethernet.IP_TYPE, payload = ip)
+    return in_port, e.pack()
+
+  def _lldp_frames (self, sw):
+    """
+    Discovery's LLDP, as sent by the switches linked to sw
+    """
+    frames = []
+    for (dpid,port_no),(peer,peer_port) in self.links.items():
+      if peer is not sw: continue
+      e = LLDPSender._create_discovery_packet(
+          dpid, port_no, EthAddr(port_addr(dpid, port_no)), 120)
+      frames.append((peer_port, e.pack()))
+    return frames
+
+  def poll (self, timeout):
+    sws = self.switches
+    r,w,_ = select.select(sws, [sw for sw in sws if sw.sending], [], timeout)
+    for sw in w:
+      sw.flush()
+    for sw in r:
+      sw.read()
+
+  def run (self, seconds, window):
+    """
+    Keeps window PacketIns outstanding on each switch for a while
+    """
+    end = time.time() + seconds
+    timeout = self.args.timeout
+    while True:
+      now = time.time()
+      if now >= end: break
+      for sw in self.switches:
+        sw.expire(now, timeout)
+        if window and sw.frames: sw.fill(now, window)
+      self.poll(min(0.01, end - now))
+
+  def drain (self):
+    """
+    Waits for outstanding PacketIns to be answered (or time out)
+    """
+    end = time.time() + self.args.timeout
+    while time.time() < end:
+      if not any(sw.outstanding for sw in self.switches): break
+      self.poll(0.01)
+    for sw in self.switches:
+      sw.outstanding.clear()
+      sw.order.clear()
+    self.settle()
+
+  def settle (self):
+    """
+    Waits for the controller to catch up with everything sent to it
+
+    The controller answers an echo after the messages before it on the same
+    connection, so once every switch has its reply, the PacketIns (and the
+    LLDP) it was still working through are done with, and don't eat into
+    the next run.
+    """
+    self._echo_xid += 1
+    xid = self._echo_xid
+    for sw in self.switches:
+      sw.send(_header.pack(of.OFP_VERSION, of.OFPT_ECHO_REQUEST, 8, xid))
+    end = time.time() + self.args.settle
+    while time.time() < end:
+      if all(sw.echoed == xid for sw in self.switches): return
+      self.poll(0.01)
+    raise RuntimeError("Controller didn't catch up in %s seconds"
+                       % (self.args.settle,))
+
+  def close (self):
+    for sw in self.switches:
+      sw.sock.close()
+
+
+def percentile (ordered, p):
+  if not ordered: return None
+  return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]
+
+
+class CPUClock (object):
+  """
+  CPU time used by a process (from /proc, so only on Linux)
+  """
+  def __init__ (self, pid):
+    self.pid = pid
+    self.ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+  def __call__ (self):
+    if self.pid is None: return None
+    try:
+      with open("/proc/%i/stat" % (self.pid,)) as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    except (IOError, OSError):
+      return None
+    # utime and stime are fields 14 and 15 (counting the pid as 1)
+    return (int(fields[11]) + int(fields[12])) / float(self.ticks)
+
+
+def measure (bench, mode, args, cpu, max_window = None):
+  """
+  Runs one mode, and returns its results
+  """
+  window = args.window if mode == 'throughput' else 1
+  if max_window: window = min(window, max_window)
+  bench.run(args.warmup, window)
+  loops = []
+  for _ in range(args.loops):
+    bench.reset()
+    cpu_start = cpu()
+    start = time.time()
+    bench.run(args.duration, window)
+    elapsed = time.time() - start
+    cpu_end = cpu()
+    lat = sorted(bench.latencies)
+    loops.append({
+      'replies' : bench.replies,
+      'lost' : bench.lost,
+      'msgs_per_second' : bench.replies / elapsed,
+      'flow_mods_per_second' : bench.flow_mods / elapsed,
+      'packet_outs_per_second' : bench.packet_outs / elapsed,
+      'p50_ms' : percentile(lat, 50) and percentile(lat, 50) * 1000,
+      'p99_ms' : percentile(lat, 99) and percentile(lat, 99) * 1000,
+      'cpu_percent' : (None if cpu_start is None or cpu_end is None
+                       else 100.0 * (cpu_end - cpu_start) / elapsed),
+    })
+  bench.drain()
+
+  def avg (k):
+    values = [l[k] for l in loops if l[k] is not None]
+    return sum(values) / len(values) if values else None
+  r = dict((k, avg(k)) for k in loops[0])
+  r['msgs_per_second_min'] = min(l['msgs_per_second'] for l in loops)
+  r['msgs_per_second_max'] = max(l['msgs_per_second'] for l in loops)
+  r['loops'] = loops
+  return r
+
+
+def start_controller (components, args, port, extra = ()):
+  env = dict(os.environ)
+  env['PYTHONPATH'] = os.pathsep.join(filter(None, [OUR_CONTROLLER_DIR,
+                                                    env.get('PYTHONPATH')]))
+  cmd = [sys.executable, os.path.join(POX_DIR, "pox.py"), "log.level",
+         "--" + args.log_level, "openflow.of_01", "--port=%i" % (port,)]
+  cmd += args.pox_args.split() + components + list(extra)
+  log = open(os.devnull, "w") if not args.verbose else None
+  return subprocess.Popen(cmd, cwd = POX_DIR, env = env, stdout = log,
+                          stderr = subprocess.STDOUT if log else None)
+
+
+def stop_controller (proc):
+  if proc is None or proc.poll() is not None: return
+  proc.terminate()
+  for _ in range(50):
+    if proc.poll() is not None: return
+    time.sleep(0.1)
+  proc.kill()
+  proc.wait()
+
+
+def run_packet_in_scenario (name, args, port):
+  components,kind,warmup,max_window = SCENARIOS[name]
+  proc = None
+  if args.controller:
+    address,port = args.controller.rsplit(":", 1)
+    port = int(port)
+  else:
+    address = "127.0.0.1"
+    proc = start_controller(components, args, port)
+  cpu = CPUClock(proc.pid if proc else None)
+  bench = Bench(args, kind)
+  try:
+    bench.connect(address, port)
+    bench.make_frames(random.Random(args.seed))
+    # Give the controller time to find the topology, etc.
+    if warmup: bench.run(warmup, 0)
+    bench.in_order = name == 'cbench'
+    return dict((mode, measure(bench, mode, args, cpu, max_window))
+                for mode in args.modes)
+  finally:
+    bench.close()
+    stop_controller(proc)
+
+
+def run_traffic_steering (args, port):
+  components,kind,warmup,max_window = SCENARIOS['traffic_steering']
+  fd,out = tempfile.mkstemp(suffix = ".json")
+  os.close(fd)
+  os.unlink(out)
+  extra = ["--switches=%i" % (args.switches,), "--ports=%i" % (args.ports,),
+           "--routes=%i" % (args.routes,), "--window=%i" % (args.window,),
+           "--out=" + out]
+  proc = start_controller(components[:1] + components[1:] + extra, args,
+                          port)
+  bench = Bench(args, kind)
+  try:
+    bench.connect("127.0.0.1", port)
+    deadline = time.time() + args.ts_timeout
+    while not os.path.exists(out):
+      if time.time() > deadline or proc.poll() is not None:
+        raise RuntimeError("traffic_steering benchmark didn't finish")
+      bench.poll(0.01)
+    with open(out) as f:
+      results = json.load(f)
+    os.unlink(out)
+    for r in results.values():
+      r['msgs_per_second'] = r['flow_mods_per_second']
+    return dict((m, results[m]) for m in args.modes if m in results)
+  finally:
+    bench.close()
+    stop_controller(proc)
+
+
+def fmt (v, f = "%.2f"):
+  return "-" if v is None else f % (v,)
+
+
+def main ():
+  parser = argparse.ArgumentParser(description = __doc__.split("\n")[1],
+      formatter_class = argparse.RawDescriptionHelpFormatter,
+      epilog = __doc__.split("\n", 2)[2])
+  parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                      help="Scenarios to run (default: all)")
+  parser.add_argument('--switches', type=int, default=16)
+  parser.add_argument('--ports', type=int, default=4,
+                      help="Host ports per switch")
+  parser.add_argument('--macs', type=int, default=64,
+                      help="Hosts per switch (sources of PacketIns)")
+  parser.add_argument('--modes', default="throughput,latency")
+  parser.add_argument('--window', type=int, default=64,
+                      help="Outstanding PacketIns per switch (throughput)")
+  parser.add_argument('--duration', type=float, default=3,
+                      help="Seconds per loop")
+  parser.add_argument('--loops', type=int, default=3)
+  parser.add_argument('--warmup', type=float, default=1)
+  parser.add_argument('--settle', type=float, default=60,
+                      help="Longest to wait for the controller to catch up "
+                           "between modes")
+  parser.add_argument('--timeout', type=float, default=2,
+                      help="Seconds before a PacketIn counts as lost")
+  parser.add_argument('--routes', type=int, default=1000,
+                      help="Routes to install (traffic_steering)")
+  parser.add_argument('--ts-timeout', type=float, default=120)
+  parser.add_argument('--port', type=int, default=6634,
+                      help="Port for the controllers started here")
+  parser.add_argument('--controller', metavar="ADDRESS:PORT",
+                      help="Benchmark a running controller instead")
+  parser.add_argument('--pox-args', default="",
+                      help="More options for the controllers started here")
+  parser.add_argument('--log-level', default="WARNING")
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--json', help="Write the results here")
+  parser.add_argument('--verbose', action='store_true',
+                      help="Show the controllers' output")
+  args = parser.parse_args()
+  args.modes = [m for m in args.modes.split(",") if m]
+
+  scenarios = args.scenarios or SCENARIO_ORDER
+  for name in scenarios:
+    if name not in SCENARIOS:
+      parser.error("Unknown scenario: %s" % (name,))
+  if args.controller and 'traffic_steering' in scenarios:
+    parser.error("traffic_steering needs a controller started here")
+
+  results = {
+    'switches' : args.switches,
+    'window' : args.window,
+    'duration' : args.duration,
+    'loops' : args.loops,
+    'scenarios' : {},
+  }
+  print "%-17s %-10s %12s %9s %9s %7s" % ("scenario", "mode", "msgs/s",
+                                          "p50 ms", "p99 ms", "cpu %")
+  for name in scenarios:
+    if name == 'traffic_steering':
+      r = run_traffic_steering(args, args.port)
+    else:
+      r = run_packet_in_scenario(name, args, args.port)
+    results['scenarios'][name] = r
+    for mode in args.modes:
+      m = r.get(mode)
+      if m is None: continue
+      print "%-17s %-10s %12s %9s %9s %7s" % (name, mode,
+          fmt(m['msgs_per_second'], "%.0f"), fmt(m['p50_ms']),
+          fmt(m['p99_ms']), fmt(m['cpu_percent'], "%.0f"))
+    sys.stdout.flush()
+
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump(results, f, indent = 2, sort_keys = True)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark l2_multi's path cache under link up/down storms
+
+Generates a topology, then replays a storm of random link flaps.  After
+every link event, a number of random paths are requested (as PacketIns
+would do).  The incremental path cache is compared with throwing all path
+state away on every event, and (for small topologies) with the
+Floyd-Warshall recomputation l2_multi used to do.
+"""
+
+import sys
+import os.path
+import random
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+import pox.core
+if pox.core.core is None:
+  pox.core.initialize(threaded_selecthub=False, handle_signals=False)
+
+import pox.forwarding.l2_multi as l2m
+from collections import defaultdict
+
+
+class FakeSwitch (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+  def __repr__ (self):
+    return "s%i" % (self.dpid,)
+
+
+def make_topology (kind, n, degree, rand):
+  """
+  Returns (switches, links) where links is a list of switch pairs
+  """
+  sws = [FakeSwitch(i) for i in range(n)]
+  links = set()
+  if kind == 'ring':
+    for i in range(n):
+      links.add((sws[i], sws[(i+1) % n]))
+  elif kind == 'tree':
+    for i in range(1, n):
+      links.add((sws[(i-1) // degree], sws[i]))
+  else:
+    # Random graph, made connected with a spanning line
+    for i in range(1, n):
+      links.add((sws[rand.randrange(i)], sws[i]))
+    while len(links) < n * degree // 2:
+      a,b = rand.sample(sws, 2)
+      if (b,a) not in links: links.add((a,b))
+  return sws, sorted(links, key=lambda l: (l[0].dpid, l[1].dpid))
+
+
+def make_storm (links, events, rand):
+  """
+  Returns a list of (sw1, sw2, up) events which flap links
+  """
+  down = []
+  storm = []
+  for _ in range(events):
+    if down and (rand.random() < 0.5 or len(down) > len(links) // 10):
+      a,b = down.pop(rand.randrange(len(down)))
+      storm.append((a, b, True))
+    else:
+      a,b = rand.choice(links)
+      if (a,b) in down: continue
+      down.append((a,b))
+      storm.append((a, b, False))
+  return storm
+
+
+class FloydWarshall (object):
+  """
+  The all-pairs recomputation l2_multi used to do on every link event
+  """
+  def __init__ (self, sws):
+    self.sws = sws
+    self.path_map = None
+
+  def clear (self):
+    self.path_map = None
+
+  def _calc_paths (self):
+    sws = self.sws
+    path_map = defaultdict(lambda:defaultdict(lambda:(None,None)))
+    for k in sws:
+      for j,port in l2m.adjacency[k].iteritems():
+        if port is None: continue
+        path_map[k][j] = (1,None)
+      path_map[k][k] = (0,None)
+    for k in sws:
+      for i in sws:
+        for j in sws:
+          if path_map[i][k][0] is not None:
+            if path_map[k][j][0] is not None:
+              ikj_dist = path_map[i][k][0]+path_map[k][j][0]
+              if path_map[i][j][0] is None or ikj_dist < path_map[i][j][0]:
+                path_map[i][j] = (ikj_dist, k)
+    self.path_map = path_map
+
+  def get_raw_path (self, src, dst):
+    if self.path_map is None: self._calc_paths()
+    path_map = self.path_map
+    if src is dst: return []
+    if path_map[src][dst][0] is None: return None
+    intermediate = path_map[src][dst][1]
+    if intermediate is None: return []
+    return (self.get_raw_path(src, intermediate) + [intermediate] +
+            self.get_raw_path(intermediate, dst))
+
+  def link_up (self, sw1, sw2):
+    self.clear()
+
+  def link_down (self, sw1, sw2):
+    self.clear()
+
+
+class FullInvalidation (l2m.PathCache):
+  """
+  Lazy BFS trees, but every link event throws away all of them
+  """
+  def link_up (self, sw1, sw2):
+    self.clear()
+
+  def link_down (self, sw1, sw2):
+    self.clear()
+
+
+def run (engine, links, storm, queries):
+  l2m.adjacency.clear()
+  for a,b in links:
+    l2m.adjacency[a][b] = b.dpid
+    l2m.adjacency[b][a] = a.dpid
+
+  start = time.time()
+  for (a,b,up),q in zip(storm, queries):
+    if up:
+      l2m.adjacency[a][b] = b.dpid
+      l2m.adjacency[b][a] = a.dpid
+      engine.link_up(a, b)
+    else:
+      del l2m.adjacency[a][b]
+      del l2m.adjacency[b][a]
+      engine.link_down(a, b)
+    for src,dst in q:
+      engine.get_raw_path(src, dst)
+  return time.time() - start
+
+
+def main ():
+  parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+  parser.add_argument('--kind', default='random',
+                      choices=['random','ring','tree'])
+  parser.add_argument('--switches', type=int, nargs='+',
+                      default=[50, 100, 200, 400])
+  parser.add_argument('--degree', type=int, default=4)
+  parser.add_argument('--events', type=int, default=200,
+                      help="Link events per storm")
+  parser.add_argument('--queries', type=int, default=20,
+                      help="Path requests after each link event")
+  parser.add_argument('--floyd-max', type=int, default=100,
+                      help="Largest topology to run Floyd-Warshall on")
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args()
+
+  print "%-8s %6s %6s %12s %12s %12s %8s" % ("kind", "sws", "links",
+      "floyd(s)", "full(s)", "incr(s)", "trees")
+  for n in args.switches:
+    rand = random.Random(args.seed)
+    sws,links = make_topology(args.kind, n, args.degree, rand)
+    storm = make_storm(links, args.events, rand)
+    queries = [[rand.sample(sws, 2) for _ in range(args.queries)]
+               for _ in storm]
+
+    if n <= args.floyd_max:
+      fw = "%12.3f" % (run(FloydWarshall(sws), links, storm, queries),)
+    else:
+      fw = "%12s" % ("-",)
+    full = run(FullInvalidation(), links, storm, queries)
+    incr_engine = l2m.PathCache()
+    incr = run(incr_engine, links, storm, queries)
+    print "%-8s %6i %6i %s %12.3f %12.3f %8i" % (args.kind, n, len(links),
+        fw, full, incr, incr_engine.trees_computed)
+
+  l2m.adjacency.clear()
+
+
+if __name__ == '__main__':
+  main()
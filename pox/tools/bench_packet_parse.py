@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark eager and lazy packet parsing per layer
+
+Parses a corpus of frames (read from a pcap file, or generated), and for
+each layer depth reports how many frames per second are parsed when a
+handler looks that deep:
+  l2 - the Ethernet type and addresses (e.g., l2_learning)
+  l3 - the IP/ARP header
+  l4 - the TCP/UDP/ICMP header
+"""
+
+import sys
+import os.path
+import random
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+from pox.lib.packet import *
+from pox.lib.packet.icmp import TYPE_ECHO_REQUEST, echo
+from pox.lib.addresses import EthAddr, IPAddr
+from pox.lib.pxpcap.parser import PCapFileReader
+
+
+def read_pcap (filename):
+  with PCapFileReader(filename) as r:
+    return [str(data) for t,data in r]
+
+
+def make_corpus (count, rand):
+  """
+  A mix of ARP, TCP, UDP and ICMP frames of various sizes
+  """
+  frames = []
+  for i in range(count):
+    src = EthAddr("00:00:00:00:%02x:%02x" % (i >> 8 & 0xff, i & 0xff))
+    dst = EthAddr("00:00:00:00:00:01")
+    srcip = IPAddr("10.0.%i.%i" % (i >> 8 & 0xff, i & 0xff))
+    dstip = IPAddr("10.0.0.1")
+    kind = rand.random()
+    if kind < 0.1:
+      p = arp(opcode = arp.REQUEST, hwsrc = src, protosrc = srcip,
+              protodst = dstip)
+      e = ethernet(src = src, dst = dst, type = ethernet.ARP_TYPE,
+                   payload = p)
+    else:
+      data = "x" * rand.choice((0, 64, 512, 1400))
+      if kind < 0.6:
+        l4 = tcp(srcport = rand.randint(1024, 65535), dstport = 80, off = 5,
+                 payload = data)
+        proto = ipv4.TCP_PROTOCOL
+      elif kind < 0.9:
+        l4 = udp(srcport = rand.randint(1024, 65535), dstport = 53,
+                 payload = data)
+        proto = ipv4.UDP_PROTOCOL
+      else:
+        l4 = icmp(type = TYPE_ECHO_REQUEST, payload = echo(id = i & 0xffff))
+        proto = ipv4.ICMP_PROTOCOL
+      ip = ipv4(srcip = srcip, dstip = dstip, protocol = proto, payload = l4)
+      e = ethernet(src = src, dst = dst, type = ethernet.IP_TYPE,
+                   payload = ip)
+    frames.append(e.pack())
+  return frames
+
+
+def look_l2 (p):
+  return p.type, p.src, p.dst
+
+def look_l3 (p):
+  look_l2(p)
+  return p.next
+
+def look_l4 (p):
+  l3 = look_l3(p)
+  return getattr(l3, 'next', None)
+
+
+def run (frames, lazy, look, repeat):
+  best = None
+  for _ in range(repeat):
+    start = time.time()
+    for raw in frames:
+      look(ethernet(raw, lazy = lazy))
+    elapsed = time.time() - start
+    if best is None or elapsed < best: best = elapsed
+  return len(frames) / best
+
+
+def main ():
+  parser = argparse.ArgumentParser(description = __doc__.split("\n")[1])
+  parser.add_argument('--pcap', help="Read the corpus from a pcap file")
+  parser.add_argument('--frames', type=int, default=20000,
+                      help="Number of frames to generate")
+  parser.add_argument('--repeat', type=int, default=3)
+  parser.add_argument('--seed', type=int, default=1)
+  args = parser.parse_args()
+
+  if args.pcap:
+    frames = read_pcap(args.pcap)
+  else:
+    frames = make_corpus(args.frames, random.Random(args.seed))
+  print "%i frames, %i bytes" % (len(frames), sum(len(f) for f in frames))
+
+  print "%-6s %14s %14s %8s" % ("layer", "eager frames/s", "lazy frames/s",
+                                "speedup")
+  for name,look in (("l2", look_l2), ("l3", look_l3), ("l4", look_l4)):
+    eager = run(frames, False, look, args.repeat)
+    lazy = run(frames, True, look, args.repeat)
+    print "%-6s %14.0f %14.0f %7.2fx" % (name, eager, lazy, lazy / eager)
+
+
+if __name__ == '__main__':
+  main()